@@ -1,35 +1,209 @@
+import hashlib
+from decimal import Decimal, InvalidOperation
+
 from django.contrib import admin
-from django.http import HttpResponse
-from .models import Product, Customer, Order
-from .data_processor import export_data
-import tempfile
-import os
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import path
+from django.utils.dateparse import parse_date
+from django.utils.text import smart_split, unescape_string_literal
+from .models import Product, Customer, Order, DailySales, CustomerValue, ImportJob, ExportJob
+from . import cache, rollups
+from .exporters import export_tables, scoped_querysets
+from .pagination import HighVolumeAdminMixin
+from .jobs import cancel_job, job_status, retry_job
+from .streaming import stream_file, astream_file, stream_xlsx, astream_xlsx
 
-@admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'stock', 'created_at')
-    search_fields = ('name',)
-    list_filter = ('created_at', 'price')
-    search_help_text = "輸入產品名稱進行搜尋"
+# 訂單搜尋時先取出符合的客戶與產品id，超過這個數量時改用子查詢
+SEARCH_ID_LIMIT = 1000
+
+
+class ExcelExportMixin:
+    """提供將選取資料以串流方式匯出為Excel的動作"""
     actions = ['export_to_excel']
-    
+
     def export_to_excel(self, request, queryset):
-        response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        """同一選取範圍在資料未變更時直接傳送快取的檔案，否則邊產生邊傳送並同時存入快取"""
+        querysets = scoped_querysets(queryset)
+        sql, params = queryset.query.sql_with_params()
+        selection = hashlib.sha1(f'{sql}{params!r}'.encode()).hexdigest()[:16]
+        artifact = cache.Artifact(f'admin-{queryset.model._meta.model_name}-{selection}',
+                                  [Product, Customer, Order], '.xlsx')
+        # 在ASGI下使用非同步迭代器，否則Django會先把整個內容讀進記憶體
+        if isinstance(request, ASGIRequest):
+            content = (astream_file(artifact.path) if artifact.exists()
+                       else artifact.atee(astream_xlsx(lambda: export_tables(querysets=querysets))))
+        else:
+            content = (stream_file(artifact.path) if artifact.exists()
+                       else artifact.tee(stream_xlsx(lambda: export_tables(querysets=querysets))))
+        response = StreamingHttpResponse(
+            content,
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
         response['Content-Disposition'] = 'attachment; filename=data_export.xlsx'
-        export_data(response)
         return response
     export_to_excel.short_description = '匯出資料到Excel'
 
+def _matching_ids(queryset):
+    ids = list(queryset.values_list('pk', flat=True)[:SEARCH_ID_LIMIT + 1])
+    return ids if len(ids) <= SEARCH_ID_LIMIT else queryset.values('pk')
+
+def _search_price(bit):
+    """搜尋詞可以是總價時回傳對應的 Decimal，否則回傳 None
+
+    NaN、Infinity、超出欄位位數或小數位數的值不可能相符，傳給資料庫反而會出錯。
+    """
+    field = Order._meta.get_field('total_price')
+    try:
+        value = Decimal(bit)
+    except InvalidOperation:
+        return None
+    # adjusted() 為最高位數的指數，不做運算，極大的指數也不會溢位
+    if not value.is_finite() or value.adjusted() >= field.max_digits - field.decimal_places:
+        return None
+    price = value.quantize(Decimal(1).scaleb(-field.decimal_places))
+    return price if price == value else None
+
+@admin.register(Product)
+class ProductAdmin(HighVolumeAdminMixin, ExcelExportMixin, admin.ModelAdmin):
+    list_display = ('name', 'price', 'stock', 'created_at')
+    search_fields = ('name',)
+    list_filter = ('created_at', 'price')
+    search_help_text = "輸入產品名稱進行搜尋"
+
 @admin.register(Customer)
-class CustomerAdmin(admin.ModelAdmin):
+class CustomerAdmin(HighVolumeAdminMixin, ExcelExportMixin, admin.ModelAdmin):
     list_display = ('name', 'email', 'phone', 'created_at')
     search_fields = ('name', 'email', 'phone', 'address')
     list_filter = ('created_at',)
     search_help_text = "輸入客戶名稱、電子郵件、電話或地址進行搜尋"
 
 @admin.register(Order)
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(HighVolumeAdminMixin, ExcelExportMixin, admin.ModelAdmin):
     list_display = ('customer', 'product', 'quantity', 'total_price', 'order_date', 'status')
+    list_select_related = ('customer', 'product')
     search_fields = ('customer__name', 'product__name', 'status', 'total_price')
     list_filter = ('status', 'order_date')
-    search_help_text = "輸入客戶名稱、產品名稱、狀態或總價進行搜尋"
\ No newline at end of file
+    search_help_text = "輸入客戶名稱、產品名稱、狀態或總價進行搜尋"
+
+    def get_search_results(self, request, queryset, search_term):
+        """客戶與產品名稱在各自的表以三元組索引比對後，再以外鍵索引取出訂單
+
+        避免跨表的 OR 條件讓資料庫掃描整張訂單表。狀態比對代碼與顯示名稱，總價須完全相符。
+        """
+        status_choices = Order._meta.get_field('status').choices
+        for bit in smart_split(search_term):
+            if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+                bit = unescape_string_literal(bit)
+            condition = (Q(customer__in=_matching_ids(Customer.objects.filter(name__icontains=bit)))
+                         | Q(product__in=_matching_ids(Product.objects.filter(name__icontains=bit)))
+                         | Q(status__in=[value for value, label in status_choices
+                                         if bit.lower() in value or bit in label]))
+            price = _search_price(bit)
+            if price is not None:
+                condition |= Q(total_price=price)
+            queryset = queryset.filter(condition)
+        return queryset, False
+
+    # 後台修改或刪除訂單時同步更新彙總表
+    def save_model(self, request, obj, form, change):
+        with transaction.atomic():
+            if change:
+                rollups.remove_orders([obj.pk])
+            super().save_model(request, obj, form, change)
+            rollups.add_orders([obj.pk])
+
+    # 訂單沒有 post_delete 信號（見 signals.py），刪除時自行更換資料版本
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            rollups.remove_orders([obj.pk])
+            super().delete_model(request, obj)
+            cache.bump(Order)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            rollups.remove_orders(list(queryset.values_list('pk', flat=True)))
+            super().delete_queryset(request, queryset)
+            cache.bump(Order)
+
+
+class RollupAdmin(admin.ModelAdmin):
+    """彙總表由導入流程與 rebuild_rollups 命令維護，後台只供檢視"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(DailySales)
+class DailySalesAdmin(RollupAdmin):
+    """報表查詢可取 dashboard/?start=YYYY-MM-DD&end=YYYY-MM-DD&limit=10 的JSON"""
+    list_display = ('date', 'product', 'status', 'order_count', 'quantity', 'revenue')
+    list_filter = ('status', 'date')
+    list_select_related = ('product',)
+    date_hierarchy = 'date'
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path('dashboard/', self.admin_site.admin_view(self.dashboard_view),
+                 name=f'{opts.app_label}_{opts.model_name}_dashboard'),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        try:
+            start = parse_date(request.GET.get('start', '')) if request.GET.get('start') else None
+            end = parse_date(request.GET.get('end', '')) if request.GET.get('end') else None
+            limit = int(request.GET.get('limit', 10))
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+        return JsonResponse(rollups.sales_summary(start, end, limit))
+
+@admin.register(CustomerValue)
+class CustomerValueAdmin(RollupAdmin):
+    list_display = ('customer', 'order_count', 'quantity', 'revenue', 'first_order_at', 'last_order_at')
+    list_select_related = ('customer',)
+    ordering = ('-revenue',)
+    search_fields = ('customer__name', 'customer__email')
+
+
+class JobAdmin(admin.ModelAdmin):
+    """新增工作即排入佇列，由 run_jobs 命令執行；狀態可輪詢 <id>/status/ 取得JSON"""
+    list_display = ('__str__', 'status', 'rows_processed', 'rows_per_second', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status',)
+    readonly_fields = ('status', 'started_at', 'finished_at', 'heartbeat_at', 'worker', 'rows_processed',
+                       'rows_per_second', 'attempts', 'run_after', 'cancel_requested', 'message')
+    actions = ['cancel_jobs', 'retry_jobs']
+
+    def get_urls(self):
+        opts = self.model._meta
+        return [
+            path('<int:object_id>/status/', self.admin_site.admin_view(self.status_view),
+                 name=f'{opts.app_label}_{opts.model_name}_status'),
+        ] + super().get_urls()
+
+    def status_view(self, request, object_id):
+        job = get_object_or_404(self.model, pk=object_id)
+        return JsonResponse(job_status(job))
+
+    def cancel_jobs(self, request, queryset):
+        for job in queryset:
+            cancel_job(job)
+    cancel_jobs.short_description = '取消選取的工作'
+
+    def retry_jobs(self, request, queryset):
+        for job in queryset:
+            retry_job(job)
+    retry_jobs.short_description = '重新執行選取的工作'
+
+@admin.register(ImportJob)
+class ImportJobAdmin(JobAdmin):
+    readonly_fields = JobAdmin.readonly_fields + ('source_path', 'checkpoint')
+
+@admin.register(ExportJob)
+class ExportJobAdmin(JobAdmin):
+    readonly_fields = JobAdmin.readonly_fields + ('file',)
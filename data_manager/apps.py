@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DataManagerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'data_manager'
+
+    def ready(self):
+        from data_manager import signals  # noqa: F401
@@ -0,0 +1,335 @@
+"""一次導入多個檔案
+
+每天各門市送來的活頁簿逐一執行 process_data import 時，每次都要重新啟動、
+重新寫入重複的產品與客戶，並為每個檔案的訂單重新查詢同一批外鍵。批次導入分三步：
+
+  1. 讀取與清理：在 WorkerPool 中並行解析各檔案（openpyxl 解析是主要的耗時，受 GIL 限制，
+     因此使用行程而非執行緒）；這一步不存取資料庫。
+  2. 合併寫入產品與客戶：各檔案的產品與客戶合併後各寫入一次，與依檔案順序逐一導入的結果相同
+     （產品與客戶都以最後出現的為準，名稱、電子郵件與電話沿用第一次出現的寫法）。
+  3. 依檔案順序寫入訂單：每個檔案一個交易，所有檔案共用一個 KeyCache，
+     重複出現的客戶與產品只查詢一次。
+
+某個檔案無法讀取時只略過該檔案；atomic 為 True 時任何錯誤都撤銷整個批次。
+增量導入時，與上次增量導入相同且資料未變更的檔案不讀取，直接略過（見 data_processor.unchanged_sheets）。
+"""
+import glob
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import nullcontext
+
+import django
+import pandas as pd
+from django.db import transaction
+
+from data_manager import cache, profiling
+from data_manager.data_processor import (
+    BATCH_SIZE, IMPORTERS, SHEET_MODELS, KeyCache, OccurrenceCounter, _concat_rejects, _sheet_names, _writer,
+    file_fingerprint, open_source, prepare_customers, prepare_orders, prepare_products, read_sheet,
+    record_imported, source_name, unchanged_sheets, untracked_orders_warning, write_customers, write_orders,
+    write_products, write_rejects,
+)
+from data_manager.readers import TableFiles
+from data_manager.validation import empty_rejects
+
+SHEETS = [sheet for sheet, _, _ in IMPORTERS]
+LABELS = {sheet: label for sheet, _, label in IMPORTERS}
+WRITERS = {'products': write_products, 'customers': write_customers, 'orders': write_orders}
+
+
+class BatchError(Exception):
+    """批次無法繼續，例如產品或客戶寫入失敗，或 atomic 時任何一個檔案失敗"""
+
+
+class FileResult:
+    """批次中一個檔案的結果
+
+    error 為讀取或寫入失敗的原因，成功時為 None；rows 為各工作表讀取的列數，
+    rejects 為各工作表被拒絕的列，orders 為此檔案的訂單 (新增筆數, 更新筆數)。
+    skipped 為 True 時檔案與上次增量導入相同，沒有讀取。
+    產品與客戶合併後才寫入，新增與更新筆數只記錄在整個批次的 totals。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.error = None
+        self.rows = {}
+        self.rejects = {}
+        self.orders = (0, 0)
+        self.skipped = False
+
+    @property
+    def success(self):
+        return self.error is None
+
+    def rejected(self):
+        return sum(len(frame) for frame in self.rejects.values())
+
+
+class WorkerPool:
+    """解析檔案的行程池，可在多次批次之間重複使用，省去每次啟動行程與匯入 Django 的時間
+
+    行程以 spawn 啟動，重新匯入 Django，不會共用父行程的資料庫連線；
+    有行程異常終止（例如記憶體不足被終止）時，下次提交工作前重新建立。
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+
+    def _start(self):
+        context = multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                             initializer=django.setup)
+
+    def submit(self, fn, *args):
+        if self._executor is None:
+            self._start()
+        try:
+            return self._executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._start()
+            return self._executor.submit(fn, *args)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _table_sheets(path):
+    return [sheet for sheet in TableFiles(path).sheetnames if sheet in SHEETS]
+
+def _expand(path):
+    """目錄含有工作表檔案（products.csv 等）時本身就是一個來源，否則展開為其中的活頁簿與這類子目錄"""
+    if not os.path.isdir(path) or _table_sheets(path):
+        return [path]
+    sources = []
+    for name in sorted(os.listdir(path)):
+        child = os.path.join(path, name)
+        if os.path.isdir(child):
+            if _table_sheets(child):
+                sources.append(child)
+        # 略過 Excel 開啟中的鎖定檔 ~$name.xlsx
+        elif name.lower().endswith('.xlsx') and not name.startswith('~$'):
+            sources.append(child)
+    return sources
+
+def expand_sources(paths):
+    """將命令列的路徑、萬用字元與目錄展開為依序導入的來源列表，找不到時拋出 ValueError"""
+    sources = []
+    for path in paths:
+        if glob.has_magic(path):
+            matches = sorted(glob.glob(path))
+            if not matches:
+                raise ValueError(f'沒有符合 {path} 的檔案')
+        elif os.path.exists(path):
+            matches = [path]
+        else:
+            raise ValueError(f'找不到 {path}')
+        for match in matches:
+            for source in _expand(match):
+                if source not in sources:
+                    sources.append(source)
+    if not sources:
+        raise ValueError(f"{', '.join(paths)} 中沒有可導入的檔案")
+    return sources
+
+def _prepare(df, sheet, occurrences):
+    if sheet == 'products':
+        return prepare_products(df)
+    if sheet == 'customers':
+        return prepare_customers(df)
+    return prepare_orders(df, occurrences)
+
+def prepare_file(path, sheets, incremental=False, name=None):
+    """讀取並清理一個檔案的工作表（不存取資料庫），回傳 {工作表名稱: (合格的列, 不合格的列)}
+
+    在工作行程中執行，結果傳回主行程寫入；缺少工作表時拋出 ValueError。
+    name 為計入訂單 source_key 的來源檔名，預設為 path 的檔名。
+    """
+    source = open_source(path, sheet=sheets[0] if len(sheets) == 1 else None)
+    try:
+        missing = [sheet for sheet in sheets if sheet not in _sheet_names(source)]
+        if missing:
+            raise ValueError(f"缺少以下工作表：{', '.join(missing)}")
+        occurrences = OccurrenceCounter(name or source_name(path)) if incremental else None
+        prepared = {}
+        for sheet in sheets:
+            frames = [_prepare(df, sheet, occurrences) for df in read_sheet(source, sheet)]
+            prepared[sheet] = (pd.concat([df for df, _ in frames]), _concat_rejects([bad for _, bad in frames]))
+        return prepared
+    finally:
+        source.close()
+
+def _parse(paths, sheets, workers, incremental, names, pool=None):
+    """依序產生 (路徑, 清理結果或例外)，workers 大於 1 或提供 pool 時在行程池中並行解析"""
+    if pool is None and workers <= 1:
+        for path in paths:
+            try:
+                yield path, prepare_file(path, sheets, incremental, names[path])
+            except Exception as e:
+                yield path, e
+        return
+    with WorkerPool(workers) if pool is None else nullcontext(pool) as pool:
+        futures = [(path, pool.submit(prepare_file, path, sheets, incremental, names[path])) for path in paths]
+        for path, future in futures:
+            try:
+                yield path, future.result()
+            except Exception as e:
+                yield path, e
+
+def _write(sheet, df, batch_size, engine, incremental, **write_options):
+    write = _writer(sheet, WRITERS[sheet], engine, incremental, **write_options)
+    with profiling.stage('write', len(df)) as frame, transaction.atomic():
+        inserted, updated, rejects = write(df, batch_size)
+        if inserted or updated:
+            cache.bump(SHEET_MODELS[sheet])
+        if frame:
+            frame.rows_out = inserted + updated
+    return inserted, updated, rejects
+
+def _by_file(results, sheet):
+    """各檔案被拒絕的列依檔案順序合併，並加上 file 欄位"""
+    frames = [result.rejects[sheet].assign(file=result.path) for result in results
+              if len(result.rejects.get(sheet, ()))]
+    if not frames:
+        return empty_rejects().reindex(columns=['file', 'row', 'reason'])
+    rejects = pd.concat(frames)
+    return rejects[['file', *rejects.columns.drop('file')]]
+
+def import_batch(paths, sheet=None, batch_size=BATCH_SIZE, workers=1, engine='orm', incremental=False,
+                 atomic=False, pool=None, names=None):
+    """導入多個檔案，回傳 (各工作表的合計 {工作表名稱: (新增筆數, 更新筆數, 拒絕的列)}, [FileResult])
+
+    拒絕的列加上 file 欄位記錄來源檔案。atomic 為 True 時任何檔案失敗都撤銷全部變更並拋出 BatchError。
+
+    Args:
+        paths: 依序導入的來源，見 expand_sources
+        sheet: 只導入此工作表
+        workers: 解析檔案的行程數，1 時在目前的行程中依序解析
+        pool: 重複使用的 WorkerPool，提供時忽略 workers
+        names: 各來源的原始檔名，增量導入時用來識別來源（例如收件目錄取走時改名的檔案），預設為路徑的檔名
+    """
+    sheets = [sheet] if sheet else SHEETS
+    results = [FileResult(path) for path in paths]
+    by_path = {result.path: result for result in results}
+    names = dict(zip(paths, names or [source_name(path) for path in paths]))
+    fingerprints = {}
+    prepared = {}
+
+    if incremental:
+        for result in results:
+            try:
+                fingerprints[result.path] = fingerprint = file_fingerprint(result.path)
+            except OSError:
+                # 交給解析時回報錯誤
+                continue
+            result.skipped = unchanged_sheets(names[result.path], fingerprint, sheets) == set(sheets)
+    parse_paths = [result.path for result in results if not result.skipped]
+
+    with profiling.stage('parse') as frame:
+        for path, outcome in _parse(parse_paths, sheets, min(workers, len(parse_paths)), incremental, names, pool):
+            if isinstance(outcome, Exception):
+                result = by_path[path]
+                result.error = str(outcome) if isinstance(outcome, ValueError) else f'{type(outcome).__name__}: {outcome}'
+                if atomic:
+                    raise BatchError(f'{path} 無法讀取: {result.error}')
+                continue
+            prepared[path] = outcome
+            for name, (df, rejects) in outcome.items():
+                by_path[path].rows[name] = len(df) + len(rejects)
+                by_path[path].rejects[name] = rejects
+        if frame:
+            frame.rows_in = sum(sum(result.rows.values()) for result in results)
+            frame.rows_out = frame.rows_in - sum(result.rejected() for result in results)
+
+    totals = {}
+    with transaction.atomic() if atomic else nullcontext():
+        # 產品與客戶合併後各寫入一次，失敗時整個批次無法繼續
+        for name in sheets:
+            if name == 'orders':
+                continue
+            frames = [prepared[path][name][0] for path in paths if path in prepared]
+            if not frames:
+                totals[name] = (0, 0)
+                continue
+            with profiling.stage(name, sum(map(len, frames))) as frame:
+                try:
+                    # 依檔案順序合併，寫入函數以最後一筆為準，與逐一寫入各檔案的結果相同
+                    merged = pd.concat(frames, ignore_index=True)
+                    inserted, updated, _ = _write(name, merged, batch_size, engine, incremental)
+                except Exception as e:
+                    raise BatchError(f'{LABELS[name]}數據導入失敗: {e}') from e
+                if frame:
+                    frame.rows_out = inserted + updated
+            totals[name] = (inserted, updated)
+
+        if 'orders' in sheets:
+            key_cache = KeyCache(batch_size)
+            inserted = updated = 0
+            with profiling.stage('orders') as frame:
+                for result in results:
+                    if result.path not in prepared:
+                        continue
+                    # 寫入後即釋放該檔案的訂單，主行程不必同時保留所有檔案的訂單
+                    df, invalid = prepared[result.path].pop('orders')
+                    try:
+                        file_inserted, file_updated, rejects = _write('orders', df, batch_size, engine,
+                                                                      incremental, key_cache=key_cache)
+                    except Exception as e:
+                        result.error = f'訂單數據導入失敗: {e}'
+                        if atomic:
+                            raise BatchError(f'{result.path} {result.error}') from e
+                        continue
+                    result.orders = (file_inserted, file_updated)
+                    result.rejects['orders'] = _concat_rejects([invalid, rejects])
+                    inserted += file_inserted
+                    updated += file_updated
+                    if frame:
+                        frame.rows_in += len(df)
+                if frame:
+                    frame.rows_out = inserted + updated
+            totals['orders'] = (inserted, updated)
+
+    for result in results:
+        if incremental and result.path in prepared and result.success:
+            record_imported(names[result.path], fingerprints[result.path], sheets)
+    return {name: (*totals[name], _by_file(results, name)) for name in sheets}, results
+
+def process_batch(paths, sheet=None, batch_size=BATCH_SIZE, rejects_file=None, workers=1, engine='orm',
+                  incremental=False, atomic=False):
+    """批次導入多個檔案，回傳 (是否成功, 訊息)；有檔案失敗時仍導入其餘檔案，但回傳失敗"""
+    warning = untracked_orders_warning() if incremental and sheet in (None, 'orders') else None
+    try:
+        totals, results = import_batch(paths, sheet, batch_size, workers, engine, incremental, atomic)
+    except BatchError as e:
+        if atomic:
+            return False, f'{e}，已撤銷本次導入的全部變更'
+        return False, str(e)
+    except Exception as e:
+        return False, f'數據處理失敗: {str(e)}'
+
+    failed = [result for result in results if not result.success]
+    messages = [warning] if warning else []
+    skipped = sum(result.skipped for result in results)
+    messages.append(f'共 {len(results)} 個檔案，成功 {len(results) - len(failed)} 個'
+                    + (f'（{skipped} 個未變更，略過導入）' if skipped else ''))
+    for name, (inserted, updated, rejects) in totals.items():
+        messages.append(f"{LABELS[name]}數據導入成功（新增 {inserted} 筆，更新 {updated} 筆，拒絕 {len(rejects)} 筆）")
+    for result in failed:
+        messages.append(f'{result.path} 導入失敗: {result.error}')
+    if rejects_file:
+        with profiling.stage('rejects', sum(len(rejects) for _, _, rejects in totals.values())):
+            write_rejects({name: rejects for name, (_, _, rejects) in totals.items()}, rejects_file)
+        messages.append(f"拒絕的資料已寫入 {rejects_file}")
+    return not failed, '\n'.join(messages)
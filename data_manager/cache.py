@@ -0,0 +1,188 @@
+"""以資料版本為鍵的快取
+
+每張表在 DataVersion 中有一個版本值，導入、後台儲存或刪除、清除數據時換成新的隨機值。
+快取項目的鍵包含其依賴的各表版本，表的內容變更後鍵隨之改變，只有依賴該表的項目失效，
+不需要逐一刪除。版本存在資料庫中，命令列導入也會讓網站行程中的快取失效；
+版本是隨機值而不是計數，重建或換用其他資料庫後不會誤用先前的快取。
+
+聚合查詢的結果存放在 DATA_CACHE 設定的快取（預設為 default），
+導出的檔案存放在 DATA_CACHE_DIR 目錄下的 exports/，同一項目只保留最新版本的檔案。
+"""
+import hashlib
+import os
+import secrets
+import shutil
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import connection
+
+from data_manager.models import DataVersion
+
+# 導出檔案的預設保留秒數，超過時在下次存入快取時刪除
+ARTIFACT_MAX_AGE = 7 * 24 * 3600
+
+_MISSING = object()
+
+
+def _label(model):
+    return model._meta.label_lower
+
+def _new_version():
+    return secrets.randbits(63)
+
+def bump(*models):
+    """更換各表的版本，依賴這些表的快取項目隨之失效
+
+    在寫入的交易中呼叫時，新版本與資料一起提交，交易撤銷時版本也不變。
+    """
+    labels = sorted({_label(model) for model in models})
+    if not labels:
+        return
+    quote = connection.ops.quote_name
+    sql = (f'INSERT INTO {quote(DataVersion._meta.db_table)} (name, version) VALUES (%s, %s) '
+           f'ON CONFLICT (name) DO UPDATE SET version = EXCLUDED.version')
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(label, _new_version()) for label in labels])
+
+def versions(*models):
+    """各表目前的版本 {表名: 版本}，尚未記錄版本的表在此建立"""
+    labels = sorted({_label(model) for model in models})
+    found = dict(DataVersion.objects.filter(name__in=labels).values_list('name', 'version'))
+    missing = [label for label in labels if label not in found]
+    if missing:
+        DataVersion.objects.bulk_create([DataVersion(name=label, version=_new_version()) for label in missing],
+                                        ignore_conflicts=True)
+        found.update(DataVersion.objects.filter(name__in=missing).values_list('name', 'version'))
+    return found
+
+def version_key(*models):
+    """依賴的各表版本組成的短鍵，任一表變更時改變"""
+    return hashlib.sha1(repr(sorted(versions(*models).items())).encode()).hexdigest()[:16]
+
+def _cache():
+    return caches[getattr(settings, 'DATA_CACHE', 'default')]
+
+def cached(name, models, compute, timeout=DEFAULT_TIMEOUT):
+    """取得快取的計算結果，沒有或依賴的表已變更時呼叫 compute() 並存入
+
+    Args:
+        name: 項目名稱，需包含影響結果的參數，例如 sales_summary:2024-01-01:2024-01-31:10
+        models: 結果依賴的模型
+        compute: 計算結果的函數，結果需可 pickle
+        timeout: 快取秒數，預設使用快取設定的 TIMEOUT
+    """
+    key = f'{name}:{version_key(*models)}'
+    store = _cache()
+    value = store.get(key, _MISSING)
+    if value is _MISSING:
+        value = compute()
+        store.set(key, value, timeout)
+    return value
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+class Artifact:
+    """以資料版本為鍵的導出檔案（或每表一個檔案的目錄）
+
+    鍵在建立時依目前的版本決定。產生內容期間如有其他寫入提交，版本已經改變，
+    這份檔案不會再被取用，因此不會拿到與鍵不符的內容。
+
+    Args:
+        name: 項目名稱，例如 export-xlsx
+        models: 內容依賴的模型
+        suffix: 檔名後綴，例如 .xlsx；目錄格式留空
+    """
+
+    def __init__(self, name, models, suffix=''):
+        self.name = name
+        self.directory = os.path.join(getattr(settings, 'DATA_CACHE_DIR', settings.BASE_DIR / 'cache'), 'exports')
+        self.path = os.path.join(self.directory, f'{name}.{version_key(*models)}{suffix}')
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def _temp_path(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f'.{secrets.token_hex(8)}-{os.path.basename(self.path)}')
+
+    def _commit(self, temp):
+        """將完成的暫存檔放到快取位置，刪除同一項目其他版本的檔案與過久未更新的檔案"""
+        if os.path.isdir(temp) and os.path.isdir(self.path):
+            # 其他行程已產生相同版本的目錄
+            _remove(temp)
+        else:
+            os.replace(temp, self.path)
+        current = os.path.basename(self.path)
+        expires = time.time() - getattr(settings, 'DATA_CACHE_MAX_AGE', ARTIFACT_MAX_AGE)
+        for entry in os.listdir(self.directory):
+            path = os.path.join(self.directory, entry)
+            try:
+                if entry != current and (entry.startswith(f'{self.name}.') or os.path.getmtime(path) < expires):
+                    _remove(path)
+            except FileNotFoundError:
+                # 其他行程同時清理
+                pass
+
+    def build(self, write):
+        """呼叫 write(暫存路徑) 產生內容後放到快取位置，回傳快取路徑；失敗時刪除暫存檔"""
+        temp = self._temp_path()
+        try:
+            write(temp)
+        except BaseException:
+            _remove(temp)
+            raise
+        self._commit(temp)
+        return self.path
+
+    def copy_to(self, output):
+        """將快取的內容複製到檔案路徑、目錄或可寫入的檔案物件（如HttpResponse）"""
+        if os.path.isdir(self.path):
+            shutil.copytree(self.path, output, dirs_exist_ok=True)
+        elif hasattr(output, 'write'):
+            with open(self.path, 'rb') as file:
+                shutil.copyfileobj(file, output)
+        else:
+            shutil.copyfile(self.path, output)
+
+    def tee(self, chunks):
+        """傳遞串流內容的同時寫入暫存檔，完整傳送後才放到快取位置，中斷時丟棄"""
+        temp = self._temp_path()
+        completed = False
+        try:
+            with open(temp, 'wb') as file:
+                for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+            if completed:
+                self._commit(temp)
+            else:
+                _remove(temp)
+
+    async def atee(self, chunks):
+        """tee 的非同步版本"""
+        temp = self._temp_path()
+        completed = False
+        try:
+            with open(temp, 'wb') as file:
+                async for chunk in chunks:
+                    file.write(chunk)
+                    yield chunk
+            completed = True
+        finally:
+            await chunks.aclose()
+            if completed:
+                self._commit(temp)
+            else:
+                _remove(temp)
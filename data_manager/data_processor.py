@@ -1,11 +1,35 @@
+import contextvars
+import hashlib
+import os
+import threading
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from functools import partial
 from django.core.management.base import BaseCommand
-from decimal import Decimal
+from django.db import connection, connections, transaction
 from datetime import datetime
-from data_manager.models import Product, Customer, Order
+from data_manager.models import Product, Customer, Order, ImportedFile
+from data_manager import cache, normalize, profiling, rollups, schema
+from data_manager.readers import TableFiles, continuation_sheets, is_table_source, open_workbook, iter_sheet_chunks
+from data_manager.exporters import EXPORT_CHUNK_SIZE, EXPORT_MODELS, export_format, export_tables, write_export
+from data_manager.validation import empty_rejects, validate
+
+# 每批寫入或查詢的筆數
+BATCH_SIZE = 1000
+
+# 導入過程中加上的欄位，不會出現在拒絕報告中
+INTERNAL_COLUMNS = ['content_hash', 'source_key', 'name_key', 'email_key', 'phone_key',
+                    'customer_email_key', 'customer_phone_key', 'product_name_key']
+
+# 各工作表寫入的模型，寫入後更換其資料版本讓相關快取失效
+SHEET_MODELS = {'products': Product, 'customers': Customer, 'orders': Order}
+
+# SQLite 同一時間只允許一個寫入者，並行導入時各執行緒的寫入階段依序進行
+_sqlite_write_lock = threading.Lock()
 
 def clean_data(df, model_type):
-    """清理和驗證數據"""
+    """清理數據，逐欄位的驗證由 validation.validate 負責"""
     # 刪除空行
     df = df.dropna(how='all')
     # 數據去重
@@ -16,7 +40,9 @@ def clean_data(df, model_type):
             df['order_date'] = pd.to_datetime(df['order_date'], errors='coerce')
         else:
             df['order_date'] = datetime.now()
-    # 填充缺失值
+    # 填充缺失值，類別欄位須先加入填充的值
+    if 'status' in df.columns and schema.is_category(df['status']) and 'pending' not in df['status'].cat.categories:
+        df['status'] = df['status'].cat.add_categories('pending')
     df = df.fillna({'status': 'pending'})
     return df
 
@@ -30,153 +56,729 @@ def format_data(df, model_type):
         df['total_price'] = pd.to_numeric(df['total_price'], errors='coerce')
     return df
 
-def import_products(file_path):
-    """導入產品數據"""
-    df = pd.read_excel(file_path, sheet_name='products')
+def _chunked(items, size):
+    """將序列切成固定大小的批次"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def _text_column(series):
+    """將欄位轉為去除空白的字串，整數型的浮點數（如電話號碼）不保留 .0；類別欄位只處理各類別"""
+    if schema.is_category(series):
+        return schema.map_categories(series, _text_column)
+    return schema.text(series).str.strip()
+
+def _keys(series, keys):
+    """以 normalize 的函數計算比對鍵，類別欄位只計算各類別"""
+    if schema.is_category(series):
+        return schema.map_categories(series, keys)
+    return keys(series)
+
+def _records(df, columns):
+    """將DataFrame轉為字典列表，缺失值轉為None"""
+    df = df[columns].astype(object)
+    return df.where(df.notna(), None).to_dict('records')
+
+def _existing_rows(model, unique_fields, keys, fields, batch_size=BATCH_SIZE):
+    """以分批的 __in 查詢一次取回已存在的唯一鍵，回傳 {鍵: (fields 的值...)}"""
+    wanted = set(keys)
+    lead_values = list({key[0] for key in wanted})
+    existing = {}
+    size = len(unique_fields)
+    for chunk in _chunked(lead_values, batch_size):
+        rows = (model.objects
+                .filter(**{f'{unique_fields[0]}__in': chunk})
+                .values_list(*unique_fields, *fields))
+        for row in rows:
+            key = tuple(row[:size])
+            if key in wanted:
+                existing[key] = row[size:]
+    return existing
+
+def _existing_ids(model, unique_fields, keys, batch_size=BATCH_SIZE):
+    """以分批的 __in 查詢一次取回已存在的唯一鍵，回傳 {鍵: id}"""
+    existing = _existing_rows(model, unique_fields, keys, ['id'], batch_size)
+    return {key: values[0] for key, values in existing.items()}
+
+def _lookup(df, columns, mapping):
+    """以 {鍵tuple: 整數值} 向量化對應DataFrame的鍵欄位，找不到時為缺失值"""
+    if not mapping:
+        return pd.array([pd.NA] * len(df), dtype='Int64')
+    index = pd.MultiIndex.from_tuples(list(mapping), names=columns)
+    values = pd.Series(list(mapping.values()), index=index, dtype='Int64')
+    return values.reindex(pd.MultiIndex.from_frame(df[columns])).array
+
+def _content_hash(df, text=(), numbers=()):
+    """以列內容計算穩定的64位元雜湊（向量化），用於增量導入比對
+
+    數值欄位一律以浮點數、文字欄位一律以字串計算，
+    不同批次推斷出的型別不同時雜湊仍然一致。
+    """
+    normalized = pd.DataFrame(
+        {**{column: df[column].astype('string') for column in text},
+         **{column: df[column].astype(float) for column in numbers}},
+        index=df.index)
+    hashes = pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+    return pd.Series(hashes.view('int64'), index=df.index)
+
+def _unchanged(df, model, columns, unique_fields, batch_size=BATCH_SIZE):
+    """增量導入時，內容雜湊與資料庫相同的列的遮罩"""
+    keys = list(df[columns].drop_duplicates().itertuples(index=False, name=None))
+    stored = _existing_rows(model, unique_fields, keys, ['content_hash'], batch_size)
+    stored = {key: values[0] for key, values in stored.items() if values[0] is not None}
+    return (_lookup(df, columns, stored) == df['content_hash'].array).fillna(False).to_numpy(dtype=bool)
+
+class OccurrenceCounter:
+    """跨批次為識別相同的列編號（第幾次出現），讓內容相同的多筆訂單各有來源識別
+
+    source 為來源檔案的名稱（見 source_name），一併計入識別：
+    不同檔案中同一客戶與產品的訂單是不同的訂單，重送同名的檔案才會對應到已導入的訂單。
+    """
+
+    def __init__(self, source=''):
+        self.source = source
+        self.counts = pd.Series(dtype='int64', index=pd.Index([], dtype='int64'))
+
+    def number(self, identity):
+        offset = identity.map(self.counts).fillna(0).astype('int64')
+        numbers = identity.groupby(identity).cumcount() + offset
+        self.counts = self.counts.add(identity.value_counts(), fill_value=0).astype('int64')
+        return numbers
+
+def bulk_upsert(model, records, unique_fields, update_fields, batch_size=BATCH_SIZE):
+    """批次新增或更新資料，回傳 (新增筆數, 更新筆數)
+
+    records 內的唯一鍵必須已去重，否則同一批次會重複更新同一行。
+    """
+    if not records:
+        return 0, 0
+    keys = [tuple(record[field] for field in unique_fields) for record in records]
+    existing = _existing_ids(model, unique_fields, keys, batch_size)
+    with transaction.atomic():
+        model.objects.bulk_create(
+            [model(**record) for record in records],
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=unique_fields,
+            update_fields=update_fields,
+        )
+    updated = len(existing)
+    return len(records) - updated, updated
+
+def read_sheet(source, sheet_name, chunk_size=None):
+    """讀取工作表，回傳可迭代的DataFrame批次，各欄位轉為 schema 指定的型別
+
+    Args:
+        source: 檔案路徑、pd.ExcelFile、open_workbook() 開啟的唯讀活頁簿、
+            TableFiles（CSV/NDJSON/Parquet/Arrow），或記憶體中的 {工作表名稱: DataFrame}
+        chunk_size: 指定時以固定大小的批次串流讀取（Excel 須為唯讀活頁簿），
+            否則整張工作表讀成單一DataFrame
+    """
+    if isinstance(source, dict):
+        df = schema.apply(source[sheet_name].reset_index(drop=True), sheet_name)
+        return _chunked(df, chunk_size) if chunk_size else [df]
+    if isinstance(source, TableFiles):
+        # CSV 在解析時就建立指定型別的欄位，其他格式讀入後轉換
+        chunks = source.iter_chunks(sheet_name, chunk_size, dtype=schema.read_dtypes(sheet_name))
+    else:
+        # 超過Excel列數上限的表接續在後續工作表中，索引延續第一張，拒絕的列號以第一張起算
+        available = getattr(source, 'sheetnames', None) or getattr(source, 'sheet_names', ())
+        names = [sheet_name, *continuation_sheets(available, sheet_name)]
+        if chunk_size:
+            chunks = _excel_chunks(source, names, chunk_size)
+        elif len(names) > 1:
+            chunks = [pd.concat(pd.read_excel(source, sheet_name=names).values(), ignore_index=True)]
+        else:
+            chunks = [pd.read_excel(source, sheet_name=sheet_name)]
+    return (schema.apply(df, sheet_name) for df in chunks)
+
+def _excel_chunks(workbook, names, chunk_size):
+    start = 0
+    for name in names:
+        for df in iter_sheet_chunks(workbook, name, chunk_size, start):
+            start += len(df)
+            yield df
+
+def _rejects(df, mask, reason):
+    """取出不合格的列並標上原因，df 為清理後的列，金額還原為元"""
+    rejected = schema.unscale_money(df[mask].drop(columns=INTERNAL_COLUMNS, errors='ignore'))
+    rejected.insert(0, 'reason', reason)
+    rejected.insert(0, 'row', rejected.index + 2)
+    return rejected
+
+def _concat_rejects(frames):
+    frames = [frame for frame in frames if len(frame)]
+    return pd.concat(frames).sort_index() if frames else empty_rejects()
+
+def _last_per_key(df, keys, identity):
+    """比對鍵相同的列以最後一筆為準，識別欄位（名稱、電子郵件、電話）的原始寫法沿用第一筆
+
+    結果與依 chunk_size 分批寫入相同：較晚的批次覆寫較早的批次，
+    但衝突時不會更新識別欄位，保留的是第一次寫入的寫法。
+    """
+    if not df.duplicated(subset=keys).any():
+        return df
+    first = df.groupby(keys, sort=False, dropna=False)[identity].transform('first')
+    return df.assign(**{column: first[column] for column in identity}).drop_duplicates(subset=keys, keep='last')
+
+def prepare_products(df):
+    """清理、驗證並格式化產品數據（不存取資料庫），回傳 (合格的列, 不合格的列)"""
     df = clean_data(df, 'product')
+    df['name'] = _text_column(df['name'])
+    df, rejects = validate(df, 'products')
     df = format_data(df, 'product')
-    # 對產品數據進行去重處理
-    df = df.drop_duplicates(subset=['name'])
-    
-    for _, row in df.iterrows():
-        # 使用filter().first()替代get()來避免重複產品的問題
-        existing_product = Product.objects.filter(name=row['name']).first()
-        if existing_product:
-            # 更新現有產品的資訊
-            existing_product.price = Decimal(str(row['price']))
-            existing_product.stock = int(row['stock'])
-            existing_product.save()
-        else:
-            # 創建新產品
-            Product.objects.create(
-                name=row['name'],
-                price=Decimal(str(row['price'])),
-                stock=int(row['stock'])
-            )
-
-def import_customers(file_path):
-    """導入客戶數據"""
-    df = pd.read_excel(file_path, sheet_name='customers')
+    df['name_key'] = _keys(df['name'], normalize.name_keys)
+    df['content_hash'] = _content_hash(df, text=['name'], numbers=['price', 'stock'])
+    df = schema.scale_money(df, 'products')
+    return df, rejects
+
+def write_products(df, batch_size=BATCH_SIZE, incremental=False):
+    """將已清理的產品數據寫入資料庫，回傳 (新增筆數, 更新筆數, 拒絕的列)
+
+    以正規化的名稱比對已存在的產品，incremental 為 True 時略過內容雜湊與資料庫相同的產品。
+    同一產品出現多次時價格與庫存以最後一筆為準，與是否分批讀取無關（見 _last_per_key）。
+    """
+    df = _last_per_key(df, ['name_key'], ['name'])
+    if incremental:
+        df = df[~_unchanged(df, Product, ['name_key'], ['name_key'], batch_size)]
+    records = _records(df, ['name', 'name_key', 'stock', 'content_hash'])
+    for record, price in zip(records, schema.decimals(df['price'], schema.MONEY_COLUMNS['products']['price'])):
+        record['price'] = price
+        record['stock'] = int(record['stock'])
+    inserted, updated = bulk_upsert(Product, records, ['name_key'], ['price', 'stock', 'content_hash'], batch_size)
+    return inserted, updated, empty_rejects()
+
+def load_products(df, batch_size=BATCH_SIZE):
+    """清理產品數據並寫入資料庫，回傳 (新增筆數, 更新筆數, 拒絕的列)"""
+    df, invalid = prepare_products(df)
+    inserted, updated, rejects = write_products(df, batch_size)
+    return inserted, updated, _concat_rejects([invalid, rejects])
+
+def _write_lock():
+    if connection.vendor == 'sqlite':
+        return _sqlite_write_lock
+    return nullcontext()
+
+def _writer(sheet_name, write, engine, incremental=False, **write_options):
+    """選擇寫入方式；copy 只在 PostgreSQL 上使用，其他資料庫退回ORM批次寫入"""
+    if engine == 'copy':
+        from data_manager import loaders
+        if loaders.copy_supported():
+            write = loaders.COPY_WRITERS[sheet_name]
+    if incremental:
+        write_options['incremental'] = True
+    if write_options:
+        return partial(write, **write_options)
+    return write
+
+def _import_sheet(source, sheet_name, prepare, write, batch_size, chunk_size,
+                  skip_rows=0, on_chunk=None, wait=None, engine='orm', incremental=False, **write_options):
+    """逐批讀取、清理並寫入工作表，回傳 (新增筆數, 更新筆數, 拒絕的列)
+
+    Args:
+        prepare: 清理與驗證數據的函數，在交易外執行，回傳 (合格的列, 不合格的列)
+        write: 寫入資料庫的函數，每批在一個交易中執行，回傳 (新增筆數, 更新筆數, 拒絕的列)
+        skip_rows: 略過前幾列資料（已在先前的執行中提交）
+        on_chunk: 每批寫入後呼叫 on_chunk(sheet_name, 已讀取列數, 本批列數)，
+            與該批資料在同一個交易中，可用來記錄進度檢查點；拋出例外會撤銷該批
+        wait: 第一次寫入前呼叫，用於等待父表導入完成，讀取與清理不受影響
+        engine: 'orm' 使用 bulk_create 批次寫入，'copy' 在 PostgreSQL 上以 COPY 暫存後合併
+        incremental: 只寫入內容雜湊與資料庫不同的列，重複導入同一檔案不會重複新增
+        write_options: 其他傳給寫入函數的參數，例如訂單的 import_job
+    """
+    write = _writer(sheet_name, write, engine, incremental, **write_options)
+    with profiling.stage(sheet_name) as scope:
+        inserted = updated = 0
+        rejects = []
+        for df in profiling.timed_iter('parse', read_sheet(source, sheet_name, chunk_size)):
+            if df.empty:
+                # 只有標題列的工作表
+                continue
+            rows_read = int(df.index[-1]) + 1
+            rows = int((df.index >= skip_rows).sum())
+            # 略過的列（包括整批都已提交的批次）仍需經過清理，
+            # 增量導入時訂單的出現次序才會與先前的執行一致，不會沿用已提交訂單的 source_key
+            with profiling.stage('clean', len(df)) as frame:
+                df, invalid = prepare(df)
+                if frame:
+                    frame.rows_out = len(df)
+            if rows_read <= skip_rows:
+                continue
+            if skip_rows:
+                df = df[df.index >= skip_rows]
+                invalid = invalid[invalid.index >= skip_rows]
+            rejects.append(invalid)
+            if wait:
+                wait()
+                wait = None
+            with _write_lock(), profiling.stage('write', len(df)) as frame, transaction.atomic():
+                chunk_inserted, chunk_updated, chunk_rejects = write(df, batch_size)
+                if chunk_inserted or chunk_updated:
+                    cache.bump(SHEET_MODELS[sheet_name])
+                if on_chunk:
+                    on_chunk(sheet_name, rows_read, rows)
+                if frame:
+                    frame.rows_out = chunk_inserted + chunk_updated
+            inserted += chunk_inserted
+            updated += chunk_updated
+            rejects.append(chunk_rejects)
+            if scope:
+                scope.rows_in += rows
+        if scope:
+            scope.rows_out = inserted + updated
+    return inserted, updated, _concat_rejects(rejects)
+
+def import_products(source, batch_size=BATCH_SIZE, chunk_size=None, skip_rows=0, on_chunk=None,
+                    wait=None, engine='orm', incremental=False):
+    """導入產品數據，回傳 (新增筆數, 更新筆數, 拒絕的列)"""
+    return _import_sheet(source, 'products', prepare_products, write_products, batch_size, chunk_size,
+                         skip_rows, on_chunk, wait, engine, incremental)
+
+def prepare_customers(df):
+    """清理、驗證並格式化客戶數據（不存取資料庫），回傳 (合格的列, 不合格的列)"""
     df = clean_data(df, 'customer')
-    df = df.drop_duplicates(subset=['email', 'phone'])
-    
-    for _, row in df.iterrows():
-        customer, created = Customer.objects.get_or_create(
-            email=row['email'],
-            phone=row['phone'],
-            defaults={
-                'name': row['name'],
-                'address': row['address']
-            }
-        )
+    df['email'] = _text_column(df['email'])
+    df['phone'] = _text_column(df['phone'])
+    df, rejects = validate(df, 'customers')
+    df['email_key'] = normalize.email_keys(df['email'])
+    df['phone_key'] = normalize.phone_keys(df['phone'])
+    df['content_hash'] = _content_hash(df, text=['name', 'email', 'phone', 'address'])
+    return df, rejects
+
+def write_customers(df, batch_size=BATCH_SIZE, incremental=False):
+    """將已清理的客戶數據寫入資料庫，回傳 (新增筆數, 更新筆數, 拒絕的列)
+
+    以正規化的電子郵件與電話比對已存在的客戶，incremental 為 True 時略過內容雜湊與資料庫相同的客戶。
+    同一客戶出現多次時姓名與地址以最後一筆為準，與是否分批讀取無關（見 _last_per_key）。
+    """
+    keys = ['email_key', 'phone_key']
+    df = _last_per_key(df, keys, ['email', 'phone'])
+    if incremental:
+        df = df[~_unchanged(df, Customer, keys, keys, batch_size)]
+    records = _records(df, ['name', 'email', 'phone', 'address', *keys, 'content_hash'])
+    inserted, updated = bulk_upsert(Customer, records, keys, ['name', 'address', 'content_hash'], batch_size)
+    return inserted, updated, empty_rejects()
+
+def load_customers(df, batch_size=BATCH_SIZE):
+    """清理客戶數據並寫入資料庫，回傳 (新增筆數, 更新筆數, 拒絕的列)"""
+    df, invalid = prepare_customers(df)
+    inserted, updated, rejects = write_customers(df, batch_size)
+    return inserted, updated, _concat_rejects([invalid, rejects])
+
+def import_customers(source, batch_size=BATCH_SIZE, chunk_size=None, skip_rows=0, on_chunk=None,
+                     wait=None, engine='orm', incremental=False):
+    """導入客戶數據，回傳 (新增筆數, 更新筆數, 拒絕的列)"""
+    return _import_sheet(source, 'customers', prepare_customers, write_customers, batch_size, chunk_size,
+                         skip_rows, on_chunk, wait, engine, incremental)
+
+class KeyCache:
+    """訂單的客戶與產品比對鍵到id的對應，已找到的鍵不再查詢資料庫
+
+    單次導入時每批訂單各用一個；批次導入多個檔案時所有檔案共用一個，
+    各檔案重複出現的客戶與產品只查詢一次。找不到的鍵不會記住，下次仍會查詢。
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.customers = {}
+        self.products = {}
+
+    def _ids(self, ids, model, fields, keys):
+        """回傳 keys 中找得到的 {鍵: id}，只查詢尚未找到的鍵"""
+        missing = [key for key in keys if key not in ids]
+        if missing:
+            ids.update(_existing_ids(model, fields, missing, self.batch_size))
+        return {key: ids[key] for key in keys if key in ids}
 
-def import_orders(file_path):
-    """導入訂單數據"""
-    df = pd.read_excel(file_path, sheet_name='orders')
+    def resolve(self, df):
+        customer_keys = df[['customer_email_key', 'customer_phone_key']].dropna().drop_duplicates()
+        customer_ids = self._ids(self.customers, Customer, ['email_key', 'phone_key'],
+                                 list(customer_keys.itertuples(index=False, name=None)))
+        product_ids = self._ids(self.products, Product, ['name_key'],
+                                [(name,) for name in df['product_name_key'].dropna().unique()])
+        df['customer_id'] = _lookup(df, ['customer_email_key', 'customer_phone_key'], customer_ids)
+        df['product_id'] = _lookup(df, ['product_name_key'], product_ids)
+        return df
+
+def resolve_order_keys(df, batch_size=BATCH_SIZE, key_cache=None):
+    """將訂單的客戶與產品鍵對應為外鍵id
+
+    以正規化的比對鍵對應，只查詢工作表中出現過的鍵，各查一次（分批 __in，走唯一約束的索引），
+    再以字典向量化對應。找不到的鍵對應結果為缺失值。key_cache 為跨批次共用的 KeyCache。
+    """
+    return (key_cache or KeyCache(batch_size)).resolve(df)
+
+def prepare_orders(df, occurrences=None):
+    """清理、驗證並格式化訂單數據（不存取資料庫），回傳 (合格的列, 不合格的列)
+
+    提供 occurrences（OccurrenceCounter）時為每列計算 source_key：
+    來源檔名、客戶、產品（與來源中的訂單日期）的雜湊加上同識別的出現次序，供增量導入比對。
+    """
+    identity = ['customer_email', 'customer_phone', 'product_name']
+    if 'order_date' in df.columns:
+        identity.append('order_date')
     df = clean_data(df, 'order')
+    df['customer_email'] = _text_column(df['customer_email'])
+    df['customer_phone'] = _text_column(df['customer_phone'])
+    df['product_name'] = _text_column(df['product_name'])
+    df, rejects = validate(df, 'orders')
     df = format_data(df, 'order')
-    
-    for _, row in df.iterrows():
-        # 使用email和phone作為唯一標識符查詢客戶
-        customer = Customer.objects.get(email=row['customer_email'], phone=row['customer_phone'])
-        product = Product.objects.get(name=row['product_name'])
-        
-        Order.objects.create(
-            customer=customer,
-            product=product,
-            quantity=int(row['quantity']),
-            total_price=Decimal(str(row['total_price'])),
-            status=row['status']
-        )
+    # 同一客戶在訂單中重複出現，比對鍵以類別欄位存放，每個不同的值只正規化一次
+    df['customer_email_key'] = _keys(df['customer_email'].astype('category'), normalize.email_keys)
+    df['customer_phone_key'] = _keys(df['customer_phone'].astype('category'), normalize.phone_keys)
+    df['product_name_key'] = _keys(df['product_name'], normalize.name_keys)
+    df['content_hash'] = _content_hash(df, text=['status'], numbers=['quantity', 'total_price'])
+    if occurrences is not None:
+        identity_hash = _content_hash(df.assign(source_file=occurrences.source), text=[*identity, 'source_file'])
+        df['source_key'] = (identity_hash.astype('string') + ':'
+                            + occurrences.number(identity_hash).astype('string'))
+    df = schema.scale_money(df, 'orders')
+    return df, rejects
+
+def write_orders(df, batch_size=BATCH_SIZE, incremental=False, import_job=None, key_cache=None):
+    """對應外鍵後將已清理的訂單數據寫入資料庫，回傳 (新增筆數, 更新筆數, 拒絕的列)
+
+    找不到客戶或產品的列不會中斷導入，而是連同原因收集在回傳的DataFrame中，
+    row 欄位為Excel中的列號。incremental 為 True 時以 source_key 比對已導入的訂單：
+    內容未變更的略過，變更的就地更新，不會重複新增。寫入的訂單同時累加到彙總表。
+    新增的訂單以 import_job 記錄來源的導入工作，key_cache 為跨檔案共用的 KeyCache。
+    """
+    if incremental:
+        existing = _existing_rows(Order, ['source_key'], [(key,) for key in df['source_key']],
+                                  ['id', 'content_hash'], batch_size)
+        stored_hash = _lookup(df, ['source_key'], {
+            key: values[1] for key, values in existing.items() if values[1] is not None})
+        unchanged = (stored_hash == df['content_hash'].array).fillna(False).to_numpy(dtype=bool)
+        df = df[~unchanged].copy()
+        df['order_id'] = _lookup(df, ['source_key'], {key: values[0] for key, values in existing.items()})
+    else:
+        df = df.assign(order_id=pd.array([pd.NA] * len(df), dtype='Int64'), source_key=None)
+
+    with profiling.stage('resolve', len(df)) as frame:
+        df = resolve_order_keys(df, batch_size, key_cache)
+        missing_customer = df['customer_id'].isna()
+        missing_product = df['product_id'].isna() & ~missing_customer
+        if frame:
+            frame.rows_out = int((~(missing_customer | missing_product)).sum())
+    data = df.drop(columns=['customer_id', 'product_id', 'order_id'])
+    rejects = _concat_rejects([
+        _rejects(data, missing_customer, '找不到客戶'),
+        _rejects(data, missing_product, '找不到產品'),
+    ])
+    df = df[~(missing_customer | missing_product)]
+
+    created = updated = 0
+    places = schema.MONEY_COLUMNS['orders']['total_price']
+    with transaction.atomic():
+        for chunk in _chunked(df, batch_size):
+            orders = [
+                Order(
+                    id=order_id,
+                    customer_id=customer_id,
+                    product_id=product_id,
+                    quantity=int(quantity),
+                    total_price=total_price,
+                    status=status,
+                    source_key=source_key,
+                    content_hash=content_hash,
+                    import_job_id=import_job
+                )
+                for order_id, customer_id, product_id, quantity, total_price, status, source_key, content_hash
+                in zip(
+                    chunk['order_id'].astype(object).where(chunk['order_id'].notna(), None).tolist(),
+                    chunk['customer_id'].tolist(), chunk['product_id'].tolist(),
+                    chunk['quantity'].tolist(), schema.decimals(chunk['total_price'], places),
+                    chunk['status'].tolist(), chunk['source_key'].tolist(), chunk['content_hash'].tolist())
+            ]
+            new_orders = [order for order in orders if order.id is None]
+            changed_orders = [order for order in orders if order.id is not None]
+            Order.objects.bulk_create(new_orders)
+            if changed_orders:
+                # 先從彙總表扣除舊值，更新後再與新訂單一起累加
+                rollups.remove_orders([order.id for order in changed_orders], batch_size)
+                Order.objects.bulk_update(changed_orders, ['quantity', 'total_price', 'status', 'content_hash'])
+            rollups.add_orders([order.id for order in orders], batch_size)
+            created += len(new_orders)
+            updated += len(changed_orders)
+    return created, updated, rejects
+
+def load_orders(df, batch_size=BATCH_SIZE):
+    """清理訂單數據並寫入資料庫，回傳 (新增筆數, 更新筆數, 拒絕的列)"""
+    df, invalid = prepare_orders(df)
+    created, updated, rejects = write_orders(df, batch_size)
+    return created, updated, _concat_rejects([invalid, rejects])
+
+def import_orders(source, batch_size=BATCH_SIZE, chunk_size=None, skip_rows=0, on_chunk=None,
+                  wait=None, engine='orm', incremental=False, import_job=None, source_name=''):
+    """導入訂單數據，回傳 (新增筆數, 更新筆數, 拒絕的列)
+
+    import_job 為導入工作的id，新增的訂單會記錄來源工作。
+    source_name 為來源檔名，增量導入時計入 source_key，不同檔案的訂單不會互相覆蓋。
+    """
+    prepare = (partial(prepare_orders, occurrences=OccurrenceCounter(source_name)) if incremental
+               else prepare_orders)
+    write_options = {'import_job': import_job} if import_job else {}
+    return _import_sheet(source, 'orders', prepare, write_orders, batch_size, chunk_size,
+                         skip_rows, on_chunk, wait, engine, incremental, **write_options)
+
+def untracked_orders_warning():
+    """增量導入前的提醒：資料庫中有沒有 source_key 的訂單時回傳說明，否則回傳 None
+
+    以非增量方式導入或在後台新增的訂單沒有來源識別，增量導入無法與檔案中的列比對，
+    同一份資料會再新增一次。來源識別由檔案中的列與出現次序決定，無法從資料庫回填。
+    """
+    count = Order.objects.filter(source_key__isnull=True).count()
+    if not count:
+        return None
+    return (f'注意：資料庫中有 {count} 筆訂單沒有來源識別（以非增量方式導入或在後台新增），'
+            f'增量導入無法比對這些訂單，檔案中相同的訂單會再新增一次')
+
+def source_name(path):
+    """增量導入時代表來源檔案的名稱：不含目錄的檔名，重送同名的檔案時 source_key 不變"""
+    return os.path.basename(os.path.normpath(os.fspath(path)))
+
+def file_fingerprint(path):
+    """來源檔案內容的 SHA-256；目錄（每張工作表一個檔案）時依檔名順序涵蓋其中的檔案"""
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                 if os.path.isfile(os.path.join(path, name))]
+    else:
+        files = [path]
+    digest = hashlib.sha256()
+    for file in files:
+        digest.update(os.path.basename(file).encode() + b'\0')
+        with open(file, 'rb') as f:
+            while chunk := f.read(1 << 20):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+def _sheet_version(sheet):
+    # 父表變更時（例如補上客戶），先前被拒絕的訂單可能可以導入，也要重新導入
+    return cache.version_key(SHEET_MODELS[sheet], *(SHEET_MODELS[parent] for parent in SHEET_DEPENDENCIES.get(sheet, [])))
+
+def unchanged_sheets(name, fingerprint, sheets):
+    """與上次增量導入的檔案內容相同、且之後資料都未變更的工作表，可以直接略過
+
+    之後有任何寫入（其他檔案、後台、清除數據）時資料版本改變，仍逐列比對 source_key，
+    被刪除的列會重新導入。
+    """
+    recorded = ImportedFile.objects.filter(name=name, sheet__in=sheets, fingerprint=fingerprint)
+    return {record.sheet for record in recorded if record.data_version == _sheet_version(record.sheet)}
+
+def record_imported(name, fingerprint, sheets):
+    """記錄增量導入完成的檔案與目前的資料版本，需在所有工作表都寫入後呼叫"""
+    for sheet in sheets:
+        ImportedFile.objects.update_or_create(
+            name=name, sheet=sheet, defaults={'fingerprint': fingerprint, 'data_version': _sheet_version(sheet)})
+
+def write_rejects(rejects, output):
+    """將各工作表被拒絕的列寫入報告
+
+    Args:
+        rejects: {工作表名稱: 被拒絕的列DataFrame}
+        output: 檔案路徑，.xlsx 時每張工作表各一個分頁，其他副檔名寫成單一CSV
+    """
+    if str(output).endswith('.xlsx'):
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            for sheet, frame in rejects.items():
+                frame.to_excel(writer, sheet_name=sheet, index=False)
+            if not rejects:
+                empty_rejects().to_excel(writer, sheet_name='rejects', index=False)
+        return
+    frames = [frame.assign(sheet=sheet) for sheet, frame in rejects.items() if len(frame)]
+    report = pd.concat(frames) if frames else empty_rejects()
+    # 批次導入的拒絕報告另有 file 欄位，放在最前面
+    leading = (['file'] if 'file' in report.columns else []) + ['sheet', 'row', 'reason']
+    columns = leading + [c for c in report.columns if c not in leading]
+    report.reindex(columns=columns).to_csv(output, index=False, encoding='utf-8-sig')
+
+def _write_all(output, chunk_size, output_format):
+    tables = export_tables(chunk_size)
+    if profiling.active():
+        tables = profiling.timed_tables(tables)
+    write_export(output, tables, output_format)
+
+def export_data(output, chunk_size=EXPORT_CHUNK_SIZE, output_format=None, use_cache=True):
+    """導出所有數據，回傳是否直接使用了快取的檔案
+
+    各表以伺服器端游標分批讀取並逐批寫入，查詢次數固定，記憶體用量不隨資料量增長。
+    產生的檔案以產品、客戶與訂單的資料版本為鍵快取，資料未變更時直接複製快取的檔案。
 
-def export_data(output):
-    """導出所有數據到Excel
-    
     Args:
-        output: 可以是檔案路徑或HttpResponse對象
-    """
-    # 導出產品數據
-    products_data = [{
-        'name': p.name,
-        'price': float(p.price),
-        'stock': p.stock,
-        'created_at': p.created_at.replace(tzinfo=None)
-    } for p in Product.objects.all()]
-    products_df = pd.DataFrame(products_data)
-    
-    # 導出客戶數據
-    customers_data = [{
-        'name': c.name,
-        'email': c.email,
-        'phone': c.phone,
-        'address': c.address,
-        'created_at': c.created_at.replace(tzinfo=None)
-    } for c in Customer.objects.all()]
-    customers_df = pd.DataFrame(customers_data)
-    
-    # 導出訂單數據
-    orders_data = [{
-        'customer_name': o.customer.name,
-        'customer_email': o.customer.email,
-        'customer_phone': o.customer.phone,
-        'product_name': o.product.name,
-        'quantity': o.quantity,
-        'total_price': float(o.total_price),
-        'order_date': o.order_date.replace(tzinfo=None),
-        'status': o.status
-    } for o in Order.objects.all()]
-    orders_df = pd.DataFrame(orders_data)
-    
-    # 創建Excel寫入器
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        products_df.to_excel(writer, sheet_name='products', index=False)
-        customers_df.to_excel(writer, sheet_name='customers', index=False)
-        orders_df.to_excel(writer, sheet_name='orders', index=False)
-
-def process_data(input_file, output_file=None, sheet_to_import=None):
-    """處理數據的主函數"""
+        output: 可以是檔案路徑或HttpResponse對象；csv、parquet、arrow 格式為輸出目錄
+        chunk_size: 每次從資料庫游標取回的筆數
+        output_format: xlsx、csv、parquet 或 arrow，未指定時依副檔名決定
+        use_cache: 為 False 時不讀取也不寫入快取
+    """
+    output_format = export_format(output, output_format)
+    with profiling.stage('export'):
+        if not use_cache:
+            _write_all(output, chunk_size, output_format)
+            return False
+        artifact = cache.Artifact(f'export-{output_format}', EXPORT_MODELS, '.xlsx' if output_format == 'xlsx' else '')
+        hit = artifact.exists()
+        if not hit:
+            artifact.build(lambda path: _write_all(path, chunk_size, output_format))
+        artifact.copy_to(output)
+    return hit
+
+# 工作表的導入順序、導入函數與顯示名稱
+IMPORTERS = [
+    ('products', import_products, '產品'),
+    ('customers', import_customers, '客戶'),
+    ('orders', import_orders, '訂單'),
+]
+# 工作表寫入前必須先提交的父表
+SHEET_DEPENDENCIES = {'orders': ['products', 'customers']}
+
+def open_source(input_file, chunk_size=None, sheet=None):
+    """開啟導入檔案，串流模式使用唯讀活頁簿
+
+    CSV、Parquet、Arrow 檔案或存放這些檔案的目錄以 TableFiles 開啟，
+    單一檔案的工作表名稱為 sheet 或檔名。
+    """
+    if is_table_source(input_file):
+        return TableFiles(input_file, sheet)
+    if chunk_size:
+        return open_workbook(input_file)
+    return pd.ExcelFile(input_file)
+
+def _sheet_names(source):
+    return source.sheetnames if hasattr(source, 'sheetnames') else source.sheet_names
+
+def _run_importer(importer, sheet, input_file, batch_size, chunk_size, parents, **options):
+    """在工作執行緒中導入一張工作表，使用自己的檔案與資料庫連線"""
+    source = open_source(input_file, chunk_size, sheet)
+    try:
+        wait = None
+        if parents:
+            # 等待父表提交，父表失敗時例外會傳遞到這裡，不寫入任何資料
+            wait = lambda: [parent.result() for parent in parents]
+        extra = {'source_name': source_name(input_file)} if sheet == 'orders' else {}
+        return importer(source, batch_size, chunk_size, wait=wait, **options, **extra)
+    finally:
+        source.close()
+        connections.close_all()
+
+def import_parallel(input_file, sheets, batch_size=BATCH_SIZE, chunk_size=None, workers=3, **options):
+    """以執行緒池並行導入多張工作表，回傳 {工作表名稱: Future}
+
+    沒有相依關係的工作表（產品、客戶）同時讀取與寫入；訂單可以先讀取與清理，
+    等產品與客戶都提交後才開始寫入。其餘參數（engine、incremental）傳給各導入函數。
+    """
+    futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for sheet, importer, _ in IMPORTERS:
+            if sheet not in sheets:
+                continue
+            parents = [futures[parent] for parent in SHEET_DEPENDENCIES.get(sheet, []) if parent in futures]
+            # 複製目前的 context，啟用中的效能紀錄也會記錄工作執行緒
+            futures[sheet] = executor.submit(
+                contextvars.copy_context().run,
+                _run_importer, importer, sheet, input_file, batch_size, chunk_size, parents, **options)
+    return futures
+
+def process_data(input_file, output_file=None, sheet_to_import=None, batch_size=BATCH_SIZE,
+                 rejects_file=None, chunk_size=None, workers=1, engine='orm', incremental=False,
+                 output_format=None, atomic=False, use_cache=True):
+    """處理數據的主函數
+
+    指定 chunk_size 時以串流模式導入：活頁簿只以唯讀模式開啟一次，
+    各工作表以 chunk_size 列為一批依序清理並寫入，記憶體用量不隨檔案大小增長。
+    workers 大於 1 時以 import_parallel 並行導入各工作表。
+    engine 為 'copy' 時在 PostgreSQL 上以 COPY 快速寫入，其他資料庫使用ORM批次寫入。
+    incremental 為 True 時只寫入新的或內容已變更的列，重複導入同一檔案幾乎不寫入資料庫；
+    檔案與上次增量導入相同且之後資料未變更時不讀取檔案，直接略過（見 unchanged_sheets）。
+    input_file 也可以是CSV/NDJSON/Parquet/Arrow檔案或目錄（每張工作表一個檔案），
+    output_format 指定導出格式，未指定時依 output_file 的副檔名決定；
+    資料未變更時導出直接使用快取的檔案，use_cache 為 False 時重新產生。
+
+    預設每批資料各自提交，失敗時已提交的批次會保留（需要從中斷處繼續時使用
+    process_data import --resumable）。atomic 為 True 時全有或全無：所有工作表在
+    同一個交易中依序導入（忽略 workers），任何一張失敗都撤銷全部變更。
+    """
     try:
         messages = []
+        rejects = {}
         
         # 如果提供了輸入檔案，則進行導入
         if input_file:
-            # 檢查Excel檔案中是否包含所需的工作表
-            excel_file = pd.ExcelFile(input_file)
             required_sheets = ['products', 'customers', 'orders']
             if sheet_to_import:
                 required_sheets = [sheet_to_import]
-            missing_sheets = [sheet for sheet in required_sheets if sheet not in excel_file.sheet_names]
-            if missing_sheets:
-                return False, f"Excel檔案缺少以下工作表：{', '.join(missing_sheets)}"
-            
-            # 按順序導入數據
-            if 'products' in required_sheets:
-                try:
-                    import_products(input_file)
-                    messages.append("產品數據導入成功")
-                except Exception as e:
-                    return False, f"產品數據導入失敗: {str(e)}"
-            if 'customers' in required_sheets:
-                try:
-                    import_customers(input_file)
-                    messages.append("客戶數據導入成功")
-                except Exception as e:
-                    return False, f"客戶數據導入失敗: {str(e)}"
-            if 'orders' in required_sheets:
+            importers = [(sheet, importer, label) for sheet, importer, label in IMPORTERS
+                         if sheet in required_sheets]
+
+            name = source_name(input_file)
+            fingerprint = None
+            skipped = set()
+            if incremental:
+                # 檔案與上次增量導入相同且資料未變更時不必讀取，百萬列的檔案也只需計算一次雜湊
+                fingerprint = file_fingerprint(input_file)
+                skipped = unchanged_sheets(name, fingerprint, required_sheets)
+                importers = [step for step in importers if step[0] not in skipped]
+
+            if incremental and 'orders' in required_sheets and 'orders' not in skipped:
+                warning = untracked_orders_warning()
+                if warning:
+                    messages.append(warning)
+
+            results = {}
+            if importers:
+                # 檢查Excel檔案中是否包含所需的工作表
+                source = open_source(input_file, chunk_size, sheet_to_import)
                 try:
-                    import_orders(input_file)
-                    messages.append("訂單數據導入成功")
-                except Exception as e:
-                    return False, f"訂單數據導入失敗: {str(e)}"
-        
+                    missing_sheets = [sheet for sheet in required_sheets if sheet not in _sheet_names(source)]
+                    if missing_sheets:
+                        return False, f"導入檔案缺少以下工作表：{', '.join(missing_sheets)}"
+
+                    if workers > 1 and not atomic:
+                        futures = import_parallel(input_file, [sheet for sheet, _, _ in importers], batch_size,
+                                                  chunk_size, workers, engine=engine, incremental=incremental)
+                        for sheet, _, label in importers:
+                            try:
+                                results[sheet] = futures[sheet].result()
+                            except Exception as e:
+                                return False, f"{label}數據導入失敗: {str(e)}"
+                    else:
+                        # 按順序導入數據，atomic 時所有工作表在同一個交易中
+                        with transaction.atomic() if atomic else nullcontext():
+                            for sheet, importer, label in importers:
+                                try:
+                                    extra = {'source_name': name} if sheet == 'orders' else {}
+                                    results[sheet] = importer(source, batch_size, chunk_size, engine=engine,
+                                                              incremental=incremental, **extra)
+                                except Exception as e:
+                                    if atomic:
+                                        transaction.set_rollback(True)
+                                        return False, f"{label}數據導入失敗，已撤銷本次導入的全部變更: {str(e)}"
+                                    return False, f"{label}數據導入失敗: {str(e)}"
+                finally:
+                    source.close()
+
+            if incremental:
+                record_imported(name, fingerprint, required_sheets)
+            for sheet, _, label in IMPORTERS:
+                if sheet in skipped:
+                    rejects[sheet] = empty_rejects()
+                    messages.append(f"{label}數據未變更，略過導入（檔案與上次增量導入相同）")
+                elif sheet in results:
+                    inserted, updated, rejects[sheet] = results[sheet]
+                    messages.append(f"{label}數據導入成功（新增 {inserted} 筆，更新 {updated} 筆，拒絕 {len(rejects[sheet])} 筆）")
+            if rejects_file:
+                with profiling.stage('rejects', sum(len(frame) for frame in rejects.values())):
+                    write_rejects(rejects, rejects_file)
+                messages.append(f"拒絕的資料已寫入 {rejects_file}")
+
         # 如果指定了輸出檔案，則導出數據
         if output_file:
             try:
-                export_data(output_file)
-                messages.append("數據導出成功")
+                if export_data(output_file, output_format=output_format, use_cache=use_cache):
+                    messages.append("數據導出成功（資料未變更，使用快取的檔案）")
+                else:
+                    messages.append("數據導出成功")
             except Exception as e:
                 return False, f"數據導出失敗: {str(e)}"
         
         return True, "\n".join(messages) if messages else "操作完成"
     except Exception as e:
-        return False, f"數據處理失敗: {str(e)}"
\ No newline at end of file
+        return False, f"數據處理失敗: {str(e)}"
@@ -0,0 +1,190 @@
+import os
+from datetime import datetime
+from decimal import Decimal
+from itertools import islice
+
+import pandas as pd
+
+from data_manager.models import Product, Customer, Order
+from data_manager.readers import table_format
+from data_manager.xlsx import write_xlsx
+
+# 每次從資料庫游標取回的筆數
+EXPORT_CHUNK_SIZE = 2000
+
+# (工作表名稱, 模型, [(欄位名稱, 查詢欄位)])，訂單的客戶與產品欄位透過 JOIN 一次取回
+EXPORT_TABLES = [
+    ('products', Product, [
+        ('name', 'name'),
+        ('price', 'price'),
+        ('stock', 'stock'),
+        ('created_at', 'created_at'),
+    ]),
+    ('customers', Customer, [
+        ('name', 'name'),
+        ('email', 'email'),
+        ('phone', 'phone'),
+        ('address', 'address'),
+        ('created_at', 'created_at'),
+    ]),
+    ('orders', Order, [
+        ('customer_name', 'customer__name'),
+        ('customer_email', 'customer__email'),
+        ('customer_phone', 'customer__phone'),
+        ('product_name', 'product__name'),
+        ('quantity', 'quantity'),
+        ('total_price', 'total_price'),
+        ('order_date', 'order_date'),
+        ('status', 'status'),
+    ]),
+]
+# 匯出內容依賴的模型，快取的匯出檔案在這些表變更時失效
+EXPORT_MODELS = [model for _, model, _ in EXPORT_TABLES]
+
+
+def _cell(value):
+    """轉換為Excel可寫入的值：金額轉為浮點數，時間去掉時區"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return value
+
+def iter_table_rows(queryset, lookups, chunk_size=EXPORT_CHUNK_SIZE):
+    """以伺服器端游標逐批讀取查詢結果，逐列產生轉換後的值"""
+    rows = queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield [_cell(value) for value in row]
+
+def scoped_querysets(queryset):
+    """依選取的資料決定各工作表的匯出範圍
+
+    選取的產品、客戶或訂單連同相關的訂單及其客戶與產品一起匯出，
+    匯出的活頁簿可以直接重新導入。
+    """
+    if queryset.model is Order:
+        orders = queryset
+    elif queryset.model is Product:
+        orders = Order.objects.filter(product__in=queryset)
+    elif queryset.model is Customer:
+        orders = Order.objects.filter(customer__in=queryset)
+    else:
+        raise ValueError(f'不支援匯出 {queryset.model.__name__}')
+    return {
+        'products': queryset if queryset.model is Product
+        else Product.objects.filter(pk__in=orders.values('product_id')),
+        'customers': queryset if queryset.model is Customer
+        else Customer.objects.filter(pk__in=orders.values('customer_id')),
+        'orders': orders,
+    }
+
+def export_tables(chunk_size=EXPORT_CHUNK_SIZE, querysets=None):
+    """依序產生 (工作表名稱, 欄位名稱, 資料列迭代器)，每張表只執行一次查詢
+
+    Args:
+        chunk_size: 每次從資料庫游標取回的筆數
+        querysets: {工作表名稱: QuerySet}，未指定的工作表匯出全部資料
+    """
+    querysets = querysets or {}
+    for sheet_name, model, columns in EXPORT_TABLES:
+        headers = [header for header, _ in columns]
+        lookups = [lookup for _, lookup in columns]
+        queryset = querysets.get(sheet_name, model.objects.all())
+        yield sheet_name, headers, iter_table_rows(queryset, lookups, chunk_size)
+
+def _batches(rows, size=EXPORT_CHUNK_SIZE):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+def _table_path(output, sheet_name, extension):
+    os.makedirs(output, exist_ok=True)
+    return os.path.join(output, f'{sheet_name}.{extension}')
+
+def _lookup_field(model, lookup):
+    """取得查詢欄位（可跨關聯，如 customer__name）對應的模型欄位"""
+    *relations, name = lookup.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name)
+
+def arrow_schema(sheet_name, headers):
+    """依模型欄位定義產生工作表的Arrow schema，金額與Excel匯出相同使用浮點數"""
+    import pyarrow as pa
+
+    types = {
+        'IntegerField': pa.int64(),
+        'BigIntegerField': pa.int64(),
+        'AutoField': pa.int64(),
+        'BigAutoField': pa.int64(),
+        'DecimalField': pa.float64(),
+        'FloatField': pa.float64(),
+        'DateTimeField': pa.timestamp('us'),
+        'DateField': pa.date32(),
+    }
+    model, columns = {name: (model, columns) for name, model, columns in EXPORT_TABLES}[sheet_name]
+    lookups = dict(columns)
+    return pa.schema([
+        (header, types.get(_lookup_field(model, lookups[header]).get_internal_type(), pa.string()))
+        for header in headers
+    ])
+
+def _record_batches(sheet_name, headers, rows):
+    import pyarrow as pa
+
+    schema = arrow_schema(sheet_name, headers)
+    batches = (pa.RecordBatch.from_arrays(
+        [pa.array(column, type=field.type) for column, field in zip(zip(*batch), schema)], schema=schema)
+        for batch in _batches(rows))
+    return schema, batches
+
+def write_csv(output, tables):
+    """每張工作表寫成 output 目錄下的一個CSV檔，逐批附加寫入"""
+    for sheet_name, headers, rows in tables:
+        with open(_table_path(output, sheet_name, 'csv'), 'w', newline='', encoding='utf-8') as file:
+            pd.DataFrame(columns=headers).to_csv(file, index=False)
+            for batch in _batches(rows):
+                pd.DataFrame(batch, columns=headers).to_csv(file, index=False, header=False)
+
+def write_parquet(output, tables):
+    """每張工作表寫成 output 目錄下的一個Parquet檔，每批為一個 row group"""
+    import pyarrow.parquet as pq
+
+    for sheet_name, headers, rows in tables:
+        schema, batches = _record_batches(sheet_name, headers, rows)
+        with pq.ParquetWriter(_table_path(output, sheet_name, 'parquet'), schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+def write_arrow(output, tables):
+    """每張工作表寫成 output 目錄下的一個Arrow IPC（Feather v2）檔"""
+    import pyarrow as pa
+
+    for sheet_name, headers, rows in tables:
+        schema, batches = _record_batches(sheet_name, headers, rows)
+        with pa.ipc.new_file(_table_path(output, sheet_name, 'arrow'), schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+
+# 匯出格式與寫入函數；xlsx 以外的格式輸出為目錄，每張工作表一個檔案
+EXPORT_FORMATS = {
+    'xlsx': write_xlsx,
+    'csv': write_csv,
+    'parquet': write_parquet,
+    'arrow': write_arrow,
+}
+
+def export_format(output, output_format=None):
+    """決定匯出格式：優先使用 output_format，其次依輸出路徑的副檔名，預設 xlsx"""
+    if output_format:
+        return output_format
+    if isinstance(output, (str, os.PathLike)):
+        output_format = table_format(output) or 'xlsx'
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f'不支援導出為 {output_format} 格式')
+        return output_format
+    return 'xlsx'
+
+def write_export(output, tables, output_format=None):
+    """以指定格式寫入 export_tables() 產生的資料"""
+    EXPORT_FORMATS[export_format(output, output_format)](output, tables)
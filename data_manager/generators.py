@@ -0,0 +1,167 @@
+"""產生壓力測試用的合成數據（只依賴 NumPy 與 pandas，不需要 Django）"""
+import os
+
+import numpy as np
+import pandas as pd
+
+daily_products = [
+    '洗衣液', '衛生紙', '洗髮水', '沐浴露', '牙膏',
+    '洗潔精', '垃圾袋', '保鮮膜', '廚房紙巾', '洗衣粉'
+]
+STATUSES = ['pending', 'completed', 'cancelled']
+STATUS_WEIGHTS = [0.2, 0.7, 0.1]
+
+# 沒有安裝 Faker 時用來組合姓名與地址的字元
+_SURNAMES = list('陳林黃張李王吳劉蔡楊許鄭謝郭洪曾邱廖賴周徐蘇葉莊呂江何蕭羅高')
+_GIVEN = list('志明淑芬家豪怡君俊傑雅婷宗翰佳穎冠宇詩涵承恩欣怡柏宏美玲建國嘉文')
+_CITIES = ['臺北市', '新北市', '桃園市', '臺中市', '臺南市', '高雄市', '新竹市', '基隆市']
+_ROADS = ['中山路', '中正路', '民生路', '復興路', '和平路', '光復路', '仁愛路', '信義路']
+# 姓名與地址從這個大小的候選池中抽樣
+POOL_SIZE = 5000
+# Excel 工作表的最大列數（含表頭）
+XLSX_MAX_ROWS = 1048576
+
+OUTPUT_FORMATS = ['xlsx', 'csv', 'parquet', 'arrow']
+
+
+def _pools(rng, size):
+    """產生姓名與地址的候選池，有安裝 Faker 時使用其中文資料"""
+    try:
+        from faker import Faker
+    except ImportError:
+        names = (rng.choice(_SURNAMES, size).astype(object)
+                 + rng.choice(_GIVEN, size).astype(object) + rng.choice(_GIVEN, size).astype(object))
+        addresses = (rng.choice(_CITIES, size).astype(object) + rng.choice(_ROADS, size).astype(object)
+                     + rng.integers(1, 500, size).astype(str).astype(object) + '號')
+        return names, addresses
+    fake = Faker('zh_TW')
+    fake.seed_instance(int(rng.integers(2 ** 31)))
+    return (np.array([fake.name() for _ in range(size)], dtype=object),
+            np.array([fake.address() for _ in range(size)], dtype=object))
+
+def _zipf_weights(count, skew):
+    """前面的項目較熱門的 Zipf 機率分布，skew 為 0 時為均勻分布"""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return weights / weights.sum()
+
+def generate_products(num_products=10, rng=None):
+    """產生產品數據，超過 daily_products 的數量時在名稱後加上型號，名稱不會重複"""
+    rng = rng or np.random.default_rng()
+    index = np.arange(num_products)
+    base = np.array(daily_products, dtype=object)[index % len(daily_products)]
+    suffix = np.where(index < len(daily_products), '', ' ' + (index // len(daily_products) + 1).astype(str) + '型')
+    return pd.DataFrame({
+        'name': base + suffix.astype(object),
+        'price': rng.uniform(100, 1000, num_products).round(2),
+        'stock': rng.integers(10, 101, num_products),
+    })
+
+def generate_customers(num_customers=5, rng=None):
+    """產生客戶數據，電子郵件與電話都不會重複"""
+    rng = rng or np.random.default_rng()
+    index = np.arange(num_customers, dtype=np.int64)
+    names, addresses = _pools(rng, min(num_customers, POOL_SIZE) or 1)
+    # 以與 10^8 互質的乘數打散序號，1億筆以內電話不重複且看起來是隨機的
+    offset = int(rng.integers(10 ** 8))
+    phones = 1300000000 + (index * 48271 + offset) % 10 ** 8
+    return pd.DataFrame({
+        'name': rng.choice(names, num_customers),
+        'email': 'customer' + (index + 1).astype(str).astype(object) + '@example.com',
+        'phone': phones.astype(str),
+        'address': rng.choice(addresses, num_customers),
+    })
+
+def generate_orders(products_df, customers_df, num_orders=20, skew=0.0, rng=None):
+    """以向量化抽樣產生訂單數據
+
+    skew 大於 0 時產品與客戶依 Zipf 分布抽樣，少數熱門產品與客戶佔大部分訂單。
+    """
+    rng = rng or np.random.default_rng()
+    products = rng.permutation(len(products_df))[
+        rng.choice(len(products_df), num_orders, p=_zipf_weights(len(products_df), skew))]
+    customers = rng.permutation(len(customers_df))[
+        rng.choice(len(customers_df), num_orders, p=_zipf_weights(len(customers_df), skew))]
+    quantity = rng.integers(1, 6, num_orders)
+    return pd.DataFrame({
+        'customer_email': customers_df['email'].to_numpy()[customers],
+        'customer_phone': customers_df['phone'].to_numpy()[customers],
+        'product_name': products_df['name'].to_numpy()[products],
+        'quantity': quantity,
+        'total_price': (quantity * products_df['price'].to_numpy()[products]).round(2),
+        'status': rng.choice(STATUSES, num_orders, p=STATUS_WEIGHTS),
+    })
+
+# 每張工作表刻意製造的錯誤：(欄位, 錯誤的值)
+INVALID_VALUES = {
+    'products': [('name', None), ('price', 'N/A'), ('stock', -1.5)],
+    'customers': [('email', 'not-an-email'), ('phone', None), ('name', None)],
+    'orders': [('quantity', None), ('quantity', 'abc'), ('customer_email', 'nobody@example.com'),
+               ('product_name', '不存在的產品'), ('status', 'unknown')],
+}
+
+def add_noise(df, sheet_name, duplicate_rate=0.0, invalid_rate=0.0, rng=None):
+    """依比例加入重複列與不合格的列，用來測試去重與驗證的路徑"""
+    rng = rng or np.random.default_rng()
+    df = df.copy()
+    invalid = rng.choice(len(df), int(len(df) * invalid_rate), replace=False)
+    kinds = INVALID_VALUES[sheet_name]
+    for kind, rows in enumerate(np.array_split(rng.permutation(invalid), len(kinds))):
+        column, value = kinds[kind]
+        if len(rows):
+            df[column] = df[column].astype(object)
+            df.iloc[rows, df.columns.get_loc(column)] = value
+    duplicates = df.iloc[rng.choice(len(df), int(len(df) * duplicate_rate))]
+    if len(duplicates):
+        df = pd.concat([df, duplicates])
+        df = df.iloc[rng.permutation(len(df))]
+    return df.reset_index(drop=True)
+
+def generate_dataset(num_products=10, num_customers=5, num_orders=20, skew=0.0,
+                     duplicate_rate=0.0, invalid_rate=0.0, seed=None):
+    """產生 {工作表名稱: DataFrame}，指定 seed 時結果可重現"""
+    rng = np.random.default_rng(seed)
+    products = generate_products(num_products, rng)
+    customers = generate_customers(num_customers, rng)
+    orders = generate_orders(products, customers, num_orders, skew, rng)
+    sheets = {'products': products, 'customers': customers, 'orders': orders}
+    if duplicate_rate or invalid_rate:
+        sheets = {sheet: add_noise(df, sheet, duplicate_rate, invalid_rate, rng) for sheet, df in sheets.items()}
+    return sheets
+
+def output_format(output, fmt=None):
+    """依指定格式或副檔名決定輸出格式，預設 xlsx"""
+    if fmt:
+        return fmt
+    extension = os.path.splitext(str(output))[1].lower().lstrip('.')
+    return {'feather': 'arrow'}.get(extension, extension) if extension in OUTPUT_FORMATS + ['feather'] else 'xlsx'
+
+def save_dataset(sheets, output, fmt=None):
+    """儲存數據；xlsx 為單一活頁簿，其他格式為目錄，每張工作表一個檔案（可直接用 process_data 導入）"""
+    fmt = output_format(output, fmt)
+    if fmt == 'xlsx':
+        too_large = [sheet for sheet, df in sheets.items() if len(df) >= XLSX_MAX_ROWS]
+        if too_large:
+            raise ValueError(f"Excel每張工作表最多 {XLSX_MAX_ROWS - 1} 列，{', '.join(too_large)} 請改用 csv、parquet 或 arrow 格式")
+        from openpyxl import Workbook
+
+        workbook = Workbook(write_only=True)
+        for sheet_name, df in sheets.items():
+            sheet = workbook.create_sheet(sheet_name)
+            sheet.append(list(df.columns))
+            for row in df.astype(object).where(df.notna(), None).itertuples(index=False, name=None):
+                sheet.append(row)
+        workbook.save(output)
+        return output
+    os.makedirs(output, exist_ok=True)
+    for sheet_name, df in sheets.items():
+        path = os.path.join(output, f'{sheet_name}.{fmt}')
+        if fmt == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            # 刻意放入的錯誤值讓欄位混有數字與文字，存成欄式格式前統一轉為文字
+            df = df.apply(lambda column: column.astype('string') if column.dtype == object else column)
+            if fmt == 'parquet':
+                df.to_parquet(path, index=False)
+            else:
+                df.to_feather(path)
+    return output
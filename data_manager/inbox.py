@@ -0,0 +1,232 @@
+"""監看收件目錄，自動導入放入的檔案
+
+收件目錄中的 .xlsx 活頁簿與 .csv 檔案在寫入完成後被取走，依序處理：
+
+  1. 移到 .processing/<主機>-<pid>/ 並加上時間前綴，取得的行程才會處理，同名檔案每天重送也不會衝突
+  2. 以 batch.import_batch 批次導入（活頁簿一批，CSV 依工作表各一批）
+  3. 移到 done/ 或 failed/，旁邊寫入同名的 .json 結果描述，有被拒絕的列時另寫 .rejects.csv
+
+CSV 的工作表由檔名開頭決定，例如 orders.csv、orders-shop01.csv、customers_20261018.csv。
+判斷寫入完成的方式是輪詢：大小與修改時間在兩次掃描間沒有改變，且已超過 settle 秒沒有修改；
+活頁簿還要是完整的 zip 檔。寫入端最好先寫成暫存名稱（. 開頭或其他副檔名）再改名。
+"""
+import json
+import os
+import re
+import socket
+import time
+import zipfile
+
+from data_manager import batch
+from data_manager.data_processor import BATCH_SIZE, write_rejects
+
+INBOX_FORMATS = ('.xlsx', '.csv')
+PROCESSING_DIR = '.processing'
+DONE_DIR = 'done'
+FAILED_DIR = 'failed'
+# 檔案超過這個秒數沒有修改才視為寫入完成
+SETTLE_SECONDS = 5
+# 超過這個秒數仍不是完整 zip 的活頁簿不再等待，交給導入判定失敗
+STALLED_AFTER = 600
+
+
+def csv_sheet(name):
+    """CSV 檔名開頭的工作表名稱，無法判斷時回傳 None"""
+    match = re.match(r'[a-z]+', name.lower())
+    if match and match.group() in batch.SHEETS:
+        return match.group()
+    return None
+
+def _timestamp(seconds):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(seconds))
+
+def _owner():
+    return f'{socket.gethostname()}-{os.getpid()}'
+
+def _owner_alive(owner):
+    """取走檔案的行程是否仍在執行；其他主機的行程無法判斷，視為仍在執行"""
+    host, _, pid = owner.rpartition('-')
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Inbox:
+    """收件目錄與其 done/、failed/ 目錄
+
+    Args:
+        path: 收件目錄
+        done, failed: 處理後移入的目錄，預設為收件目錄下的 done/ 與 failed/，須與收件目錄在同一檔案系統
+        settle: 檔案超過這個秒數沒有修改才取走
+    """
+
+    def __init__(self, path, done=None, failed=None, settle=SETTLE_SECONDS):
+        self.path = os.path.abspath(path)
+        self.processing = os.path.join(self.path, PROCESSING_DIR)
+        # 各監看程式取走的檔案放在自己的目錄，recover 只處理已停止的行程留下的檔案
+        self.claimed = os.path.join(self.processing, _owner())
+        self.done = os.path.abspath(done or os.path.join(self.path, DONE_DIR))
+        self.failed = os.path.abspath(failed or os.path.join(self.path, FAILED_DIR))
+        self.settle = settle
+        # 上次掃描時各檔案的 (大小, 修改時間)
+        self._seen = {}
+        for directory in (self.processing, self.done, self.failed):
+            os.makedirs(directory, exist_ok=True)
+
+    def _complete(self, path, size, age):
+        if size == 0:
+            return False
+        if path.lower().endswith('.xlsx') and age < STALLED_AFTER:
+            return zipfile.is_zipfile(path)
+        return True
+
+    def ready(self):
+        """回傳已寫入完成的檔名，依修改時間排序"""
+        now = time.time()
+        seen = {}
+        ready = []
+        with os.scandir(self.path) as entries:
+            for entry in entries:
+                if (entry.name.startswith(('.', '~$')) or not entry.name.lower().endswith(INBOX_FORMATS)
+                        or not entry.is_file()):
+                    continue
+                stat = entry.stat()
+                state = (stat.st_size, stat.st_mtime_ns)
+                seen[entry.name] = state
+                age = now - stat.st_mtime
+                if (self._seen.get(entry.name, state) == state and age >= self.settle
+                        and self._complete(entry.path, stat.st_size, age)):
+                    ready.append((stat.st_mtime_ns, entry.name))
+        self._seen = seen
+        return [name for _, name in sorted(ready)]
+
+    def _unique(self, name):
+        stem = time.strftime('%Y%m%d-%H%M%S')
+        candidate = f'{stem}-{name}'
+        number = 1
+        while any(os.path.exists(os.path.join(directory, candidate))
+                  for directory in (self.claimed, self.done, self.failed)):
+            number += 1
+            candidate = f'{stem}-{number}-{name}'
+        return candidate
+
+    def claim(self, name):
+        """將檔案移到 .processing/ 下此行程的目錄，回傳新路徑；已被其他行程取走時回傳 None"""
+        os.makedirs(self.claimed, exist_ok=True)
+        path = os.path.join(self.claimed, self._unique(name))
+        try:
+            os.rename(os.path.join(self.path, name), path)
+        except FileNotFoundError:
+            return None
+        self._seen.pop(name, None)
+        return path
+
+    def finish(self, path, manifest, rejects=None):
+        """依結果將檔案移到 done/ 或 failed/，寫入結果描述與拒絕的列，回傳最後的路徑"""
+        directory = self.done if manifest['status'] == 'succeeded' else self.failed
+        target = os.path.join(directory, os.path.basename(path))
+        manifest['path'] = target
+        if rejects:
+            manifest['rejects_file'] = f'{target}.rejects.csv'
+            write_rejects(rejects, manifest['rejects_file'])
+        temp = os.path.join(directory, f'.{os.path.basename(target)}.json.tmp')
+        with open(temp, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(temp, f'{target}.json')
+        os.rename(path, target)
+        return target
+
+    def recover(self):
+        """將已停止的監看程式留在 .processing/ 的檔案移到 failed/，回傳檔案數
+
+        須在開始取走檔案之前呼叫。只處理本機上已結束的行程（以及先前使用相同 pid 的行程）的目錄，
+        同時執行的其他監看程式與其他主機取走的檔案不受影響。
+        中斷的檔案可能已提交部分資料，不自動重試；以 --incremental 導入時可直接移回收件目錄重新導入。
+        """
+        recovered = 0
+        for owner in sorted(os.listdir(self.processing)):
+            directory = os.path.join(self.processing, owner)
+            if not os.path.isdir(directory) or (owner != _owner() and _owner_alive(owner)):
+                continue
+            for name in sorted(os.listdir(directory)):
+                self.finish(os.path.join(directory, name), {
+                    'file': name, 'status': 'failed', 'error': '導入中斷（監看程式在處理時停止）',
+                    'finished_at': _timestamp(time.time())})
+                recovered += 1
+            os.rmdir(directory)
+        return recovered
+
+
+def _groups(claimed):
+    """活頁簿一批，CSV 依工作表分批，產品與客戶在訂單之前；回傳 ([(工作表, 路徑列表)], 無法判斷工作表的路徑)"""
+    groups = {None: []}
+    groups.update((sheet, []) for sheet in batch.SHEETS)
+    unknown = []
+    for name, path in claimed:
+        if name.lower().endswith('.xlsx'):
+            groups[None].append(path)
+        elif csv_sheet(name):
+            groups[csv_sheet(name)].append(path)
+        else:
+            unknown.append(path)
+    return [(sheet, paths) for sheet, paths in groups.items() if paths], unknown
+
+def _manifest(name, result, sheet, totals, started):
+    manifest = {
+        'file': name,
+        'status': 'succeeded' if result.success else 'failed',
+        'error': result.error,
+        'sheet': sheet or '',
+        'started_at': _timestamp(started),
+        'finished_at': _timestamp(time.time()),
+        'rows': result.rows,
+        'rejected': {table: len(frame) for table, frame in result.rejects.items()},
+    }
+    if result.skipped:
+        manifest['skipped'] = True
+    if 'orders' in result.rows:
+        manifest['orders'] = {'inserted': result.orders[0], 'updated': result.orders[1]}
+    if totals:
+        # 產品與客戶合併後寫入，只有整批的筆數
+        manifest['batch'] = {table: {'inserted': inserted, 'updated': updated}
+                             for table, (inserted, updated, _) in totals.items()}
+    return manifest
+
+def import_files(inbox, claimed, batch_size=BATCH_SIZE, engine='orm', incremental=False, pool=None):
+    """導入已取走的檔案並移到 done/ 或 failed/，回傳各檔案的結果描述
+
+    Args:
+        claimed: [(原始檔名, .processing/ 中的路徑)]
+        pool: 解析檔案用的 batch.WorkerPool，未提供時在目前的行程中解析
+    """
+    names = {path: name for name, path in claimed}
+    groups, unknown = _groups(claimed)
+    manifests = []
+    for path in unknown:
+        manifest = {'file': names[path], 'status': 'failed', 'finished_at': _timestamp(time.time()),
+                    'error': f"無法由檔名判斷CSV的工作表，檔名須以 {'、'.join(batch.SHEETS)} 開頭"}
+        inbox.finish(path, manifest)
+        manifests.append(manifest)
+    for sheet, paths in groups:
+        started = time.time()
+        try:
+            # 取走時加上了時間前綴，以原始檔名識別來源，重送的檔案才會對應到已導入的訂單
+            totals, results = batch.import_batch(paths, sheet, batch_size, engine=engine, incremental=incremental,
+                                                 pool=pool, names=[names[path] for path in paths])
+        except Exception as e:
+            totals = {}
+            results = [batch.FileResult(path) for path in paths]
+            for result in results:
+                result.error = str(e) if isinstance(e, batch.BatchError) else f'{type(e).__name__}: {e}'
+        for result in results:
+            manifest = _manifest(names[result.path], result, sheet, totals, started)
+            rejects = {name: frame for name, frame in result.rejects.items() if len(frame)}
+            inbox.finish(result.path, manifest, rejects)
+            manifests.append(manifest)
+    return manifests
@@ -0,0 +1,277 @@
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from data_manager import cache
+from data_manager.data_processor import BATCH_SIZE, IMPORTERS, open_source, source_name, untracked_orders_warning
+from data_manager.exporters import EXPORT_MODELS, export_tables, write_xlsx
+from data_manager.models import ImportJob, ExportJob
+
+# 超過這個秒數沒有回報心跳的執行中工作視為執行者已終止，重新排隊
+STALE_AFTER = 600
+# 執行中的工作每隔這個秒數更新一次心跳，與批次處理的進度無關
+HEARTBEAT_INTERVAL = 30
+# 失敗後重新排隊的等待秒數，每次失敗加倍，最多等待 RETRY_BACKOFF_MAX 秒
+RETRY_BACKOFF = 30
+RETRY_BACKOFF_MAX = 3600
+# 導出時每處理這麼多列回報一次進度
+EXPORT_PROGRESS_EVERY = 10000
+
+
+
+class JobCancelled(Exception):
+    """工作已被要求取消"""
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def worker_alive(worker):
+    """執行者的行程是否仍在執行；不在本機或無法判斷時回傳None"""
+    host, _, pid = worker.rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def claim_job(model, pk, worker=None, statuses=('queued',), **fields):
+    """以條件式 UPDATE 將狀態為 statuses 之一的工作標記為執行中，成功時回傳工作，否則回傳None"""
+    now = timezone.now()
+    claimed = model.objects.filter(pk=pk, status__in=statuses).update(
+        status='running', started_at=now, heartbeat_at=now, finished_at=None, run_after=None,
+        worker=worker or worker_name(), attempts=F('attempts') + 1, rows_per_second=0, **fields
+    )
+    return model.objects.get(pk=pk) if claimed else None
+
+def claim_next_job(worker=None):
+    """取得下一個排隊中的工作並標記為執行中，沒有工作時回傳None
+
+    以條件式 UPDATE 搶佔工作，多個執行者同時輪詢也不會重複執行同一個工作。
+    失敗後重新排隊的工作要等到 run_after 之後才會被取出。
+    """
+    worker = worker or worker_name()
+    due = Q(run_after__isnull=True) | Q(run_after__lte=timezone.now())
+    for model in (ImportJob, ExportJob):
+        candidates = (model.objects.filter(due, status='queued')
+                      .order_by('created_at').values_list('pk', flat=True)[:10])
+        for pk in candidates:
+            job = claim_job(model, pk, worker)
+            if job:
+                return job
+    return None
+
+def requeue_stale_jobs(stale_after=STALE_AFTER):
+    """將執行者已終止的工作重新排隊，超過最多嘗試次數的標記為失敗，回傳處理筆數"""
+    cutoff = timezone.now() - timedelta(seconds=stale_after)
+    count = 0
+    for model in (ImportJob, ExportJob):
+        stale = model.objects.filter(status='running', heartbeat_at__lt=cutoff)
+        count += stale.filter(attempts__lt=F('max_attempts')).update(
+            status='queued', message='執行者無回應，已重新排隊')
+        count += stale.update(
+            status='failed', finished_at=timezone.now(), message='執行者無回應，已超過最多嘗試次數')
+    return count
+
+def job_status(job):
+    """工作狀態的JSON內容，供後台與導入API輪詢"""
+    status = {
+        'id': job.pk,
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'rows_per_second': job.rows_per_second,
+        'attempts': job.attempts,
+        'run_after': job.run_after,
+        'cancel_requested': job.cancel_requested,
+        'started_at': job.started_at,
+        'finished_at': job.finished_at,
+        'message': job.message,
+    }
+    if isinstance(job, ImportJob):
+        status['checkpoint'] = job.checkpoint
+    return status
+
+def cancel_job(job):
+    """要求取消工作；排隊中的工作直接取消，執行中的工作在下一批處理時停止"""
+    type(job).objects.filter(pk=job.pk, status='queued').update(
+        status='cancelled', cancel_requested=True, finished_at=timezone.now())
+    type(job).objects.filter(pk=job.pk, status='running').update(cancel_requested=True)
+
+def retry_job(job):
+    """將失敗或已取消的工作重新排隊，導入工作會從檢查點繼續"""
+    return type(job).objects.filter(pk=job.pk, status__in=['failed', 'cancelled']).update(
+        status='queued', cancel_requested=False, attempts=0, run_after=None, message='')
+
+def retry_delay(attempts):
+    """第 attempts 次嘗試失敗後，重新排隊的工作再被取出前等待的秒數"""
+    return min(RETRY_BACKOFF * 2 ** max(attempts - 1, 0), RETRY_BACKOFF_MAX)
+
+
+class Heartbeat:
+    """在背景執行緒中每隔 interval 秒更新執行中工作的心跳
+
+    單一批次處理很久時，Progress.advance 要等批次完成才回報，心跳改由這裡維持，
+    工作不會在仍在執行時被 requeue_stale_jobs 重新排隊。工作的資料列正被批次的交易鎖定時
+    略過這一次（該交易提交時 Progress.advance 就會更新心跳），不會等待鎖。
+    """
+
+    def __init__(self, job, interval=HEARTBEAT_INTERVAL):
+        self.model = type(job)
+        self.pk = job.pk
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def beat(self):
+        with transaction.atomic():
+            running = (self.model.objects.select_for_update(skip_locked=True)
+                       .filter(pk=self.pk, status='running').values_list('pk', flat=True))
+            if list(running):
+                self.model.objects.filter(pk=self.pk).update(heartbeat_at=timezone.now())
+
+    def _run(self):
+        try:
+            while not self._stopped.wait(self.interval):
+                try:
+                    self.beat()
+                except DatabaseError:
+                    # SQLite 在其他連線寫入時鎖定整個資料庫，下一次再更新
+                    pass
+        finally:
+            # 背景執行緒有自己的資料庫連線，結束時關閉
+            connections.close_all()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+class Progress:
+    """記錄工作的處理筆數、速度與心跳，並在要求取消時拋出 JobCancelled"""
+
+    def __init__(self, job):
+        self.job = job
+        self.started = time.monotonic()
+        self.base_rows = job.rows_processed
+
+    def advance(self, rows, **fields):
+        job = self.job
+        job.rows_processed += rows
+        elapsed = time.monotonic() - self.started
+        job.rows_per_second = (job.rows_processed - self.base_rows) / elapsed if elapsed else 0
+        job.heartbeat_at = timezone.now()
+        for name, value in fields.items():
+            setattr(job, name, value)
+        type(job).objects.filter(pk=job.pk).update(
+            rows_processed=job.rows_processed, rows_per_second=job.rows_per_second,
+            heartbeat_at=job.heartbeat_at, **fields
+        )
+        if type(job).objects.filter(pk=job.pk, cancel_requested=True).exists():
+            raise JobCancelled()
+
+
+def _run_import(job, progress, batch_size=BATCH_SIZE, **options):
+    checkpoint = dict(job.checkpoint)
+
+    def on_chunk(sheet_name, rows_read, rows):
+        # 與該批資料在同一個交易中更新檢查點
+        checkpoint[sheet_name] = rows_read
+        progress.advance(rows, checkpoint=checkpoint)
+
+    steps = [(sheet, step) for sheet, step, _ in IMPORTERS if not job.sheet or sheet == job.sheet]
+    messages = []
+    if options.get('incremental') and 'orders' in dict(steps):
+        warning = untracked_orders_warning()
+        if warning:
+            messages.append(warning)
+    source = open_source(job.path, job.chunk_size, job.sheet or None)
+    try:
+        missing = [sheet for sheet, _ in steps if sheet not in source.sheetnames]
+        if missing:
+            raise ValueError(f"導入檔案缺少以下工作表：{', '.join(missing)}")
+        for sheet, step in steps:
+            # 訂單記錄來源的導入工作，可依工作刪除；增量導入時以檔名區分來源
+            extra = {'import_job': job.pk, 'source_name': source_name(job.path)} if sheet == 'orders' else {}
+            inserted, updated, rejects = step(source, batch_size, job.chunk_size,
+                                              skip_rows=checkpoint.get(sheet, 0), on_chunk=on_chunk,
+                                              **options, **extra)
+            messages.append(f'{sheet}: 新增 {inserted} 筆，更新 {updated} 筆，拒絕 {len(rejects)} 筆')
+    finally:
+        source.close()
+    return '\n'.join(messages)
+
+def _counted(tables, progress):
+    """匯出時每處理 EXPORT_PROGRESS_EVERY 列回報一次進度"""
+    for sheet_name, headers, rows in tables:
+        def counting(rows=rows):
+            pending = 0
+            for row in rows:
+                yield row
+                pending += 1
+                if pending == EXPORT_PROGRESS_EVERY:
+                    progress.advance(pending)
+                    pending = 0
+            if pending:
+                progress.advance(pending)
+        yield sheet_name, headers, counting()
+
+def _run_export(job, progress, **options):
+    job.rows_processed = progress.base_rows = 0
+    job.file.save(f'data_export_{job.pk}.xlsx', ContentFile(b''), save=False)
+    # 與 process_data export 共用快取的活頁簿，資料未變更時直接複製
+    artifact = cache.Artifact('export-xlsx', EXPORT_MODELS, '.xlsx')
+    if artifact.exists():
+        message = '資料未變更，已複製快取的檔案'
+    else:
+        artifact.build(lambda path: write_xlsx(path, _counted(export_tables(), progress)))
+        message = f'已導出 {job.rows_processed} 筆'
+    artifact.copy_to(job.file.path)
+    ExportJob.objects.filter(pk=job.pk).update(file=job.file.name)
+    return message
+
+def run_job(job, **options):
+    """執行已搶佔的工作並記錄結果；失敗時在嘗試次數內重新排隊，等待 retry_delay() 秒後才會再被取出
+
+    其餘參數（batch_size、engine、incremental）傳給導入函數。
+    """
+    progress = Progress(job)
+    runner = _run_import if isinstance(job, ImportJob) else _run_export
+    model = type(job)
+    try:
+        with Heartbeat(job):
+            message = runner(job, progress, **options)
+    except JobCancelled:
+        if isinstance(job, ExportJob) and job.file:
+            job.file.delete(save=False)
+        model.objects.filter(pk=job.pk).update(
+            status='cancelled', finished_at=timezone.now(), message='已取消')
+    except Exception as e:
+        now = timezone.now()
+        if job.attempts < job.max_attempts:
+            # 暫時性的錯誤（如資料庫連線中斷）多半需要一段時間才會恢復，等待後再重試
+            model.objects.filter(pk=job.pk).update(
+                status='queued', finished_at=now, run_after=now + timedelta(seconds=retry_delay(job.attempts)),
+                message=f'{type(e).__name__}: {e}')
+        else:
+            model.objects.filter(pk=job.pk).update(
+                status='failed', finished_at=now, message=f'{type(e).__name__}: {e}')
+    else:
+        model.objects.filter(pk=job.pk).update(
+            status='succeeded', finished_at=timezone.now(), message=message)
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,203 @@
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from data_manager import profiling
+from data_manager.data_processor import BATCH_SIZE, IMPORTERS, export_data, open_source
+from data_manager.generators import OUTPUT_FORMATS, generate_dataset, save_dataset
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 產生的數據集中每筆訂單對應的客戶與產品數量比例
+CUSTOMERS_PER_ORDER = 0.2
+PRODUCTS_PER_ORDER = 0.005
+# 低於此秒數的差異視為雜訊，不判定為退步
+NOISE_SECONDS = 0.05
+
+
+def _rows(value):
+    """解析列數，可使用 k、m 後綴，例如 100k、1m"""
+    multiplier = {'k': 1000, 'm': 1000000}.get(value[-1:].lower(), 1)
+    return int(float(value[:-1] if multiplier > 1 else value) * multiplier)
+
+def peak_rss_mb():
+    """目前行程的最大常駐記憶體（MB），無法取得時為None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 為單位，macOS 以位元組為單位
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def _reset_peak_rss():
+    """將行程的最大常駐記憶體（VmHWM）重設為目前的用量，成功時回傳 True
+
+    ru_maxrss 只會增加，依序測量時後面的操作只會讀到先前（例如產生數據時）的峰值；
+    Linux 4.0 以上寫入 /proc/self/clear_refs 可以重設，其他系統不支援。
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+def _rss_high_water_mb():
+    with open('/proc/self/status') as f:
+        return round(int(re.search(r'VmHWM:\s+(\d+)', f.read()).group(1)) / 1024, 1)
+
+def _measure(func):
+    """在紀錄器中執行 func，回傳該操作的報告（profiling.Recorder.report()）加上最大記憶體
+
+    可以重設峰值時記錄的是這個操作期間的最大常駐記憶體，否則為行程到目前為止的最大值。
+    """
+    recorder = profiling.Recorder()
+    reset = _reset_peak_rss()
+    with recorder.activate():
+        func()
+    return {**recorder.report(), 'peak_rss_mb': _rss_high_water_mb() if reset else peak_rss_mb()}
+
+def compare(results, baseline, threshold):
+    """與基準比較，回傳退步項目的說明列表
+
+    耗時或記憶體超過基準的 (1 + threshold) 倍、或查詢次數增加時視為退步。
+    """
+    regressions = []
+    for size, operations in results['runs'].items():
+        for operation, now in operations.items():
+            before = baseline.get('runs', {}).get(size, {}).get(operation)
+            if not before:
+                continue
+            name = f'{size} 列 {operation}'
+            # 整個操作比較總耗時，各階段比較不含子階段的耗時
+            pairs = [(name, now, before, 'seconds')] + [
+                (f'{name} {path}', stage, before['stages'][path], 'self_seconds')
+                for path, stage in now['stages'].items() if path in before.get('stages', {})]
+            for label, current, previous, key in pairs:
+                if (current[key] > previous[key] * (1 + threshold)
+                        and current[key] - previous[key] > NOISE_SECONDS):
+                    regressions.append(f"{label} 耗時 {previous[key]:.2f} → {current[key]:.2f} 秒")
+                if current['queries'] > previous['queries']:
+                    regressions.append(f"{label} 查詢 {previous['queries']} → {current['queries']} 次")
+            if (now['peak_rss_mb'] and before.get('peak_rss_mb')
+                    and now['peak_rss_mb'] > before['peak_rss_mb'] * (1 + threshold)):
+                regressions.append(f"{name} 記憶體 {before['peak_rss_mb']} → {now['peak_rss_mb']} MB")
+    return regressions
+
+class Command(BaseCommand):
+    help = '以產生的數據測量導入與導出各階段的耗時、查詢次數與記憶體，並與基準比較'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=_rows, default=[1000, 100000],
+                            help='訂單列數，可指定多個並使用 k、m 後綴（預設 1k 100k）')
+        parser.add_argument('--format', choices=OUTPUT_FORMATS, default='xlsx', help='產生的導入檔案格式（預設 xlsx）')
+        parser.add_argument('--engine', choices=['orm', 'copy'], default='orm', help='寫入方式')
+        parser.add_argument('--chunk-size', type=int, default=50000, help='串流導入每批列數（預設 50000）')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'每批寫入資料庫的筆數（預設 {BATCH_SIZE}）')
+        parser.add_argument('--seed', type=int, default=1, help='產生數據的隨機種子（預設 1）')
+        parser.add_argument('--save', type=str, help='將結果寫入JSON檔案，可作為之後比較的基準')
+        parser.add_argument('--baseline', type=str, help='與基準JSON比較，有退步時以非零狀態結束')
+        parser.add_argument('--threshold', type=float, default=0.2, help='耗時與記憶體容許的增幅（預設 0.2，即 20%%）')
+        parser.description = '''導入導出效能測量
+
+每個列數各建立一個全新的測試資料庫（與執行測試相同，結束後刪除），
+產生訂單、客戶（訂單的 1/5）與產品（訂單的 1/200）並依序測量：
+import_products、import_customers、import_orders 與 export_data，
+各工作表的階段以工作表名稱開頭，如 orders/parse（讀取）、orders/clean（清理驗證）、
+orders/write（寫入）、orders/write/resolve（對應外鍵）與 orders/write/rollup（累加彙總表），
+與基準比較時各階段只比較不含子階段的秒數（自身秒）。
+記憶體為各操作期間行程的最大常駐記憶體（Linux）；其他系統只能取得行程到目前為止的最大值，
+列數由小到大執行，精確的數字請每次只測一個列數。
+
+示例:
+  python manage.py bench                                  # 1k 與 100k 列
+  python manage.py bench --rows 1m --format parquet       # 1M 列（Excel 每張工作表上限約 104 萬列）
+  python manage.py bench --save bench.json                # 儲存基準
+  python manage.py bench --baseline bench.json            # 與基準比較，退步時失敗
+  python manage.py bench --settings=myproject.settings_pg --engine copy  # 在 PostgreSQL 上測量'''
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+        results = {
+            'environment': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'format': options['format'],
+                'engine': options['engine'],
+                'chunk_size': options['chunk_size'],
+                'batch_size': options['batch_size'],
+            },
+            'runs': {},
+        }
+        with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+            for rows in sorted(options['rows']):
+                results['runs'][str(rows)] = self.run(rows, workdir, options)
+
+        if options['save']:
+            with open(options['save'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"結果已寫入 {options['save']}")
+        if baseline:
+            if baseline.get('environment', {}).get('database') != connection.vendor:
+                self.stderr.write(f"基準的資料庫為 {baseline.get('environment', {}).get('database')}，結果可能無法比較")
+            regressions = compare(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError('效能退步：\n  ' + '\n  '.join(regressions))
+            self.stdout.write(self.style.SUCCESS('與基準相比沒有退步'))
+
+    def run(self, rows, workdir, options):
+        """在全新的測試資料庫中測量一個列數，回傳 {操作: 測量結果}"""
+        fmt = options['format']
+        path = os.path.join(workdir, f'bench_{rows}' + ('.xlsx' if fmt == 'xlsx' else ''))
+        started = time.perf_counter()
+        sheets = generate_dataset(max(10, int(rows * PRODUCTS_PER_ORDER)), max(5, int(rows * CUSTOMERS_PER_ORDER)),
+                                  rows, skew=1.0, duplicate_rate=0.01, invalid_rate=0.01, seed=options['seed'])
+        try:
+            save_dataset(sheets, path, fmt)
+        except ValueError as e:
+            raise CommandError(str(e))
+        del sheets
+        self.stdout.write(f'\n{rows} 列（產生 {fmt} 檔案 {time.perf_counter() - started:.1f} 秒）')
+
+        creation = connection.creation
+        test_settings = connection.settings_dict.setdefault('TEST', {})
+        old_test_name = test_settings.get('NAME')
+        if connection.vendor == 'sqlite' and not old_test_name:
+            # 預設的SQLite測試資料庫在記憶體中，改用檔案才能測到實際的寫入成本
+            test_settings['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+        old_name = creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            results = {}
+            for sheet, importer, label in IMPORTERS:
+                source = open_source(path, options['chunk_size'])
+                try:
+                    result = _measure(lambda: importer(source, options['batch_size'], options['chunk_size'],
+                                                       engine=options['engine']))
+                finally:
+                    source.close()
+                results[f'import_{sheet}'] = result
+            export_path = os.path.join(workdir, f'export_{rows}' + ('.xlsx' if fmt == 'xlsx' else ''))
+            # 測量實際產生檔案的成本，不使用也不寫入快取
+            results['export_data'] = _measure(lambda: export_data(export_path, output_format=fmt, use_cache=False))
+        finally:
+            creation.destroy_test_db(old_name, verbosity=0)
+            test_settings['NAME'] = old_test_name
+
+        for operation, result in results.items():
+            self.stdout.write(f"  {operation}（最大記憶體 {result['peak_rss_mb']} MB）")
+            for line in profiling.report_lines(result):
+                self.stdout.write(f'    {line}')
+        return results
@@ -0,0 +1,93 @@
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from data_manager.data_processor import _existing_ids
+from data_manager.models import Product, Customer, Order
+
+# 導入時每批查詢的鍵數量
+LOOKUP_KEYS = 1000
+
+
+def _changelist(params):
+    """以超級使用者身分建立訂單後台列表並取得第一頁，與實際開啟列表頁執行相同的查詢"""
+    request = RequestFactory().get('/admin/data_manager/order/', params)
+    request.user = User(is_active=True, is_staff=True, is_superuser=True)
+    changelist = admin.site._registry[Order].get_changelist_instance(request)
+    return list(changelist.result_list)
+
+def _median_ms(func, repeat):
+    func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+class Command(BaseCommand):
+    help = '測量導入鍵查詢與訂單後台列表的延遲'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help='每項測量的次數，取中位數（預設 5）')
+        parser.add_argument('--compare', action='store_true',
+                            help='同時在交易中暫時移除索引與唯一約束再測一次，結束後復原（測量期間會鎖住資料表）')
+        parser.description = '''索引效能測量
+
+在現有資料上測量，大量資料可先用 generate_data.py 產生再導入。
+
+示例:
+  python manage.py bench_lookups              # 測量目前的延遲
+  python manage.py bench_lookups --compare    # 比較有無索引的延遲'''
+
+    def cases(self):
+        now = timezone.now()
+        week_ago = now - timedelta(days=7)
+        product_keys = [(name,) for name in Product.objects.values_list('name_key', flat=True)[:LOOKUP_KEYS]]
+        customer_keys = list(Customer.objects.values_list('email_key', 'phone_key')[:LOOKUP_KEYS])
+        date_range = {'order_date__gte': week_ago.isoformat(), 'order_date__lt': now.isoformat()}
+        return [
+            ('產品鍵查詢', lambda: _existing_ids(Product, ['name_key'], product_keys)),
+            ('客戶鍵查詢', lambda: _existing_ids(Customer, ['email_key', 'phone_key'], customer_keys)),
+            ('訂單列表', lambda: _changelist({})),
+            ('訂單列表：狀態', lambda: _changelist({'status__exact': 'pending'})),
+            ('訂單列表：日期', lambda: _changelist(date_range)),
+            ('訂單列表：狀態與日期', lambda: _changelist({'status__exact': 'completed', **date_range})),
+            ('待處理訂單', lambda: list(Order.objects.filter(status='pending').order_by('order_date')[:100])),
+        ]
+
+    def measure(self, cases, repeat):
+        return {name: _median_ms(func, repeat) for name, func in cases}
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'訂單 {Order.objects.count()} 筆，客戶 {Customer.objects.count()} 筆，'
+                          f'產品 {Product.objects.count()} 筆')
+        cases = self.cases()
+        after = self.measure(cases, options['repeat'])
+        before = None
+        if options['compare']:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for index in Order._meta.indexes:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(index.name)}')
+                    # SQLite 的唯一約束寫在建表語句中無法移除，只比較訂單索引
+                    if connection.vendor == 'postgresql':
+                        for model in (Product, Customer):
+                            for constraint in model._meta.constraints:
+                                cursor.execute(f'ALTER TABLE {connection.ops.quote_name(model._meta.db_table)} '
+                                               f'DROP CONSTRAINT {connection.ops.quote_name(constraint.name)}')
+                before = self.measure(cases, options['repeat'])
+                transaction.set_rollback(True)
+
+        for name, _ in cases:
+            line = f'{name}：{after[name]:.1f} ms'
+            if before:
+                line = f'{name}：無索引 {before[name]:.1f} ms，有索引 {after[name]:.1f} ms（{before[name] / after[name]:.1f} 倍）'
+            self.stdout.write(line)
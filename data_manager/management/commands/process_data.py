@@ -1,6 +1,16 @@
-from django.core.management.base import BaseCommand
-from data_manager.data_processor import process_data
-from data_manager.models import Product, Customer, Order
+import os
+from contextlib import nullcontext
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+from django.utils import timezone
+from data_manager import profiling, rollups
+from data_manager.batch import expand_sources, process_batch
+from data_manager.data_processor import process_data, BATCH_SIZE
+from data_manager.jobs import claim_job, run_job, worker_alive, worker_name
+from data_manager.models import Order, ImportJob
+from data_manager.purge import PURGE_BATCH_SIZE, purge_all, purge_orders, scoped_orders
 
 class Command(BaseCommand):
     help = '導入或導出Excel數據文件'
@@ -11,17 +21,50 @@ class Command(BaseCommand):
 
         # 導入數據的子命令
         import_parser = subparsers.add_parser('import', help='從Excel文件導入數據')
-        import_parser.add_argument('file', type=str, help='Excel文件路徑')
+        import_parser.add_argument('file', type=str, nargs='+',
+                                   help='Excel文件路徑，或CSV/NDJSON/Parquet/Arrow檔案及存放這些檔案的目錄；'
+                                        '可指定多個檔案、萬用字元（加引號）或存放活頁簿的目錄，以批次導入')
         import_parser.add_argument('--sheet', type=str, choices=['products', 'customers', 'orders'], help='指定要導入的工作表名稱')
         import_parser.add_argument('--export', type=str, help='同時將數據導出到指定Excel文件')
+        import_parser.add_argument('--rejects', type=str, help='將無法導入的列及原因寫入指定文件（.xlsx 每張工作表一個分頁，其他為CSV）')
+        import_parser.add_argument('--chunk-size', type=int, help='以串流模式導入，每次讀取並處理指定列數，記憶體用量固定')
+        import_parser.add_argument('--workers', type=int,
+                                   help='單一檔案：並行導入工作表的執行緒數（預設 1），產品與客戶同時導入，訂單在兩者完成後寫入；'
+                                        '多個檔案：並行解析檔案的行程數（預設為CPU核心數）')
+        import_parser.add_argument('--engine', choices=['orm', 'copy'], default='orm', help='寫入方式：orm - 批次寫入（預設），copy - PostgreSQL COPY 快速寫入，其他資料庫自動改用 orm')
+        import_parser.add_argument('--incremental', action='store_true', help='增量導入：只寫入新的或內容已變更的列，重複導入同一檔案不會重複新增訂單；'
+                                        '只能比對以增量方式導入的訂單，先前以一般方式導入的訂單會再新增一次')
+        import_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'每批寫入資料庫的筆數（預設 {BATCH_SIZE}）')
+        import_parser.add_argument('--atomic', action='store_true', help='全有或全無：所有工作表在同一個交易中導入，任何錯誤都撤銷全部變更')
+        import_parser.add_argument('--resumable', action='store_true',
+                                   help='可續傳：建立導入工作，每批提交時一併記錄檢查點（工作表與已提交列數），中斷後以 --resume 繼續')
+        import_parser.add_argument('--resume', type=int, metavar='JOB_ID', help='從導入工作的檢查點繼續，已提交的列不會重複導入')
 
         # 導出數據的子命令
         export_parser = subparsers.add_parser('export', help='導出數據到Excel文件')
-        export_parser.add_argument('file', type=str, help='Excel文件路徑')
+        export_parser.add_argument('file', type=str, help='Excel文件路徑，csv/parquet/arrow 格式為輸出目錄')
+        export_parser.add_argument('--format', choices=['xlsx', 'csv', 'parquet', 'arrow'],
+                                   help='導出格式，未指定時依副檔名決定（預設 xlsx），parquet 與 arrow 需要安裝 pyarrow')
+        export_parser.add_argument('--no-cache', action='store_true',
+                                   help='重新產生導出檔案，不使用資料未變更時快取的檔案')
+
+        for subparser in (import_parser, export_parser):
+            subparser.add_argument('--profile', action='store_true', help='完成後顯示各階段的耗時、列數與查詢次數')
+            subparser.add_argument('--profile-output', type=str,
+                                   help='將各階段的紀錄寫入檔案：.json 報告、.prom Prometheus 文字格式、.jsonl 每行一個 span')
 
         # 清理數據的子命令
-        clear_parser = subparsers.add_parser('clear', help='清空所有數據')
-        clear_parser.add_argument('--confirm', action='store_true', help='確認刪除操作')
+        clear_parser = subparsers.add_parser('clear', help='清空所有數據，或只刪除符合條件的訂單')
+        clear_parser.add_argument('--confirm', action='store_true', help='確認刪除操作，未指定時只顯示符合條件的筆數')
+        clear_parser.add_argument('--before', type=date.fromisoformat, metavar='YYYY-MM-DD',
+                                  help='只刪除訂單日期早於此日的訂單')
+        clear_parser.add_argument('--status', choices=[value for value, _ in Order._meta.get_field('status').choices],
+                                  help='只刪除此狀態的訂單')
+        clear_parser.add_argument('--job', type=int, metavar='JOB_ID', help='只刪除由此導入工作新增的訂單')
+        clear_parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE,
+                                  help=f'每個交易刪除的筆數（預設 {PURGE_BATCH_SIZE}）')
+        clear_parser.add_argument('--rebuild-rollups', action='store_true',
+                                  help='刪除時不逐批調整彙總表，完成後重建（刪除大部分訂單時較快）')
 
         # 添加通用幫助信息
         parser.description = '''數據處理命令行工具
@@ -29,31 +72,156 @@ class Command(BaseCommand):
 示例:
   python manage.py process_data import data.xlsx            # 導入所有數據
   python manage.py process_data import data.xlsx --sheet products  # 僅導入產品數據
+  python manage.py process_data import data.xlsx --rejects rejects.csv  # 導入並輸出無法導入的列
+  python manage.py process_data import big.xlsx --chunk-size 50000  # 串流導入大型檔案
+  python manage.py process_data import data.xlsx --workers 3  # 並行導入各工作表
+  python manage.py process_data import data.xlsx --engine copy  # 以 PostgreSQL COPY 快速導入
+  python manage.py process_data import daily.xlsx --incremental  # 只導入新的或已變更的列
+  python manage.py process_data import data.xlsx --atomic   # 任何錯誤都撤銷全部變更
+  python manage.py process_data import big.xlsx --chunk-size 50000 --resumable  # 可續傳導入
+  python manage.py process_data import big.xlsx --resume 12  # 從導入工作 #12 的檢查點繼續
+  python manage.py process_data import big.xlsx --chunk-size 50000 --profile  # 顯示各階段耗時
+  python manage.py process_data import big.xlsx --profile-output metrics.prom  # 寫入 Prometheus 文字格式
   python manage.py process_data export output.xlsx         # 導出所有數據
-  python manage.py process_data clear --confirm            # 清空所有數據'''
+  python manage.py process_data export dump --format parquet  # 導出為 dump/ 目錄下每表一個Parquet檔
+  python manage.py process_data export output.xlsx --no-cache  # 不使用快取，重新產生
+  python manage.py process_data import dump                # 導入目錄中的 products/customers/orders 檔案
+  python manage.py process_data import "inbox/*.xlsx" --rejects rejects.csv  # 批次導入多個活頁簿
+  python manage.py process_data import inbox --workers 4    # 批次導入目錄中的活頁簿，以 4 個行程解析
+  python manage.py process_data clear --confirm            # 清空所有數據（PostgreSQL 以 TRUNCATE 完成）
+  python manage.py process_data clear --before 2024-01-01 --status cancelled  # 顯示符合條件的訂單筆數
+  python manage.py process_data clear --before 2024-01-01 --status cancelled --confirm  # 分批刪除
+  python manage.py process_data clear --job 12 --confirm   # 刪除導入工作 #12 新增的訂單'''
 
     def handle(self, *args, **options):
         command = options['command']
+        recorder = None
+        if options.get('profile') or options.get('profile_output'):
+            recorder = profiling.Recorder(spans=str(options.get('profile_output')).endswith('.jsonl'))
         if command == 'import':
-            success, message = process_data(
-                options['file'],
-                output_file=options.get('export'),
-                sheet_to_import=options.get('sheet')
-            )
+            try:
+                sources = expand_sources(options['file'])
+            except ValueError as e:
+                raise CommandError(str(e))
+            resumable = options['resumable'] or options['resume'] is not None
+            if resumable and options['atomic']:
+                raise CommandError('--atomic 不能與 --resumable 或 --resume 同時使用')
+            if resumable and (options['rejects'] or (options['workers'] or 1) > 1):
+                raise CommandError('可續傳導入不支援 --rejects 與 --workers')
+            if len(sources) > 1 and (resumable or options['chunk_size']):
+                raise CommandError('批次導入多個檔案不支援 --chunk-size、--resumable 與 --resume')
+            options['file'] = sources[0]
+            with recorder.activate() if recorder else nullcontext():
+                if len(sources) > 1:
+                    success, message = process_batch(
+                        sources,
+                        sheet=options.get('sheet'),
+                        batch_size=options['batch_size'],
+                        rejects_file=options.get('rejects'),
+                        workers=options['workers'] or min(os.cpu_count() or 1, len(sources)),
+                        engine=options['engine'],
+                        incremental=options['incremental'],
+                        atomic=options['atomic']
+                    )
+                    if success and options['export']:
+                        success, export_message = process_data(None, options['export'])
+                        message = f'{message}\n{export_message}'
+                elif resumable:
+                    success, message = self.import_resumable(options)
+                    if success and options['export']:
+                        success, export_message = process_data(None, options['export'])
+                        message = f'{message}\n{export_message}'
+                else:
+                    success, message = process_data(
+                        options['file'],
+                        output_file=options.get('export'),
+                        sheet_to_import=options.get('sheet'),
+                        batch_size=options['batch_size'],
+                        rejects_file=options.get('rejects'),
+                        chunk_size=options.get('chunk_size'),
+                        workers=options['workers'] or 1,
+                        engine=options['engine'],
+                        incremental=options['incremental'],
+                        atomic=options['atomic']
+                    )
         elif command == 'export':
             file_path = options['file']
-            success, message = process_data(None, file_path)
+            with recorder.activate() if recorder else nullcontext():
+                success, message = process_data(None, file_path, output_format=options.get('format'),
+                                                 use_cache=not options['no_cache'])
         elif command == 'clear':
-            if options['confirm']:
-                Product.objects.all().delete()
-                Customer.objects.all().delete()
-                Order.objects.all().delete()
-                success, message = True, "所有數據已清空"
-            else:
+            scoped = options['before'] or options['status'] or options['job'] is not None
+            orders = scoped_orders(options['before'], options['status'], options['job']) if scoped else None
+            if not options['confirm']:
+                if scoped:
+                    self.stdout.write(f'符合條件的訂單共 {orders.count()} 筆')
                 self.stdout.write(self.style.WARNING('請添加--confirm參數確認執行刪除'))
                 return
+            if scoped:
+                deleted = purge_orders(orders, options['batch_size'], update_rollups=not options['rebuild_rollups'])
+                message = f'已刪除 {deleted} 筆訂單'
+            else:
+                counts = purge_all(options['batch_size'])
+                message = '所有數據已清空'
+                if counts:
+                    message += '（' + '，'.join(f'{name} {count} 筆' for name, count in counts.items()) + '）'
+            if options['rebuild_rollups']:
+                daily, customers = rollups.rebuild()
+                message += f'\n彙總表已重建（每日銷售 {daily} 筆，客戶 {customers} 筆）'
+            success = True
 
         if success:
             self.stdout.write(self.style.SUCCESS(message))
         else:
-            self.stdout.write(self.style.ERROR(message))
\ No newline at end of file
+            self.stdout.write(self.style.ERROR(message))
+        if recorder:
+            if options['profile']:
+                for line in profiling.report_lines(recorder.report()):
+                    self.stdout.write(line)
+            if options['profile_output']:
+                recorder.write(options['profile_output'])
+                self.stdout.write(f"效能紀錄已寫入 {options['profile_output']}")
+
+    def import_resumable(self, options):
+        """以導入工作的檢查點導入，回傳 (是否成功, 訊息)
+
+        每批資料與檢查點在同一個交易中提交，程式被終止時最多只會重做未提交的那一批。
+        """
+        path = os.path.abspath(options['file'])
+        if options['resume'] is None:
+            now = timezone.now()
+            job = ImportJob.objects.create(
+                source_path=path, sheet=options['sheet'] or '',
+                chunk_size=options['chunk_size'] or ImportJob._meta.get_field('chunk_size').default,
+                status='running', started_at=now, heartbeat_at=now, worker=worker_name(),
+                # 中斷的工作不由 run_jobs 重新排隊，而是以 --resume 繼續
+                attempts=1, max_attempts=1
+            )
+        else:
+            job = ImportJob.objects.filter(pk=options['resume']).first()
+            if job is None:
+                raise CommandError(f"找不到導入工作 #{options['resume']}")
+            if os.path.abspath(job.path) != path:
+                raise CommandError(f'導入工作 #{job.pk} 的檔案是 {job.path}')
+            if job.status == 'succeeded':
+                raise CommandError(f'{job} 已完成')
+            statuses = ['queued', 'failed', 'cancelled']
+            if job.status == 'running' and worker_alive(job.worker) is False:
+                statuses.append('running')
+            fields = {'chunk_size': options['chunk_size']} if options['chunk_size'] else {}
+            job = claim_job(ImportJob, job.pk, statuses=statuses, cancel_requested=False,
+                            max_attempts=F('attempts') + 1, **fields)
+            if job is None:
+                raise CommandError(f"導入工作 #{options['resume']} 正在其他行程中執行")
+            self.stdout.write(f'從檢查點繼續：{job.checkpoint or "尚未提交任何批次"}')
+        self.stdout.write(f'{job}，中斷後可用 --resume {job.pk} 繼續')
+
+        try:
+            job = run_job(job, batch_size=options['batch_size'], engine=options['engine'],
+                          incremental=options['incremental'])
+        except KeyboardInterrupt:
+            ImportJob.objects.filter(pk=job.pk).update(status='failed', finished_at=timezone.now(), message='已中斷')
+            raise CommandError(f'已中斷，已提交的批次會保留，可用 --resume {job.pk} 繼續')
+        if job.status == 'succeeded':
+            return True, job.message
+        return False, f'{job.message}\n已提交 {job.rows_processed} 列，可用 --resume {job.pk} 從檢查點繼續'
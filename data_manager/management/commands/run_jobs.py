@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from data_manager.jobs import STALE_AFTER, claim_next_job, requeue_stale_jobs, run_job, worker_name
+from data_manager.uploads import remove_stale_uploads
+
+class Command(BaseCommand):
+    help = '輪詢資料庫執行排隊中的導入與導出工作'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='執行完目前排隊中的工作後結束')
+        parser.add_argument('--poll-interval', type=float, default=2, help='沒有工作時等待的秒數（預設 2）')
+        parser.add_argument('--stale-after', type=int, default=STALE_AFTER,
+                            help=f'執行中的工作超過這個秒數沒有回報即重新排隊（預設 {STALE_AFTER}）')
+        parser.description = '''背景工作執行者
+
+可同時啟動多個執行者，每個工作只會被其中一個執行。
+
+示例:
+  python manage.py run_jobs              # 持續輪詢並執行工作
+  python manage.py run_jobs --once       # 執行完排隊中的工作後結束'''
+
+    def handle(self, *args, **options):
+        worker = worker_name()
+        self.stdout.write(f'執行者 {worker} 已啟動')
+        try:
+            while True:
+                requeue_stale_jobs(options['stale_after'])
+                job = claim_next_job(worker)
+                if job is None:
+                    if options['once']:
+                        return
+                    # 空閒時清理導入API中放棄的上傳
+                    remove_stale_uploads()
+                    time.sleep(options['poll_interval'])
+                    continue
+                self.stdout.write(f'開始執行 {job}')
+                job = run_job(job)
+                style = self.style.SUCCESS if job.status == 'succeeded' else self.style.WARNING
+                self.stdout.write(style(f'{job}：{job.get_status_display()} {job.message}'))
+        except KeyboardInterrupt:
+            self.stdout.write('執行者已停止')
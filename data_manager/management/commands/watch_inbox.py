@@ -0,0 +1,82 @@
+import os
+import signal
+import time
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from data_manager.batch import WorkerPool
+from data_manager.data_processor import BATCH_SIZE, untracked_orders_warning
+from data_manager.inbox import SETTLE_SECONDS, Inbox, import_files
+
+# 一次批次導入的檔案數上限，大量檔案同時放入時分批處理，記憶體用量不隨檔案數增長
+MAX_FILES = 50
+
+class Command(BaseCommand):
+    help = '監看收件目錄，自動導入放入的Excel與CSV檔案'
+
+    def add_arguments(self, parser):
+        parser.add_argument('inbox', type=str, help='收件目錄')
+        parser.add_argument('--done', type=str, help='導入成功的檔案移入的目錄（預設為收件目錄下的 done/）')
+        parser.add_argument('--failed', type=str, help='導入失敗的檔案移入的目錄（預設為收件目錄下的 failed/）')
+        parser.add_argument('--workers', type=int, default=min(os.cpu_count() or 1, 4),
+                            help='並行解析檔案的行程數，行程在處理之間保留（預設為CPU核心數，最多 4）')
+        parser.add_argument('--max-files', type=int, default=MAX_FILES,
+                            help=f'每批導入的檔案數上限（預設 {MAX_FILES}）')
+        parser.add_argument('--poll-interval', type=float, default=2, help='沒有檔案時等待的秒數（預設 2）')
+        parser.add_argument('--settle', type=float, default=SETTLE_SECONDS,
+                            help=f'檔案超過這個秒數沒有修改才視為寫入完成（預設 {SETTLE_SECONDS}）')
+        parser.add_argument('--engine', choices=['orm', 'copy'], default='orm', help='寫入方式，同 process_data import')
+        parser.add_argument('--incremental', action='store_true', help='增量導入，重送的檔案不會重複新增訂單')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help=f'每批寫入資料庫的筆數（預設 {BATCH_SIZE}）')
+        parser.add_argument('--once', action='store_true', help='導入目前已寫入完成的檔案後結束')
+        parser.description = '''收件目錄監看程式
+
+檔案導入後移到 done/ 或 failed/，旁邊的 .json 記錄結果，有被拒絕的列時另有 .rejects.csv。
+CSV 檔名須以工作表名稱開頭，例如 orders-shop01.csv。收到 SIGTERM 或 Ctrl+C 時處理完目前的批次才結束。
+
+示例:
+  python manage.py watch_inbox /srv/inbox                  # 持續監看並導入
+  python manage.py watch_inbox /srv/inbox --incremental --workers 2  # 增量導入，以 2 個行程解析
+  python manage.py watch_inbox /srv/inbox --once           # 導入目前的檔案後結束'''
+
+    def handle(self, *args, **options):
+        inbox = Inbox(options['inbox'], options['done'], options['failed'], options['settle'])
+        recovered = inbox.recover()
+        if recovered:
+            self.stdout.write(self.style.WARNING(f'上次中斷時處理中的 {recovered} 個檔案已移到 {inbox.failed}'))
+
+        stopping = []
+        # 收到 SIGTERM 時不中斷進行中的導入，處理完目前的批次後結束
+        previous = signal.signal(signal.SIGTERM, lambda signum, frame: stopping.append(signum))
+        if options['incremental'] and (warning := untracked_orders_warning()):
+            self.stdout.write(self.style.WARNING(warning))
+        self.stdout.write(f'監看 {inbox.path}')
+        try:
+            with WorkerPool(options['workers']) if options['workers'] > 1 else nullcontext() as pool:
+                while not stopping:
+                    names = inbox.ready()[:options['max_files']]
+                    if not names:
+                        if options['once']:
+                            break
+                        time.sleep(options['poll_interval'])
+                        continue
+                    claimed = [(name, path) for name in names if (path := inbox.claim(name))]
+                    self.stdout.write(f'開始導入 {len(claimed)} 個檔案')
+                    started = time.perf_counter()
+                    # 長時間閒置後資料庫可能已關閉連線
+                    close_old_connections()
+                    manifests = import_files(inbox, claimed, options['batch_size'], options['engine'],
+                                             options['incremental'], pool)
+                    for manifest in manifests:
+                        if manifest['status'] == 'succeeded':
+                            rejected = sum(manifest['rejected'].values())
+                            self.stdout.write(self.style.SUCCESS(f"{manifest['file']}：已導入，拒絕 {rejected} 筆"))
+                        else:
+                            self.stdout.write(self.style.ERROR(f"{manifest['file']}：{manifest['error']}"))
+                    self.stdout.write(f'{len(claimed)} 個檔案處理完成（{time.perf_counter() - started:.1f} 秒）')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+        self.stdout.write('監看程式已停止')
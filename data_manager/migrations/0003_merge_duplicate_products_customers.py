@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:59
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    """新增唯一約束前合併重複的產品與客戶，訂單改指向保留的那一筆"""
+    Product = apps.get_model('data_manager', 'Product')
+    Customer = apps.get_model('data_manager', 'Customer')
+    Order = apps.get_model('data_manager', 'Order')
+
+    duplicates = (Product.objects.values('name')
+                  .annotate(keep_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for row in duplicates:
+        others = Product.objects.filter(name=row['name']).exclude(id=row['keep_id'])
+        Order.objects.filter(product__in=others).update(product_id=row['keep_id'])
+        others.delete()
+
+    duplicates = (Customer.objects.values('email', 'phone')
+                  .annotate(keep_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for row in duplicates:
+        others = (Customer.objects.filter(email=row['email'], phone=row['phone'])
+                  .exclude(id=row['keep_id']))
+        Order.objects.filter(customer__in=others).update(customer_id=row['keep_id'])
+        others.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0002_alter_order_options_alter_product_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0004_customer_unique_customer_email_phone_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', '排隊中'), ('running', '執行中'), ('succeeded', '已完成'), ('failed', '失敗'), ('cancelled', '已取消')], default='queued', max_length=20, verbose_name='狀態')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='創建時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='結束時間')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='最後回報時間')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='執行者')),
+                ('rows_processed', models.BigIntegerField(default=0, verbose_name='已處理筆數')),
+                ('rows_per_second', models.FloatField(default=0, verbose_name='每秒筆數')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='嘗試次數')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='最多嘗試次數')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='已要求取消')),
+                ('message', models.TextField(blank=True, verbose_name='訊息')),
+                ('file', models.FileField(blank=True, upload_to='exports/', verbose_name='Excel文件')),
+            ],
+            options={
+                'verbose_name': '導出工作',
+                'verbose_name_plural': '導出工作',
+                'ordering': ['-created_at'],
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', '排隊中'), ('running', '執行中'), ('succeeded', '已完成'), ('failed', '失敗'), ('cancelled', '已取消')], default='queued', max_length=20, verbose_name='狀態')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='創建時間')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='開始時間')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='結束時間')),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True, verbose_name='最後回報時間')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='執行者')),
+                ('rows_processed', models.BigIntegerField(default=0, verbose_name='已處理筆數')),
+                ('rows_per_second', models.FloatField(default=0, verbose_name='每秒筆數')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='嘗試次數')),
+                ('max_attempts', models.PositiveIntegerField(default=3, verbose_name='最多嘗試次數')),
+                ('cancel_requested', models.BooleanField(default=False, verbose_name='已要求取消')),
+                ('message', models.TextField(blank=True, verbose_name='訊息')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='Excel文件')),
+                ('sheet', models.CharField(blank=True, choices=[('products', 'products'), ('customers', 'customers'), ('orders', 'orders')], max_length=20, verbose_name='工作表')),
+                ('chunk_size', models.PositiveIntegerField(default=10000, verbose_name='每批列數')),
+                ('checkpoint', models.JSONField(blank=True, default=dict, verbose_name='進度檢查點')),
+            ],
+            options={
+                'verbose_name': '導入工作',
+                'verbose_name_plural': '導入工作',
+                'ordering': ['-created_at'],
+                'abstract': False,
+            },
+        ),
+    ]
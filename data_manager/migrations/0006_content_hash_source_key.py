@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0005_importjob_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='內容雜湊'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='內容雜湊'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='source_key',
+            field=models.CharField(blank=True, editable=False, max_length=40, null=True, unique=True, verbose_name='來源識別'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='content_hash',
+            field=models.BigIntegerField(blank=True, editable=False, null=True, verbose_name='內容雜湊'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0006_content_hash_source_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='exportjob',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['created_at'], name='exportjob_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='exportjob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['heartbeat_at'], name='exportjob_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(condition=models.Q(('status', 'queued')), fields=['created_at'], name='importjob_queued_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='importjob',
+            index=models.Index(condition=models.Q(('status', 'running')), fields=['heartbeat_at'], name='importjob_running_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['order_date'], name='order_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['order_date'], name='order_pending_date_idx'),
+        ),
+    ]
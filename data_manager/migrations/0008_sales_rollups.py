@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0007_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerValue',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='data_manager.customer', verbose_name='客户')),
+                ('order_count', models.IntegerField(default=0, verbose_name='訂單數')),
+                ('quantity', models.BigIntegerField(default=0, verbose_name='數量')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='累計消費')),
+                ('first_order_at', models.DateTimeField(blank=True, null=True, verbose_name='首次訂單時間')),
+                ('last_order_at', models.DateTimeField(blank=True, null=True, verbose_name='最近訂單時間')),
+            ],
+            options={
+                'verbose_name': '客戶價值',
+                'verbose_name_plural': '客戶價值',
+                'indexes': [models.Index(fields=['-revenue'], name='customer_value_revenue_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('status', models.CharField(choices=[('pending', '待處理'), ('completed', '已完成'), ('cancelled', '已取消')], max_length=20, verbose_name='狀態')),
+                ('order_count', models.IntegerField(default=0, verbose_name='訂單數')),
+                ('quantity', models.BigIntegerField(default=0, verbose_name='數量')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=16, verbose_name='營業額')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='data_manager.product', verbose_name='產品')),
+            ],
+            options={
+                'verbose_name': '每日銷售彙總',
+                'verbose_name_plural': '每日銷售彙總',
+                'constraints': [models.UniqueConstraint(fields=('date', 'product', 'status'), name='unique_daily_sales')],
+            },
+        ),
+    ]
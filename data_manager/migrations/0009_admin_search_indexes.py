@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:33
+
+from django.db import migrations, models
+
+# (索引名稱, 資料表, 欄位)：後台 icontains 搜尋的欄位，PostgreSQL 上以三元組GIN索引加速
+TRIGRAM_INDEXES = [
+    ('product_name_trgm_idx', 'data_manager_product', 'name'),
+    ('customer_name_trgm_idx', 'data_manager_customer', 'name'),
+    ('customer_email_trgm_idx', 'data_manager_customer', 'email'),
+    ('customer_phone_trgm_idx', 'data_manager_customer', 'phone'),
+    ('customer_address_trgm_idx', 'data_manager_customer', 'address'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    """索引運算式與Django產生的 UPPER(欄位::text) LIKE 條件相同才會被使用
+
+    建立 pg_trgm 擴充功能需要資料庫的相應權限；其他資料庫或未安裝 pg_trgm 時略過，
+    搜尋仍可使用，只是沒有索引。
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin (UPPER({column}::text) gin_trgm_ops)')
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, _, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0008_sales_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['total_price'], name='order_total_price_idx'),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
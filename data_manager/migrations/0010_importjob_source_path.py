@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0009_admin_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='source_path',
+            field=models.CharField(blank=True, editable=False, max_length=500, verbose_name='本機檔案路徑'),
+        ),
+        migrations.AlterField(
+            model_name='importjob',
+            name='file',
+            field=models.FileField(blank=True, upload_to='imports/', verbose_name='Excel文件'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0010_importjob_source_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='import_job',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='data_manager.importjob', verbose_name='導入工作'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0011_order_import_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False, verbose_name='資料表')),
+                ('version', models.BigIntegerField(verbose_name='版本')),
+            ],
+            options={
+                'verbose_name': '資料版本',
+                'verbose_name_plural': '資料版本',
+            },
+        ),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:40
+
+import pandas as pd
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+# 回填比對鍵時每批讀取與更新的筆數
+BACKFILL_BATCH_SIZE = 5000
+
+
+# 比對鍵的計算複製自 data_manager.normalize 在此時的版本：
+# 遷移不引用應用程式的程式碼，之後修改正規化規則不會改變這次回填的結果
+def _text(series):
+    return series.astype('string').str.normalize('NFKC')
+
+def email_keys(series):
+    return _text(series).str.strip().str.lower()
+
+def phone_keys(series):
+    return _text(series).str.replace(r'[^0-9]+', '', regex=True).str.lstrip('0')
+
+def name_keys(series):
+    return _text(series).str.replace(r'\s+', ' ', regex=True).str.strip().str.casefold()
+
+
+def _backfill(schema_editor, model, source_fields, key_functions):
+    """分批讀取原始欄位，以向量化的正規化函數計算比對鍵後以 executemany 寫回"""
+    quote = schema_editor.quote_name
+    key_fields = list(key_functions)
+    sql = (f"UPDATE {quote(model._meta.db_table)} SET {', '.join(f'{quote(field)} = %s' for field in key_fields)} "
+           f"WHERE id = %s")
+    last_id = 0
+    while True:
+        rows = list(model.objects.filter(id__gt=last_id).order_by('id')
+                    .values_list('id', *source_fields)[:BACKFILL_BATCH_SIZE])
+        if not rows:
+            return
+        df = pd.DataFrame(rows, columns=['id', *source_fields])
+        for key_field, (source_field, keys) in key_functions.items():
+            df[key_field] = keys(df[source_field]).fillna('')
+        with schema_editor.connection.cursor() as cursor:
+            cursor.executemany(sql, list(df[[*key_fields, 'id']].astype(object).itertuples(index=False, name=None)))
+        last_id = rows[-1][0]
+
+def _rebuild_rollups(apps, product_ids, customer_ids):
+    """重新計算合併後保留的產品與客戶的彙總列，與 rollups.rebuild 的計算相同"""
+    Order = apps.get_model('data_manager', 'Order')
+    DailySales = apps.get_model('data_manager', 'DailySales')
+    CustomerValue = apps.get_model('data_manager', 'CustomerValue')
+    if product_ids:
+        DailySales.objects.filter(product_id__in=product_ids).delete()
+        rows = (Order.objects.filter(product_id__in=product_ids)
+                .annotate(day=TruncDate('order_date'))
+                .values_list('day', 'product_id', 'status')
+                .annotate(Count('id'), Sum('quantity'), Sum('total_price'))
+                .order_by())
+        DailySales.objects.bulk_create([
+            DailySales(date=day, product_id=product_id, status=status,
+                       order_count=count, quantity=quantity, revenue=revenue)
+            for day, product_id, status, count, quantity, revenue in rows])
+    if customer_ids:
+        CustomerValue.objects.filter(customer_id__in=customer_ids).delete()
+        rows = (Order.objects.filter(customer_id__in=customer_ids)
+                .exclude(status='cancelled')
+                .values_list('customer_id')
+                .annotate(Count('id'), Sum('quantity'), Sum('total_price'), Min('order_date'), Max('order_date'))
+                .order_by())
+        CustomerValue.objects.bulk_create([
+            CustomerValue(customer_id=customer_id, order_count=count, quantity=quantity, revenue=revenue,
+                          first_order_at=first, last_order_at=last)
+            for customer_id, count, quantity, revenue, first, last in rows])
+
+def add_keys(apps, schema_editor):
+    """回填比對鍵，並在新增唯一約束（0014）前合併鍵相同的產品與客戶，訂單改指向保留的那一筆"""
+    Product = apps.get_model('data_manager', 'Product')
+    Customer = apps.get_model('data_manager', 'Customer')
+    Order = apps.get_model('data_manager', 'Order')
+    DataVersion = apps.get_model('data_manager', 'DataVersion')
+
+    _backfill(schema_editor, Product, ['name'], {'name_key': ('name', name_keys)})
+    _backfill(schema_editor, Customer, ['email', 'phone'], {'email_key': ('email', email_keys),
+                                                            'phone_key': ('phone', phone_keys)})
+
+    merged_products = []
+    duplicates = (Product.objects.values('name_key')
+                  .annotate(keep_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for row in duplicates:
+        others = Product.objects.filter(name_key=row['name_key']).exclude(id=row['keep_id'])
+        Order.objects.filter(product__in=others).update(product_id=row['keep_id'])
+        others.delete()
+        merged_products.append(row['keep_id'])
+
+    merged_customers = []
+    duplicates = (Customer.objects.values('email_key', 'phone_key')
+                  .annotate(keep_id=Min('id'), total=Count('id'))
+                  .filter(total__gt=1))
+    for row in duplicates:
+        others = (Customer.objects.filter(email_key=row['email_key'], phone_key=row['phone_key'])
+                  .exclude(id=row['keep_id']))
+        Order.objects.filter(customer__in=others).update(customer_id=row['keep_id'])
+        others.delete()
+        merged_customers.append(row['keep_id'])
+
+    if merged_products or merged_customers:
+        _rebuild_rollups(apps, merged_products, merged_customers)
+        # 刪除所有版本，下次讀取時重新產生，合併前的快取全部失效
+        DataVersion.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0012_data_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='name_key',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='名稱比對鍵'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='email_key',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='電子郵件比對鍵'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_key',
+            field=models.CharField(default='', editable=False, max_length=40, verbose_name='電話比對鍵'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(add_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0013_normalized_keys'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='customer',
+            name='unique_customer_email_phone',
+        ),
+        migrations.RemoveConstraint(
+            model_name='product',
+            name='unique_product_name',
+        ),
+        migrations.AddConstraint(
+            model_name='customer',
+            constraint=models.UniqueConstraint(fields=('email_key', 'phone_key'), name='unique_customer_email_phone_key', violation_error_message='已有電子郵件與電話相同的客戶（忽略大小寫、全形半形與電話中的符號）'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.UniqueConstraint(fields=('name_key',), name='unique_product_name_key', violation_error_message='已有相同名稱的產品（忽略全形半形、大小寫與多餘空白）'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0014_customer_unique_customer_email_phone_key_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='重試時間'),
+        ),
+        migrations.AddField(
+            model_name='importjob',
+            name='run_after',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='重試時間'),
+        ),
+    ]
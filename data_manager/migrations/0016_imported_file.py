@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_manager', '0015_job_run_after'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='檔名')),
+                ('sheet', models.CharField(max_length=20, verbose_name='工作表')),
+                ('fingerprint', models.CharField(max_length=64, verbose_name='檔案指紋')),
+                ('data_version', models.CharField(max_length=16, verbose_name='資料版本')),
+                ('imported_at', models.DateTimeField(auto_now=True, verbose_name='導入時間')),
+            ],
+            options={
+                'verbose_name': '已導入檔案',
+                'verbose_name_plural': '已導入檔案',
+                'constraints': [models.UniqueConstraint(fields=('name', 'sheet'), name='unique_imported_file')],
+            },
+        ),
+    ]
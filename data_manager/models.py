@@ -1,17 +1,41 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 
+from data_manager import normalize
+
 class Product(models.Model):
     name = models.CharField(max_length=100, verbose_name='產品名稱')
     price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='價格')
     stock = models.IntegerField(verbose_name='庫存')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='創建時間')
+    # 導入時該列內容的雜湊，增量導入用來略過未變更的列
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='內容雜湊')
+    # 正規化的名稱，導入時以此去重與比對，忽略全形半形、大小寫與多餘空白（見 data_manager.normalize）
+    name_key = models.CharField(max_length=255, editable=False, verbose_name='名稱比對鍵')
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        self.name_key = normalize.name_key(self.name)
+
+    def validate_constraints(self, exclude=None):
+        # 比對鍵不在後台表單中，驗證名稱時一併檢查比對鍵的唯一約束
+        if exclude and 'name' not in exclude:
+            exclude = set(exclude) - {'name_key'}
+        super().validate_constraints(exclude)
+
+    def save(self, *args, **kwargs):
+        self.name_key = normalize.name_key(self.name)
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = '產品'
         verbose_name_plural = '產品'
+        constraints = [
+            models.UniqueConstraint(fields=['name_key'], name='unique_product_name_key',
+                                    violation_error_message='已有相同名稱的產品（忽略全形半形、大小寫與多餘空白）'),
+        ]
 
 class Customer(models.Model):
     name = models.CharField(max_length=100, verbose_name='客戶名稱')
@@ -19,13 +43,38 @@ class Customer(models.Model):
     phone = models.CharField(max_length=20, verbose_name='電話')
     address = models.TextField(verbose_name='地址')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='創建時間')
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='內容雜湊')
+    # 正規化的電子郵件與電話，導入時以此去重與比對訂單的客戶（見 data_manager.normalize）
+    email_key = models.CharField(max_length=255, editable=False, verbose_name='電子郵件比對鍵')
+    phone_key = models.CharField(max_length=40, editable=False, verbose_name='電話比對鍵')
 
     def __str__(self):
         return self.name
 
+    def _set_keys(self):
+        self.email_key = normalize.email_key(self.email)
+        self.phone_key = normalize.phone_key(self.phone)
+
+    def clean(self):
+        self._set_keys()
+
+    def validate_constraints(self, exclude=None):
+        # 比對鍵不在後台表單中，驗證電子郵件與電話時一併檢查比對鍵的唯一約束
+        if exclude and not {'email', 'phone'} & set(exclude):
+            exclude = set(exclude) - {'email_key', 'phone_key'}
+        super().validate_constraints(exclude)
+
+    def save(self, *args, **kwargs):
+        self._set_keys()
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = '客户'
         verbose_name_plural = '客户'
+        constraints = [
+            models.UniqueConstraint(fields=['email_key', 'phone_key'], name='unique_customer_email_phone_key',
+                                    violation_error_message='已有電子郵件與電話相同的客戶（忽略大小寫、全形半形與電話中的符號）'),
+        ]
 
 class Order(models.Model):
     customer = models.ForeignKey(Customer, on_delete=models.CASCADE, verbose_name='客户')
@@ -38,6 +87,12 @@ class Order(models.Model):
         ('completed', '已完成'),
         ('cancelled', '已取消')
     ], default='pending', verbose_name='狀態')
+    # 增量導入的來源識別：客戶、產品（與訂單日期）的雜湊加上同內容的出現次序
+    source_key = models.CharField(max_length=40, null=True, blank=True, unique=True, editable=False, verbose_name='來源識別')
+    content_hash = models.BigIntegerField(null=True, blank=True, editable=False, verbose_name='內容雜湊')
+    # 由導入工作寫入的訂單記錄來源工作，可用 process_data clear --job 刪除
+    import_job = models.ForeignKey('ImportJob', null=True, blank=True, on_delete=models.SET_NULL, editable=False,
+                                   related_name='orders', verbose_name='導入工作')
 
     def __str__(self):
         return f'{self.customer.name} - {self.product.name}'
@@ -45,3 +100,156 @@ class Order(models.Model):
     class Meta:
         verbose_name = '訂單'
         verbose_name_plural = '訂單'
+        indexes = [
+            # 後台依狀態篩選並依日期排序或篩選日期範圍
+            models.Index(fields=['status', 'order_date'], name='order_status_date_idx'),
+            models.Index(fields=['order_date'], name='order_date_idx'),
+            # 待處理訂單只佔少數，部分索引只收錄這些列
+            models.Index(fields=['order_date'], condition=models.Q(status='pending'),
+                         name='order_pending_date_idx'),
+            # 後台以總價搜尋
+            models.Index(fields=['total_price'], name='order_total_price_idx'),
+        ]
+
+class DailySales(models.Model):
+    """每日各產品各狀態的訂單彙總，由導入流程增量維護，rebuild_rollups 命令可完整重建"""
+    date = models.DateField(verbose_name='日期')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='產品')
+    status = models.CharField(max_length=20, choices=Order._meta.get_field('status').choices, verbose_name='狀態')
+    order_count = models.IntegerField(default=0, verbose_name='訂單數')
+    quantity = models.BigIntegerField(default=0, verbose_name='數量')
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name='營業額')
+
+    def __str__(self):
+        return f'{self.date} {self.product} {self.get_status_display()}'
+
+    class Meta:
+        verbose_name = '每日銷售彙總'
+        verbose_name_plural = '每日銷售彙總'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'product', 'status'], name='unique_daily_sales'),
+        ]
+
+class CustomerValue(models.Model):
+    """每位客戶未取消訂單的累計價值，由導入流程增量維護"""
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, verbose_name='客户')
+    order_count = models.IntegerField(default=0, verbose_name='訂單數')
+    quantity = models.BigIntegerField(default=0, verbose_name='數量')
+    revenue = models.DecimalField(max_digits=16, decimal_places=2, default=0, verbose_name='累計消費')
+    first_order_at = models.DateTimeField(null=True, blank=True, verbose_name='首次訂單時間')
+    last_order_at = models.DateTimeField(null=True, blank=True, verbose_name='最近訂單時間')
+
+    def __str__(self):
+        return str(self.customer)
+
+    class Meta:
+        verbose_name = '客戶價值'
+        verbose_name_plural = '客戶價值'
+        indexes = [
+            models.Index(fields=['-revenue'], name='customer_value_revenue_idx'),
+        ]
+
+class DataVersion(models.Model):
+    """各表的資料版本，寫入時換成新的隨機值，快取以此判斷內容是否過期（見 data_manager.cache）"""
+    name = models.CharField(max_length=100, primary_key=True, verbose_name='資料表')
+    version = models.BigIntegerField(verbose_name='版本')
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
+
+    class Meta:
+        verbose_name = '資料版本'
+        verbose_name_plural = '資料版本'
+
+class ImportedFile(models.Model):
+    """增量導入完成的來源檔案，檔案內容與資料版本都未變更時再次導入會直接略過"""
+    name = models.CharField(max_length=255, verbose_name='檔名')
+    sheet = models.CharField(max_length=20, verbose_name='工作表')
+    fingerprint = models.CharField(max_length=64, verbose_name='檔案指紋')
+    # 導入完成時該工作表與其父表的 cache.version_key，之後有任何寫入都會改變
+    data_version = models.CharField(max_length=16, verbose_name='資料版本')
+    imported_at = models.DateTimeField(auto_now=True, verbose_name='導入時間')
+
+    def __str__(self):
+        return f'{self.name} {self.sheet}'
+
+    class Meta:
+        verbose_name = '已導入檔案'
+        verbose_name_plural = '已導入檔案'
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'sheet'], name='unique_imported_file'),
+        ]
+
+class Job(models.Model):
+    """背景工作的共同欄位，由 run_jobs 命令輪詢資料庫執行"""
+    STATUS_CHOICES = [
+        ('queued', '排隊中'),
+        ('running', '執行中'),
+        ('succeeded', '已完成'),
+        ('failed', '失敗'),
+        ('cancelled', '已取消'),
+    ]
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name='狀態')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='創建時間')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='開始時間')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='結束時間')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='最後回報時間')
+    worker = models.CharField(max_length=100, blank=True, verbose_name='執行者')
+    rows_processed = models.BigIntegerField(default=0, verbose_name='已處理筆數')
+    rows_per_second = models.FloatField(default=0, verbose_name='每秒筆數')
+    attempts = models.PositiveIntegerField(default=0, verbose_name='嘗試次數')
+    max_attempts = models.PositiveIntegerField(default=3, verbose_name='最多嘗試次數')
+    cancel_requested = models.BooleanField(default=False, verbose_name='已要求取消')
+    # 失敗後重新排隊的工作在這個時間之前不會被取出（見 jobs.retry_delay）
+    run_after = models.DateTimeField(null=True, blank=True, verbose_name='重試時間')
+    message = models.TextField(blank=True, verbose_name='訊息')
+
+    class Meta:
+        abstract = True
+        ordering = ['-created_at']
+        indexes = [
+            # claim_next_job 依建立時間取排隊中的工作，requeue_stale_jobs 找心跳逾時的執行中工作
+            models.Index(fields=['created_at'], condition=models.Q(status='queued'),
+                         name='%(class)s_queued_idx'),
+            models.Index(fields=['heartbeat_at'], condition=models.Q(status='running'),
+                         name='%(class)s_running_idx'),
+        ]
+
+class ImportJob(Job):
+    file = models.FileField(upload_to='imports/', blank=True, verbose_name='Excel文件')
+    # process_data import --resumable 直接讀取本機檔案，不上傳
+    source_path = models.CharField(max_length=500, blank=True, editable=False, verbose_name='本機檔案路徑')
+    sheet = models.CharField(max_length=20, blank=True, choices=[
+        ('products', 'products'),
+        ('customers', 'customers'),
+        ('orders', 'orders')
+    ], verbose_name='工作表')
+    chunk_size = models.PositiveIntegerField(default=10000, verbose_name='每批列數')
+    # {工作表名稱: 已提交的列數}，重試時從這裡繼續，已寫入的列不會重複導入
+    checkpoint = models.JSONField(default=dict, blank=True, verbose_name='進度檢查點')
+
+    def __str__(self):
+        return f'導入 #{self.pk} {self.file.name or self.source_path}'
+
+    @property
+    def path(self):
+        return self.source_path or self.file.path
+
+    def clean(self):
+        if not self.file and not self.source_path:
+            raise ValidationError({'file': '請上傳要導入的文件'})
+
+    class Meta(Job.Meta):
+        verbose_name = '導入工作'
+        verbose_name_plural = '導入工作'
+
+class ExportJob(Job):
+    file = models.FileField(upload_to='exports/', blank=True, verbose_name='Excel文件')
+
+    def __str__(self):
+        return f'導出 #{self.pk}'
+
+    class Meta(Job.Meta):
+        verbose_name = '導出工作'
+        verbose_name_plural = '導出工作'
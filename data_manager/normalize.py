@@ -0,0 +1,38 @@
+"""比對客戶與產品用的正規化鍵
+
+導入與後台儲存時由原始值計算，存在 Customer.email_key、phone_key 與 Product.name_key，
+這些欄位有唯一約束；檔案內去重與資料庫比對都以鍵進行，原始值照實保存與顯示。
+
+  email：Unicode NFKC 正規化（全形轉半形）、去除前後空白、轉為小寫
+  電話：NFKC 後只保留數字，並去掉開頭的 0（試算表常把電話存成數字而失去開頭的 0）
+  產品名稱：NFKC、連續空白合併為一個並去除前後空白、casefold
+
+整欄的計算以 pandas 字串方法向量化進行；單一值也經過同一段程式，兩者的結果必定一致。
+"""
+import pandas as pd
+
+
+def _text(series):
+    return series.astype('string').str.normalize('NFKC')
+
+def email_keys(series):
+    return _text(series).str.strip().str.lower()
+
+def phone_keys(series):
+    return _text(series).str.replace(r'[^0-9]+', '', regex=True).str.lstrip('0')
+
+def name_keys(series):
+    return _text(series).str.replace(r'\s+', ' ', regex=True).str.strip().str.casefold()
+
+def _one(keys, value):
+    key = keys(pd.Series([value]))[0]
+    return None if pd.isna(key) else key
+
+def email_key(value):
+    return _one(email_keys, value)
+
+def phone_key(value):
+    return _one(phone_keys, value)
+
+def name_key(value):
+    return _one(name_keys, value)
@@ -0,0 +1,110 @@
+import json
+
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# 以上一頁最後一筆的主鍵繼續往下翻頁的查詢參數
+KEYSET_VAR = 'after'
+
+
+def estimate_count(queryset):
+    """以 PostgreSQL 的統計資訊估計筆數，其他資料庫或沒有統計資訊時回傳None
+
+    沒有篩選條件時讀取 pg_class.reltuples，有篩選條件時取 EXPLAIN 的估計列數。
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(queryset.model._meta.db_table)])
+            row = cursor.fetchone()
+            # 從未 ANALYZE 的資料表為 -1
+            return row[0] if row and row[0] >= 0 else None
+        try:
+            sql, params = queryset.order_by().query.sql_with_params()
+        except EmptyResultSet:
+            # 條件不可能成立（如 pk__in=[]），不需要查詢
+            return 0
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """大量資料時以估計值代替 COUNT(*)，估計值較小時仍精確計數"""
+
+    exact_below = 10000
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < self.exact_below:
+            return super().count
+        self.estimated = True
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    """依主鍵遞減排序時，以 ?after=<主鍵> 接續上一頁，深層頁面不需要 OFFSET 掃過前面的列
+
+    排序為預設（-pk）時頁尾提供「下一頁」連結，使用者自訂排序時只有一般分頁。
+    以 ?after= 接續的頁面沒有頁碼，頁尾只有「第一頁」與「下一頁」連結。
+    """
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # 換頁、篩選或排序時不保留接續位置
+        if new_params and KEYSET_VAR not in new_params:
+            remove = [*(remove or []), KEYSET_VAR]
+        return super().get_query_string(new_params, remove)
+
+    def keyset_enabled(self, request):
+        return (ORDER_VAR not in self.params
+                and not self.model_admin.get_ordering(request)
+                and not self.lookup_opts.ordering)
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_cursor = None
+        self.keyset_page = False
+        if not self.keyset_enabled(request) or (self.show_all and self.can_show_all):
+            return
+        try:
+            after = int(request.GET.get(KEYSET_VAR, ''))
+        except ValueError:
+            after = None
+        if after is not None:
+            self.result_list = self.queryset.filter(pk__lt=after)[:self.list_per_page]
+            self.keyset_page = True
+        self.result_list = list(self.result_list)
+        if len(self.result_list) == self.list_per_page:
+            self.next_cursor = self.result_list[-1].pk
+
+    @property
+    def next_url(self):
+        return self.get_query_string({KEYSET_VAR: self.next_cursor}, [PAGE_VAR])
+
+    @property
+    def first_url(self):
+        return self.get_query_string(remove=[KEYSET_VAR, PAGE_VAR])
+
+
+class HighVolumeAdminMixin:
+    """大量資料的後台列表：估計總筆數、不計算未篩選的總筆數，並支援主鍵接續翻頁"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,244 @@
+"""導入與導出各階段的耗時紀錄
+
+程式碼以 stage() 標記階段，只有在 Recorder.activate() 的範圍內才會記錄，
+其他時候不做任何事。階段可以巢狀，以路徑（如 orders/write/resolve）區分。
+記錄的結果可以輸出為JSON報告、Prometheus 文字格式或 OpenTelemetry 形式的 span。
+"""
+import json
+import secrets
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.db import connection
+
+_recorder = ContextVar('profiling_recorder', default=None)
+_frames = ContextVar('profiling_frames', default=())
+
+# 報告中各階段的欄位
+STAGE_FIELDS = ['calls', 'seconds', 'self_seconds', 'rows_in', 'rows_out', 'queries', 'db_seconds']
+PROMETHEUS_PREFIX = 'data_manager_stage'
+PROMETHEUS_HELP = {
+    'calls': '階段執行次數',
+    'seconds': '階段耗時（含子階段）',
+    'self_seconds': '階段耗時（不含子階段）',
+    'rows_in': '進入階段的列數',
+    'rows_out': '階段產出的列數',
+    'queries': '資料庫查詢次數（含子階段）',
+    'db_seconds': '資料庫查詢耗時（含子階段）',
+}
+
+
+class _Frame:
+    def __init__(self, path, rows_in=0, parent_span=None):
+        self.path = path
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.started = time.perf_counter()
+        self.started_ns = time.time_ns()
+        self.children = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.span_id = secrets.token_hex(8)
+        self.parent_span = parent_span
+
+
+class Recorder:
+    """累計各階段的呼叫次數、耗時、列數、查詢次數與資料庫耗時，以階段路徑為鍵
+
+    各階段記錄的查詢次數與資料庫耗時只含自身，報告中再加總子階段。
+    spans 為 True 時同時保留每次執行的 span。
+    """
+
+    def __init__(self, spans=False):
+        self.stages = {}
+        self.spans = [] if spans else None
+        self.trace_id = secrets.token_hex(16)
+        self.started_at = None
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        token = _recorder.set(self)
+        self.started_at = self.started_at or datetime.now(timezone.utc)
+        started = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.seconds += time.perf_counter() - started
+            _recorder.reset(token)
+
+    def _stage(self, path):
+        return self.stages.setdefault(path, {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0,
+                                             'rows_in': 0, 'rows_out': 0, 'queries': 0, 'db_seconds': 0.0})
+
+    def enter(self, path):
+        """階段開始時登記，報告中的階段依開始順序排列"""
+        with self._lock:
+            self._stage(path)
+
+    def add(self, frame, elapsed):
+        rows_out = frame.rows_in if frame.rows_out is None else frame.rows_out
+        with self._lock:
+            stage = self._stage(frame.path)
+            stage['calls'] += 1
+            stage['seconds'] += elapsed
+            # 並行的子階段加總可能超過父階段的實際耗時
+            stage['self_seconds'] += max(elapsed - frame.children, 0.0)
+            stage['rows_in'] += frame.rows_in
+            stage['rows_out'] += rows_out
+            stage['queries'] += frame.queries
+            stage['db_seconds'] += frame.db_seconds
+            if self.spans is not None:
+                self.spans.append({
+                    'traceId': self.trace_id,
+                    'spanId': frame.span_id,
+                    'parentSpanId': frame.parent_span,
+                    'name': frame.path,
+                    'startTimeUnixNano': frame.started_ns,
+                    'endTimeUnixNano': frame.started_ns + int(elapsed * 1e9),
+                    'attributes': {'rows_in': frame.rows_in, 'rows_out': rows_out,
+                                   'db.queries': frame.queries, 'db.seconds': round(frame.db_seconds, 6)},
+                })
+
+    def total(self, key):
+        return sum(stage[key] for stage in self.stages.values())
+
+    def count_query(self, execute, sql, params, many, context):
+        """connection.execute_wrapper：將查詢計入目前最內層的階段"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            frames = _frames.get()
+            if frames:
+                frames[-1].queries += 1
+                frames[-1].db_seconds += time.perf_counter() - started
+
+    def report(self):
+        """回傳可序列化為JSON的報告，查詢次數與資料庫耗時包含子階段"""
+        stages = {}
+        for path, stage in self.stages.items():
+            subtree = [other for name, other in self.stages.items() if name == path or name.startswith(path + '/')]
+            stages[path] = {
+                'calls': stage['calls'],
+                'seconds': round(stage['seconds'], 4),
+                'self_seconds': round(stage['self_seconds'], 4),
+                'rows_in': stage['rows_in'],
+                'rows_out': stage['rows_out'],
+                'rows_per_second': round(stage['rows_in'] / stage['seconds']) if stage['seconds'] else None,
+                'queries': sum(other['queries'] for other in subtree),
+                'db_seconds': round(sum(other['db_seconds'] for other in subtree), 4),
+            }
+        return {
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'seconds': round(self.seconds, 4),
+            'queries': self.total('queries'),
+            'db_seconds': round(self.total('db_seconds'), 4),
+            'stages': stages,
+        }
+
+    def prometheus(self):
+        """以 Prometheus 文字格式輸出各階段的數值，可交給 node_exporter 的 textfile collector"""
+        stages = self.report()['stages']
+        lines = []
+        for field in STAGE_FIELDS:
+            name = f'{PROMETHEUS_PREFIX}_{field}'
+            lines += [f'# HELP {name} {PROMETHEUS_HELP[field]}', f'# TYPE {name} gauge']
+            lines += [f'{name}{{stage="{path}"}} {stage[field]}' for path, stage in stages.items()]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """依副檔名寫入報告：.prom 為 Prometheus 文字格式，.jsonl 為每行一個 span，其他為JSON報告"""
+        with open(path, 'w', encoding='utf-8') as f:
+            if str(path).endswith('.prom'):
+                f.write(self.prometheus())
+            elif str(path).endswith('.jsonl'):
+                for span in self.spans or []:
+                    f.write(json.dumps(span, ensure_ascii=False) + '\n')
+            else:
+                json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+def active():
+    return _recorder.get() is not None
+
+@contextmanager
+def stage(name, rows_in=0):
+    """標記一個階段，rows_in 為進入此階段的列數
+
+    yield 的 frame 可設定 rows_in 與 rows_out（未設定時與 rows_in 相同），未啟用紀錄時為None。
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        yield None
+        return
+    frames = _frames.get()
+    parent = frames[-1] if frames else None
+    frame = _Frame(f'{parent.path}/{name}' if parent else name, rows_in, parent.span_id if parent else None)
+    recorder.enter(frame.path)
+    token = _frames.set(frames + (frame,))
+    # 每個執行緒的連線只安裝一次，巢狀階段的查詢不會重複計算
+    if recorder.count_query in connection.execute_wrappers:
+        wrapper = None
+    else:
+        wrapper = connection.execute_wrapper(recorder.count_query)
+        wrapper.__enter__()
+    try:
+        yield frame
+    finally:
+        if wrapper:
+            wrapper.__exit__(None, None, None)
+        _frames.reset(token)
+        elapsed = time.perf_counter() - frame.started
+        if parent:
+            parent.children += elapsed
+        recorder.add(frame, elapsed)
+
+def timed_iter(name, chunks):
+    """逐批計時迭代器取得每個DataFrame的時間，例如串流讀取的解析時間"""
+    chunks = iter(chunks)
+    while True:
+        if not active():
+            chunk = next(chunks, None)
+        else:
+            with stage(name) as frame:
+                chunk = next(chunks, None)
+                frame.rows_in = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+def timed_tables(tables):
+    """導出時逐表記錄列數與耗時（含寫入檔案），tables 為 export_tables() 的產出"""
+    for sheet_name, headers, rows in tables:
+        with stage(sheet_name) as frame:
+            yield sheet_name, headers, _counted(rows, frame)
+
+def _counted(rows, frame):
+    for row in rows:
+        frame.rows_in += 1
+        yield row
+
+def _cell(text, width, left=False):
+    """依顯示寬度對齊，中文字佔兩格"""
+    padding = ' ' * max(width - sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in str(text)), 0)
+    return f'{text}{padding}' if left else f'{padding}{text}'
+
+def report_lines(report):
+    """將報告排成表格文字，每行一個階段"""
+    widths = [24, 6, 10, 10, 11, 11, 11, 8, 9]
+    headers = ['階段', '次數', '秒', '自身秒', '輸入列', '輸出列', '列/秒', '查詢', 'DB秒']
+    lines = [''.join(_cell(text, width, i == 0) for i, (text, width) in enumerate(zip(headers, widths)))]
+    for path, stage in report['stages'].items():
+        values = [path, stage['calls'], f"{stage['seconds']:.3f}", f"{stage['self_seconds']:.3f}",
+                  f"{stage['rows_in']:,}", f"{stage['rows_out']:,}",
+                  f"{stage['rows_per_second']:,}" if stage['rows_per_second'] else '-',
+                  stage['queries'], f"{stage['db_seconds']:.3f}"]
+        lines.append(''.join(_cell(value, width, i == 0) for i, (value, width) in enumerate(zip(values, widths))))
+    lines.append(f"共 {report['seconds']:.3f} 秒，查詢 {report['queries']} 次，資料庫 {report['db_seconds']:.3f} 秒")
+    return lines
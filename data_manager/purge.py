@@ -0,0 +1,83 @@
+from datetime import datetime, time
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from data_manager import cache, rollups
+from data_manager.models import Product, Customer, Order, DailySales, CustomerValue
+
+# 每個交易刪除的筆數，避免長時間鎖住資料表或產生過大的交易
+PURGE_BATCH_SIZE = 10000
+# 依外鍵相依順序排列，先刪除參照其他表的資料
+PURGE_MODELS = [DailySales, CustomerValue, Order, Customer, Product]
+
+
+def _delete_ids(model, ids):
+    """以原生 DELETE 刪除指定主鍵的列，不經過 Django 的關聯收集"""
+    table = connection.ops.quote_name(model._meta.db_table)
+    pk = connection.ops.quote_name(model._meta.pk.column)
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {pk} IN ({', '.join(['%s'] * len(ids))})", ids)
+
+def _delete_batches(model, batch_size=PURGE_BATCH_SIZE):
+    """每批取出 batch_size 個主鍵後刪除，直到整張表清空，回傳刪除筆數"""
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(model.objects.order_by().values_list('pk', flat=True)[:batch_size])
+            if ids:
+                _delete_ids(model, ids)
+        deleted += len(ids)
+        if len(ids) < batch_size:
+            return deleted
+
+def purge_all(batch_size=PURGE_BATCH_SIZE):
+    """清空產品、客戶、訂單與彙總表
+
+    PostgreSQL 以一條 TRUNCATE ... RESTART IDENTITY CASCADE 完成，回傳None；
+    其他資料庫依相依順序分批刪除，回傳 {模型名稱: 刪除筆數}。
+    """
+    if connection.vendor == 'postgresql':
+        tables = ', '.join(connection.ops.quote_name(model._meta.db_table) for model in PURGE_MODELS)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {tables} RESTART IDENTITY CASCADE')
+            cache.bump(*PURGE_MODELS)
+        return None
+    counts = {model._meta.model_name: _delete_batches(model, batch_size) for model in PURGE_MODELS}
+    cache.bump(*PURGE_MODELS)
+    return counts
+
+def scoped_orders(before=None, status=None, import_job=None):
+    """符合條件的訂單，條件可以合併
+
+    Args:
+        before: 日期，刪除訂單日期早於此日（依目前時區）的訂單
+        status: 訂單狀態
+        import_job: 導入工作的id，只包含由該工作新增的訂單
+    """
+    orders = Order.objects.all()
+    if before is not None:
+        orders = orders.filter(order_date__lt=timezone.make_aware(datetime.combine(before, time.min)))
+    if status:
+        orders = orders.filter(status=status)
+    if import_job is not None:
+        orders = orders.filter(import_job_id=import_job)
+    return orders
+
+def purge_orders(orders, batch_size=PURGE_BATCH_SIZE, update_rollups=True):
+    """分批刪除 QuerySet 中的訂單，回傳刪除筆數
+
+    每批只取回主鍵，扣除彙總表後以原生 DELETE 刪除，與該批在同一個交易中。
+    update_rollups 為 False 時不調整彙總表，刪除後須執行 rollups.rebuild()。
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            ids = list(orders.order_by().values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return deleted
+            if update_rollups:
+                rollups.remove_orders(ids)
+            _delete_ids(Order, ids)
+            cache.bump(Order)
+        deleted += len(ids)
@@ -0,0 +1,147 @@
+import os
+
+import pandas as pd
+from openpyxl import load_workbook
+
+
+def open_workbook(file_path):
+    """以唯讀模式開啟Excel檔案，工作表內容在讀取時才逐列解析"""
+    return load_workbook(file_path, read_only=True, data_only=True)
+
+def continuation_sheets(sheet_names, sheet_name):
+    """導出時超過Excel列數上限而接續寫入的工作表（orders_2、orders_3……），依序回傳名稱"""
+    names = []
+    while f'{sheet_name}_{len(names) + 2}' in sheet_names:
+        names.append(f'{sheet_name}_{len(names) + 2}')
+    return names
+
+def iter_sheet_chunks(workbook, sheet_name, chunk_size, start=0):
+    """以固定大小的批次逐批讀取工作表，每批為一個DataFrame
+
+    第一列為欄位名稱。DataFrame 的索引從 start（預設 0）起算對應資料列，
+    與 pd.read_excel 相同，因此 Excel 列號為索引 + 2。
+    """
+    rows = workbook[sheet_name].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    # 去掉表頭右側的空白欄
+    columns = list(header)
+    while columns and columns[-1] is None:
+        columns.pop()
+    width = len(columns)
+
+    buffer = []
+    for row in rows:
+        buffer.append(row[:width])
+        if len(buffer) == chunk_size:
+            yield pd.DataFrame(buffer, columns=columns, index=range(start, start + len(buffer)))
+            start += len(buffer)
+            buffer = []
+    if buffer:
+        yield pd.DataFrame(buffer, columns=columns, index=range(start, start + len(buffer)))
+
+# 欄式與文字格式的副檔名，每張工作表存成一個檔案，例如 orders.parquet
+TABLE_FORMATS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson',
+}
+
+def table_format(path):
+    """依副檔名判斷檔案格式，Excel 或無法判斷時回傳 None"""
+    return TABLE_FORMATS.get(os.path.splitext(str(path))[1].lower())
+
+def is_table_source(path):
+    """路徑是否為CSV/NDJSON/Parquet/Arrow檔案，或存放這些檔案的目錄"""
+    return os.path.isdir(path) or table_format(path) is not None
+
+def _indexed(df, start):
+    df.index = range(start, start + len(df))
+    return df
+
+def _read_csv(path, chunk_size, dtype=None):
+    if not chunk_size:
+        yield pd.read_csv(path, encoding='utf-8-sig', dtype=dtype)
+        return
+    yield from pd.read_csv(path, encoding='utf-8-sig', dtype=dtype, chunksize=chunk_size)
+
+def _read_ndjson(path, chunk_size):
+    """每行一個JSON物件；不推斷型別與日期，與CSV相同交由清理與驗證處理"""
+    options = dict(lines=True, dtype=False, convert_dates=False, encoding='utf-8-sig')
+    if not chunk_size:
+        yield pd.read_json(path, **options)
+        return
+    start = 0
+    with pd.read_json(path, chunksize=chunk_size, **options) as reader:
+        for df in reader:
+            yield _indexed(df, start)
+            start += len(df)
+
+def _read_parquet(path, chunk_size):
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    if not chunk_size:
+        yield parquet.read().to_pandas()
+        return
+    start = 0
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        yield _indexed(batch.to_pandas(), start)
+        start += batch.num_rows
+
+def _read_arrow(path, chunk_size):
+    import pyarrow as pa
+
+    # 以記憶體映射開啟，只有轉換成DataFrame的批次會實際讀入
+    with pa.memory_map(str(path)) as source:
+        table = pa.ipc.open_file(source).read_all()
+        if not chunk_size:
+            yield table.to_pandas()
+            return
+        start = 0
+        for batch in table.to_batches(max_chunksize=chunk_size):
+            yield _indexed(batch.to_pandas(), start)
+            start += batch.num_rows
+
+_TABLE_READERS = {
+    'csv': _read_csv,
+    'ndjson': _read_ndjson,
+    'parquet': _read_parquet,
+    'arrow': _read_arrow,
+}
+
+
+class TableFiles:
+    """以CSV、NDJSON、Parquet或Arrow檔案代替活頁簿的導入來源
+
+    目錄中的每個 <工作表名稱>.<副檔名> 檔案為一張工作表；單一檔案時以 sheet
+    或檔名（不含副檔名）為工作表名稱。提供與唯讀活頁簿相同的 sheetnames 與 close()。
+    """
+
+    def __init__(self, path, sheet=None):
+        if os.path.isdir(path):
+            files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+            self.files = {os.path.splitext(os.path.basename(file))[0]: file
+                          for file in files if table_format(file)}
+        else:
+            name = sheet or os.path.splitext(os.path.basename(path))[0]
+            self.files = {name: path}
+        self.sheetnames = list(self.files)
+
+    def iter_chunks(self, sheet_name, chunk_size=None, dtype=None):
+        """逐批讀取工作表，索引從 0 起算，與 iter_sheet_chunks 相同；未指定 chunk_size 時只有一批
+
+        dtype 為 {欄位: 型別}，只用於CSV解析；其他格式保留檔案中記錄的型別。
+        """
+        path = self.files[sheet_name]
+        reader = _TABLE_READERS[table_format(path)]
+        if reader is _read_csv:
+            return reader(path, chunk_size, dtype)
+        return reader(path, chunk_size)
+
+    def close(self):
+        pass
@@ -0,0 +1,171 @@
+from datetime import timedelta
+from itertools import islice
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum, Min, Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from data_manager import cache, profiling
+from data_manager.models import Product, Customer, Order, DailySales, CustomerValue
+
+# 每次彙總的訂單id數量與重建時每批寫入的筆數
+ROLLUP_BATCH_SIZE = 1000
+
+# (模型, 唯一鍵欄位, 累加欄位, 其他欄位)
+DAILY_COLUMNS = (DailySales, ['date', 'product_id', 'status'], ['order_count', 'quantity', 'revenue'], [])
+CUSTOMER_COLUMNS = (CustomerValue, ['customer_id'], ['order_count', 'quantity', 'revenue'],
+                    ['first_order_at', 'last_order_at'])
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def _daily_rows(orders):
+    """在資料庫中依（日期, 產品, 狀態）彙總訂單，日期依目前時區計算"""
+    return (orders.annotate(day=TruncDate('order_date'))
+            .values_list('day', 'product_id', 'status')
+            .annotate(Count('id'), Sum('quantity'), Sum('total_price'))
+            .order_by())
+
+def _customer_rows(orders):
+    """在資料庫中依客戶彙總未取消的訂單"""
+    return (orders.exclude(status='cancelled')
+            .values_list('customer_id')
+            .annotate(Count('id'), Sum('quantity'), Sum('total_price'), Min('order_date'), Max('order_date'))
+            .order_by())
+
+def _upsert(columns, rows, sign):
+    """以 INSERT ... ON CONFLICT 將彙總值累加（sign 為 -1 時扣除）到彙總表，回傳寫入的彙總列
+
+    首次與最近訂單時間只在累加時更新，扣除時由 _refresh_order_times 重新計算。
+    """
+    model, keys, totals, others = columns
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    names = keys + totals + others
+    fields = [model._meta.get_field(name) for name in names]
+    least, greatest = ('MIN', 'MAX') if connection.vendor == 'sqlite' else ('LEAST', 'GREATEST')
+    updates = [f'{quote(name)} = {table}.{quote(name)} + EXCLUDED.{quote(name)}' for name in totals]
+    if sign > 0 and others:
+        updates += [f'first_order_at = {least}({table}.first_order_at, EXCLUDED.first_order_at)',
+                    f'last_order_at = {greatest}({table}.last_order_at, EXCLUDED.last_order_at)']
+    sql = (f"INSERT INTO {table} ({', '.join(quote(name) for name in names)}) "
+           f"VALUES ({', '.join(['%s'] * len(names))}) "
+           f"ON CONFLICT ({', '.join(quote(name) for name in keys)}) DO UPDATE SET {', '.join(updates)}")
+    rows = list(rows)
+    params = []
+    for row in rows:
+        values = list(row[:len(keys)]) + [sign * value for value in row[len(keys):len(keys) + len(totals)]]
+        values += row[len(keys) + len(totals):]
+        params.append([field.get_db_prep_save(value, connection) for field, value in zip(fields, values)])
+    if params:
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, params)
+    return rows
+
+def _refresh_order_times(removed, batch_size):
+    """重新計算仍有訂單的客戶的首次與最近訂單時間，不計入扣除的訂單
+
+    扣除在更新或刪除訂單之前進行，這些訂單仍在資料庫中，須以主鍵排除。
+
+    Args:
+        removed: {客戶id: 扣除的未取消訂單id}
+    """
+    for customers in _batches(removed, batch_size):
+        remaining = list(CustomerValue.objects.filter(pk__in=customers).values_list('pk', flat=True))
+        if not remaining:
+            continue
+        times = (Order.objects.filter(customer_id__in=remaining).exclude(status='cancelled')
+                 .exclude(pk__in=[pk for customer_id in remaining for pk in removed[customer_id]])
+                 .values_list('customer_id').annotate(Min('order_date'), Max('order_date')).order_by())
+        CustomerValue.objects.bulk_update([
+            CustomerValue(customer_id=customer_id, first_order_at=first_order_at, last_order_at=last_order_at)
+            for customer_id, first_order_at, last_order_at in times
+        ], ['first_order_at', 'last_order_at'])
+
+def _apply(order_ids, sign, batch_size):
+    with profiling.stage('rollup', len(order_ids)), transaction.atomic():
+        removed = {}
+        for chunk in _batches(order_ids, batch_size):
+            orders = Order.objects.filter(pk__in=chunk)
+            daily = _upsert(DAILY_COLUMNS, _daily_rows(orders), sign)
+            customers = _upsert(CUSTOMER_COLUMNS, _customer_rows(orders), sign)
+            if sign < 0:
+                # 只檢查這批扣除過的彙總列，以唯一鍵與主鍵的索引查詢，不掃描整張彙總表
+                DailySales.objects.filter(date__in={row[0] for row in daily},
+                                          product_id__in={row[1] for row in daily},
+                                          order_count__lte=0).delete()
+                CustomerValue.objects.filter(pk__in=[row[0] for row in customers], order_count__lte=0).delete()
+                for customer_id, pk in orders.exclude(status='cancelled').values_list('customer_id', 'pk'):
+                    removed.setdefault(customer_id, []).append(pk)
+        if removed:
+            _refresh_order_times(removed, batch_size)
+        cache.bump(DailySales, CustomerValue)
+
+def add_orders(order_ids, batch_size=ROLLUP_BATCH_SIZE):
+    """將已寫入的訂單累加到彙總表，在新增或更新訂單後呼叫"""
+    _apply(order_ids, 1, batch_size)
+
+def remove_orders(order_ids, batch_size=ROLLUP_BATCH_SIZE):
+    """從彙總表扣除訂單目前的值，在更新或刪除訂單前呼叫
+
+    客戶的首次與最近訂單時間以其餘的訂單重新計算。
+    """
+    _apply(order_ids, -1, batch_size)
+
+def rebuild(batch_size=ROLLUP_BATCH_SIZE):
+    """清空彙總表並從全部訂單重新計算，回傳 (每日彙總筆數, 客戶筆數)"""
+    orders = Order.objects.all()
+    with transaction.atomic():
+        DailySales.objects.all().delete()
+        CustomerValue.objects.all().delete()
+        daily = customers = 0
+        for rows in _batches(_daily_rows(orders).iterator(), batch_size):
+            DailySales.objects.bulk_create([
+                DailySales(date=day, product_id=product_id, status=status,
+                           order_count=order_count, quantity=quantity, revenue=revenue)
+                for day, product_id, status, order_count, quantity, revenue in rows
+            ])
+            daily += len(rows)
+        for rows in _batches(_customer_rows(orders).iterator(), batch_size):
+            CustomerValue.objects.bulk_create([
+                CustomerValue(customer_id=customer_id, order_count=order_count, quantity=quantity,
+                              revenue=revenue, first_order_at=first_order_at, last_order_at=last_order_at)
+                for customer_id, order_count, quantity, revenue, first_order_at, last_order_at in rows
+            ])
+            customers += len(rows)
+        cache.bump(DailySales, CustomerValue)
+    return daily, customers
+
+def sales_summary(start=None, end=None, limit=10):
+    """只讀取彙總表回答報表查詢，不掃描訂單表
+
+    結果依彙總表、產品與客戶的資料版本快取，這些表未變更時不查詢彙總表。
+
+    Args:
+        start, end: 日期範圍（含），預設為最近30天
+        limit: 排行榜筆數
+    """
+    end = end or timezone.localdate()
+    start = start or end - timedelta(days=29)
+    return cache.cached(f'sales_summary:{start}:{end}:{limit}', [DailySales, CustomerValue, Product, Customer],
+                        lambda: _sales_summary(start, end, limit))
+
+def _sales_summary(start, end, limit):
+    days = DailySales.objects.filter(date__gte=start, date__lte=end)
+    sold = days.exclude(status='cancelled')
+    totals = dict(order_count=Sum('order_count'), quantity=Sum('quantity'), revenue=Sum('revenue'))
+    return {
+        'start': start,
+        'end': end,
+        'by_status': list(days.values('status').annotate(**totals).order_by('status')),
+        'by_day': list(sold.values('date').annotate(**totals).order_by('date')),
+        'top_products': list(sold.values('product_id', 'product__name').annotate(**totals)
+                             .order_by('-revenue')[:limit]),
+        'top_customers': list(CustomerValue.objects.order_by('-revenue')
+                              .values('customer_id', 'customer__name', 'order_count', 'revenue',
+                                      'first_order_at', 'last_order_at')[:limit]),
+    }
@@ -0,0 +1,101 @@
+"""導入資料的欄位型別
+
+讀取時依工作表指定各欄位的型別，不讓 pandas 逐批推斷：
+文字欄位使用 Arrow 字串（未安裝 pyarrow 時為 pandas 的 string），
+重複值多的欄位（產品名稱、訂單狀態）使用 category，各值只存一份，每列只存整數代碼；
+電話等欄位一律以文字讀取，不會被推斷成數字而失去開頭的 0。
+
+金額在驗證後換算為以最小單位計的 int64（例如價格 12.50 存為 1250），
+寫入時才以整數建立 Decimal，不經過浮點數與字串的轉換。
+"""
+from decimal import Decimal
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+
+from data_manager.models import Product, Order
+
+try:
+    import pyarrow  # noqa: F401
+    STRING = 'string[pyarrow]'
+except ImportError:
+    STRING = 'string'
+
+CATEGORY = 'category'
+
+# 各工作表以文字讀取的欄位及其型別，未列出的欄位（數量、金額、日期）仍由 pandas 推斷
+SHEET_DTYPES = {
+    'products': {'name': STRING},
+    'customers': {'name': STRING, 'email': STRING, 'phone': STRING, 'address': STRING},
+    'orders': {
+        'customer_email': STRING,
+        'customer_phone': STRING,
+        'product_name': CATEGORY,
+        'status': CATEGORY,
+    },
+}
+
+# 各工作表的金額欄位及小數位數，與模型的 DecimalField 一致
+MONEY_COLUMNS = {
+    'products': {'price': Product._meta.get_field('price').decimal_places},
+    'customers': {},
+    'orders': {'total_price': Order._meta.get_field('total_price').decimal_places},
+}
+_MONEY_PLACES = {column: places for columns in MONEY_COLUMNS.values() for column, places in columns.items()}
+
+
+def is_category(series):
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+def text(series):
+    """轉為字串欄位，整數型的浮點數（如電話號碼）不保留 .0"""
+    if pd.api.types.is_float_dtype(series):
+        values = series.dropna()
+        if (values == values.round()).all():
+            series = series.astype('Int64')
+    return series.astype(STRING)
+
+def map_categories(series, func):
+    """對類別欄位的每個類別套用 func（接收並回傳 Series），依代碼對應回各列
+
+    結果仍是類別欄位；對應後相同的類別合併，對應為缺失值的列成為缺失值。
+    """
+    mapped = pd.Categorical(func(pd.Series(series.cat.categories)))
+    codes = series.cat.codes.to_numpy()
+    codes = np.where(codes >= 0, mapped.codes.take(codes), -1)
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=mapped.dtype), index=series.index, name=series.name)
+
+def read_dtypes(sheet_name):
+    """傳給 pd.read_csv 的 dtype，讀取時就建立指定型別的欄位"""
+    return dict(SHEET_DTYPES.get(sheet_name, {}))
+
+def apply(df, sheet_name):
+    """將讀入的批次轉為工作表指定的型別，已是該型別的欄位不會複製"""
+    for column, dtype in SHEET_DTYPES.get(sheet_name, {}).items():
+        if column not in df.columns:
+            continue
+        series = df[column]
+        if dtype == CATEGORY:
+            if not is_category(series):
+                df[column] = text(series).astype(CATEGORY)
+        elif series.dtype != dtype:
+            df[column] = text(series)
+    return df
+
+def scale_money(df, sheet_name):
+    """將已驗證的金額欄位換算為以最小單位計的 int64"""
+    for column, places in MONEY_COLUMNS[sheet_name].items():
+        df[column] = np.round(df[column].to_numpy(dtype=float) * 10 ** places).astype('int64')
+    return df
+
+def unscale_money(df):
+    """將已換算的金額欄位還原為元，用於拒絕報告"""
+    for column, places in _MONEY_PLACES.items():
+        if column in df.columns and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column] / 10 ** places
+    return df
+
+def decimals(series, places):
+    """將以最小單位計的整數欄位轉為 Decimal 列表，整欄一次轉換"""
+    return list(map(Decimal.scaleb, map(Decimal, series.tolist()), repeat(-places)))
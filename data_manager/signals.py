@@ -0,0 +1,32 @@
+"""在後台或程式中以ORM儲存、刪除資料時更換資料版本（見 data_manager.cache）
+
+導入與清除數據不經過這些信號，由各自的流程更換版本。
+訂單刻意不接收 post_delete：有接收者時 Django 會逐筆取出訂單再刪除，
+刪除產品或客戶時連帶的大量訂單會因此變慢；刪除訂單的後台動作自行更換版本。
+連帶刪除的訂單在刪除產品或客戶之前從彙總表扣除。
+"""
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from data_manager import cache, rollups
+from data_manager.models import Product, Customer, Order, DailySales, CustomerValue
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Customer)
+@receiver(post_save, sender=Order)
+def data_saved(sender, **kwargs):
+    cache.bump(sender)
+
+@receiver(pre_delete, sender=Product)
+@receiver(pre_delete, sender=Customer)
+def orders_cascading(sender, instance, **kwargs):
+    # 與刪除在同一個交易中，刪除失敗時扣除也會撤銷
+    field = 'product' if sender is Product else 'customer'
+    rollups.remove_orders(list(Order.objects.filter(**{field: instance}).values_list('pk', flat=True)))
+
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Customer)
+def data_deleted(sender, **kwargs):
+    # 連帶刪除的訂單與彙總列不會各自觸發信號
+    cache.bump(sender, Order, DailySales, CustomerValue)
@@ -0,0 +1,122 @@
+import asyncio
+import queue
+import threading
+from itertools import takewhile
+
+from django.db import connections
+
+from data_manager.exporters import write_xlsx
+
+# 每個傳送給客戶端的區塊大小
+STREAM_CHUNK_SIZE = 64 * 1024
+# 生產者最多預先產生的區塊數，超過時等待客戶端讀取
+STREAM_QUEUE_SIZE = 16
+
+_DONE = object()
+
+
+class _QueueWriter:
+    """將寫入的位元組切成固定大小的區塊放入佇列的檔案物件
+
+    不提供 tell()/seek()，zipfile 會以不可定位的串流模式寫入，
+    工作表XML壓縮後的位元組隨資料列產生陸續放入佇列。
+    """
+
+    def __init__(self, chunks, cancelled):
+        self._chunks = chunks
+        self._cancelled = cancelled
+        self._buffer = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= STREAM_CHUNK_SIZE:
+            self._put(bytes(self._buffer[:STREAM_CHUNK_SIZE]))
+            del self._buffer[:STREAM_CHUNK_SIZE]
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+
+    def _put(self, item):
+        # 客戶端已中斷時直接丟棄，讓活頁簿正常收尾而不是在寫入中途拋出例外
+        while not self._cancelled.is_set():
+            try:
+                self._chunks.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def _until_cancelled(tables, cancelled):
+    """客戶端中斷後不再讀取剩餘的資料列"""
+    for sheet_name, headers, rows in tables:
+        yield sheet_name, headers, takewhile(lambda _: not cancelled.is_set(), rows)
+
+def _produce(tables_factory, chunks, cancelled):
+    """在背景執行緒中產生活頁簿，完成或失敗時放入結束標記"""
+    writer = _QueueWriter(chunks, cancelled)
+    try:
+        write_xlsx(writer, _until_cancelled(tables_factory(), cancelled))
+        writer.flush()
+        writer._put(_DONE)
+    except Exception as e:
+        writer._put(e)
+    finally:
+        # 背景執行緒有自己的資料庫連線，結束時關閉
+        connections.close_all()
+
+def _start(tables_factory):
+    chunks = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    cancelled = threading.Event()
+    threading.Thread(target=_produce, args=(tables_factory, chunks, cancelled), daemon=True).start()
+    return chunks, cancelled
+
+def _unwrap(item):
+    if isinstance(item, Exception):
+        raise item
+    return item
+
+def stream_xlsx(tables_factory):
+    """邊產生邊傳送Excel內容的同步迭代器，供 StreamingHttpResponse 使用
+
+    Args:
+        tables_factory: 回傳 export_tables() 格式資料的函數，在背景執行緒中呼叫
+    """
+    chunks, cancelled = _start(tables_factory)
+    try:
+        while True:
+            item = _unwrap(chunks.get())
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        cancelled.set()
+
+async def astream_xlsx(tables_factory):
+    """stream_xlsx 的非同步版本，在ASGI下不佔用事件迴圈也不需緩衝全部內容"""
+    chunks, cancelled = _start(tables_factory)
+    try:
+        while True:
+            item = _unwrap(await asyncio.to_thread(chunks.get))
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        cancelled.set()
+
+def stream_file(path):
+    """逐區塊讀取檔案（如快取的導出檔案）的同步迭代器"""
+    with open(path, 'rb') as file:
+        while chunk := file.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+async def astream_file(path):
+    """stream_file 的非同步版本，讀取在執行緒中進行"""
+    file = await asyncio.to_thread(open, path, 'rb')
+    try:
+        while chunk := await asyncio.to_thread(file.read, STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file.close()
@@ -1,3 +1,1208 @@
-from django.test import TestCase
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from io import BytesIO, StringIO
+from itertools import product
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pandas as pd
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from data_manager import cache, data_processor, jobs, normalize, profiling, rollups, uploads
+from data_manager.batch import import_batch
+from data_manager.data_processor import import_customers, import_orders, import_products, open_source, process_data
+from data_manager.exporters import export_tables, write_xlsx
+from data_manager.generators import generate_dataset
+from data_manager.inbox import Inbox
+from data_manager.management.commands import bench
+from data_manager.models import Customer, CustomerValue, DailySales, ImportJob, Order, Product
+from data_manager.streaming import stream_xlsx
+from data_manager.validation import validate
+
+
+def products_sheet(*rows):
+    """產品工作表，每列為 (名稱, 價格, 庫存)"""
+    return pd.DataFrame(rows, columns=['name', 'price', 'stock'])
+
+def customers_sheet(*rows):
+    """客戶工作表，每列為 (姓名, 電子郵件, 電話, 地址)"""
+    return pd.DataFrame(rows, columns=['name', 'email', 'phone', 'address'])
+
+def orders_sheet(quantities, email='amy@example.com', phone='0912345678', product='綠茶',
+                 order_date='2026-01-02 10:00:00', unit_price=10):
+    """同一客戶、產品與日期的訂單，數量依 quantities，總價為數量乘以單價"""
+    return pd.DataFrame({
+        'customer_email': email,
+        'customer_phone': phone,
+        'product_name': product,
+        'quantity': list(quantities),
+        'total_price': [quantity * unit_price for quantity in quantities],
+        'status': 'pending',
+        'order_date': order_date,
+    })
+
+
+class ImportTestCase(TestCase):
+    """先建立一個產品與一個客戶，供訂單對應"""
+
+    def setUp(self):
+        import_products({'products': products_sheet(('綠茶', 10, 100))})
+        import_customers({'customers': customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北'))})
+
+    def quantities(self):
+        return sorted(Order.objects.values_list('quantity', flat=True))
+
+
+class IncrementalResumeTests(ImportTestCase):
+
+    def test_resume_after_crash_keeps_committed_orders(self):
+        """整批已提交的批次仍計入出現次序，繼續時不會覆寫已提交的訂單"""
+        source = {'orders': orders_sheet(range(1, 11))}
+
+        def crash(sheet_name, rows_read, rows):
+            if rows_read > 5:
+                raise RuntimeError('中斷')
+
+        with self.assertRaises(RuntimeError):
+            import_orders(source, chunk_size=5, on_chunk=crash, incremental=True)
+        self.assertEqual(self.quantities(), [1, 2, 3, 4, 5])
+
+        inserted, updated, rejects = import_orders(source, chunk_size=5, skip_rows=5, incremental=True)
+        self.assertEqual((inserted, updated, len(rejects)), (5, 0, 0))
+        self.assertEqual(self.quantities(), list(range(1, 11)))
+
+        # 再次增量導入整個檔案不會寫入任何訂單
+        inserted, updated, _ = import_orders(source, chunk_size=5, incremental=True)
+        self.assertEqual((inserted, updated), (0, 0))
+        self.assertEqual(Order.objects.count(), 10)
+
+
+class EmptySheetTests(ImportTestCase):
+
+    def test_header_only_sheet(self):
+        """只有標題列的工作表不寫入任何資料，整張讀取與分批讀取都一樣"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'empty.xlsx')
+        orders_sheet([]).to_excel(path, sheet_name='orders', index=False)
+        for chunk_size in (None, 5):
+            with self.subTest(chunk_size=chunk_size):
+                inserted, updated, rejects = import_orders(open_source(path, chunk_size), chunk_size=chunk_size)
+                self.assertEqual((inserted, updated, len(rejects)), (0, 0, 0))
+        self.assertEqual(Order.objects.count(), 0)
+
+class ValidationTests(ImportTestCase):
+    """向量化驗證：拒絕的原因與Excel列號，寫入時找不到客戶或產品的列"""
+
+    def sheet(self):
+        return pd.DataFrame({
+            'customer_email': ['amy@example.com', 'not-an-email', '', 'amy@example.com'],
+            'customer_phone': '0912345678',
+            'product_name': '綠茶',
+            'quantity': [1, 1.5, 'abc', 2],
+            'total_price': [10, 10.001, 10, 123456789],
+            'status': ['pending', 'pending', 'shipped', 'completed'],
+        })
+
+    def test_reject_reasons(self):
+        """每列列出所有不合格的原因，row 為Excel列號"""
+        valid, rejects = validate(self.sheet(), 'orders')
+        self.assertEqual(list(valid.index), [0])
+        self.assertEqual(dict(zip(rejects['row'], rejects['reason'])), {
+            3: 'customer_email 電子郵件格式錯誤；quantity 不是整數；total_price 超過 2 位小數',
+            4: 'customer_email 缺少值；quantity 不是數字；status 不是有效選項',
+            5: 'total_price 超過 8 位整數',
+        })
+
+    def test_import_writes_valid_rows_and_returns_rejects(self):
+        inserted, updated, rejects = import_orders({'orders': self.sheet()})
+        self.assertEqual((inserted, updated), (1, 0))
+        self.assertEqual(list(rejects['row']), [3, 4, 5])
+        self.assertEqual(self.quantities(), [1])
+
+    def test_unknown_customer_and_product(self):
+        """格式正確但找不到客戶或產品的列在寫入時拒絕"""
+        df = pd.concat([orders_sheet([1]), orders_sheet([2], email='bob@example.com'),
+                        orders_sheet([3], product='紅茶')], ignore_index=True)
+        inserted, _, rejects = import_orders({'orders': df})
+        self.assertEqual(inserted, 1)
+        self.assertEqual(dict(zip(rejects['row'], rejects['reason'])), {3: '找不到客戶', 4: '找不到產品'})
+
+    def test_missing_column(self):
+        with self.assertRaisesRegex(ValueError, 'status'):
+            validate(self.sheet().drop(columns=['status']), 'orders')
+
+
+class IncrementalImportTests(ImportTestCase):
+    """增量導入：source_key 的出現次序、跨檔案的來源識別、就地更新與略過未變更的列"""
+
+    def test_same_customer_product_and_date_get_separate_source_keys(self):
+        """客戶、產品與日期相同的訂單以出現次序區分，重複導入不會新增"""
+        source = {'orders': orders_sheet([2, 1, 3])}
+        self.assertEqual(import_orders(source, incremental=True)[:2], (3, 0))
+        keys = list(Order.objects.values_list('source_key', flat=True))
+        self.assertEqual(len(set(keys)), 3)
+        self.assertEqual(import_orders(source, incremental=True)[:2], (0, 0))
+        self.assertEqual(sorted(Order.objects.values_list('source_key', flat=True)), sorted(keys))
+
+    def test_changed_order_is_updated_in_place(self):
+        import_orders({'orders': orders_sheet([1, 2, 3])}, incremental=True)
+        before = dict(Order.objects.values_list('source_key', 'content_hash'))
+        ids = sorted(Order.objects.values_list('id', flat=True))
+
+        changed = orders_sheet([1, 5, 3])
+        inserted, updated, _ = import_orders({'orders': changed}, incremental=True)
+        self.assertEqual((inserted, updated), (0, 1))
+        self.assertEqual(sorted(Order.objects.values_list('id', flat=True)), ids)
+        self.assertEqual(self.quantities(), [1, 3, 5])
+        after = dict(Order.objects.values_list('source_key', 'content_hash'))
+        self.assertEqual(after.keys(), before.keys())
+        self.assertEqual(sum(before[key] != after[key] for key in before), 1)
+
+    def test_warns_about_orders_without_source_key(self):
+        """一般導入的訂單沒有來源識別，之後的增量導入會提醒會重複新增"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'orders.csv')
+        orders_sheet([1, 2]).to_csv(path, index=False)
+
+        success, message = process_data(path, sheet_to_import='orders', incremental=True)
+        self.assertTrue(success)
+        self.assertNotIn('沒有來源識別', message)
+
+        Order.objects.all().delete()
+        process_data(path, sheet_to_import='orders')
+        success, message = process_data(path, sheet_to_import='orders', incremental=True)
+        self.assertTrue(success)
+        self.assertIn('資料庫中有 2 筆訂單沒有來源識別', message)
+        self.assertEqual(Order.objects.count(), 4)
+
+    def test_files_with_same_customer_and_product_keep_their_orders(self):
+        """不同檔案中同一客戶與產品的訂單不會互相覆蓋，重送同一檔案才會就地更新"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        day1 = os.path.join(directory.name, 'day1.csv')
+        day2 = os.path.join(directory.name, 'day2.csv')
+        orders_sheet([1]).to_csv(day1, index=False)
+        orders_sheet([2]).assign(status='completed').to_csv(day2, index=False)
+
+        for path in (day1, day2):
+            success, message = process_data(path, sheet_to_import='orders', incremental=True)
+            self.assertTrue(success, message)
+        self.assertEqual(sorted(Order.objects.values_list('quantity', 'status')),
+                         [(1, 'pending'), (2, 'completed')])
+
+        orders_sheet([3]).to_csv(day1, index=False)
+        process_data(day1, sheet_to_import='orders', incremental=True)
+        self.assertEqual(sorted(Order.objects.values_list('quantity', 'status')),
+                         [(2, 'completed'), (3, 'pending')])
+
+    def test_unchanged_file_is_skipped(self):
+        """檔案與資料都未變更時不讀取檔案；資料變更後仍逐列比對，刪除的訂單會重新導入"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'orders.csv')
+        orders_sheet([1, 2]).to_csv(path, index=False)
+        process_data(path, sheet_to_import='orders', incremental=True)
+
+        with mock.patch('data_manager.data_processor.open_source') as open_source_mock:
+            success, message = process_data(path, sheet_to_import='orders', incremental=True)
+        self.assertTrue(success)
+        self.assertIn('訂單數據未變更，略過導入', message)
+        open_source_mock.assert_not_called()
+
+        # 與後台刪除訂單的動作相同，刪除後更換資料版本
+        Order.objects.filter(quantity=2).delete()
+        cache.bump(Order)
+        success, message = process_data(path, sheet_to_import='orders', incremental=True)
+        self.assertIn('新增 1 筆', message)
+        self.assertEqual(self.quantities(), [1, 2])
+
+    def test_products_and_customers_skip_unchanged_rows(self):
+        products = {'products': products_sheet(('綠茶', 10, 100), ('紅茶', 20, 50))}
+        # 綠茶與已導入的內容相同
+        self.assertEqual(import_products(products, incremental=True)[:2], (1, 0))
+        self.assertEqual(import_products(products, incremental=True)[:2], (0, 0))
+        products = {'products': products_sheet(('綠茶', 10, 100), ('紅茶', 25, 50))}
+        self.assertEqual(import_products(products, incremental=True)[:2], (0, 1))
+        self.assertEqual(Product.objects.get(name='紅茶').price, 25)
+
+        customers = {'customers': customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北'))}
+        self.assertEqual(import_customers(customers, incremental=True)[:2], (0, 0))
+        customers = {'customers': customers_sheet(('Amy', 'amy@example.com', '0912345678', '新竹'))}
+        self.assertEqual(import_customers(customers, incremental=True)[:2], (0, 1))
+        self.assertEqual(import_customers(customers, incremental=True)[:2], (0, 0))
+
+
+class RollupTests(ImportTestCase):
+    """彙總表的增量維護：與完整重建的結果相同，刪除產品或客戶時扣除連帶刪除的訂單"""
+
+    def snapshot(self):
+        return (sorted(DailySales.objects.values_list('date', 'product_id', 'status', 'order_count',
+                                                      'quantity', 'revenue')),
+                sorted(CustomerValue.objects.values_list('customer_id', 'order_count', 'quantity', 'revenue',
+                                                         'first_order_at', 'last_order_at')))
+
+    def test_incremental_maintenance_matches_rebuild(self):
+        """導入、增量更新與新增訂單後的彙總表與完整重建的結果相同"""
+        import_products({'products': products_sheet(('紅茶', 20, 50))})
+        import_customers({'customers': customers_sheet(('Bob', 'bob@example.com', '0922333444', '台中'))})
+        first = pd.concat([orders_sheet([1, 2, 3]), orders_sheet([4], product='紅茶', unit_price=20),
+                           orders_sheet([5], email='bob@example.com', phone='0922333444')], ignore_index=True)
+        import_orders({'orders': first}, incremental=True)
+
+        # 數量變更、狀態改為已取消，並新增一筆
+        second = first.copy()
+        second.loc[0, ['quantity', 'total_price']] = [6, 60]
+        second.loc[4, 'status'] = 'cancelled'
+        second = pd.concat([second, orders_sheet([7], email='bob@example.com', phone='0922333444')],
+                           ignore_index=True)
+        self.assertEqual(import_orders({'orders': second}, incremental=True)[:2], (1, 2))
+
+        maintained = self.snapshot()
+        self.assertTrue(maintained[0] and maintained[1])
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), maintained)
+
+    def test_deleting_product_or_customer_removes_cascaded_orders(self):
+        """刪除產品或客戶時連帶刪除的訂單從彙總表扣除，歸零的彙總列一併刪除"""
+        import_products({'products': products_sheet(('紅茶', 20, 50))})
+        import_customers({'customers': customers_sheet(('Bob', 'bob@example.com', '0922333444', '台中'))})
+        import_orders({'orders': pd.concat([
+            orders_sheet([1, 2]), orders_sheet([3], product='紅茶', unit_price=20),
+            orders_sheet([4], email='bob@example.com', phone='0922333444', product='紅茶', unit_price=20),
+        ], ignore_index=True)})
+
+        def totals():
+            return (sorted(DailySales.objects.values_list('product__name', 'order_count', 'quantity', 'revenue')),
+                    sorted(CustomerValue.objects.values_list('customer__name', 'order_count', 'quantity', 'revenue')))
+
+        Product.objects.get(name='紅茶').delete()
+        self.assertEqual(totals(), ([('綠茶', 2, 3, 30)], [('Amy', 2, 3, 30)]))
+        Customer.objects.get(name='Amy').delete()
+        self.assertEqual(totals(), ([], []))
+
+    def test_removing_orders_recomputes_order_times(self):
+        """扣除客戶最早與最近的訂單後，首次與最近訂單時間改以其餘的訂單計算"""
+        import_orders({'orders': orders_sheet([1, 2, 3, 4])})
+        for quantity, day in zip([1, 2, 3, 4], [5, 1, 9, 3]):
+            Order.objects.filter(quantity=quantity).update(order_date=timezone.make_aware(datetime(2024, 3, day)))
+        rollups.rebuild()
+
+        removed = list(Order.objects.filter(quantity__in=[2, 3]).values_list('pk', flat=True))
+        rollups.remove_orders(removed, batch_size=1)
+        Order.objects.filter(pk__in=removed).delete()
+        value = CustomerValue.objects.get()
+        self.assertEqual((value.order_count, timezone.localtime(value.first_order_at).day,
+                          timezone.localtime(value.last_order_at).day), (2, 3, 5))
+        maintained = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), maintained)
+
+
+class NormalizedKeyTests(ImportTestCase):
+    """正規化比對鍵：寫法不同的電子郵件、電話與名稱對應到同一筆資料"""
+
+    def test_keys(self):
+        self.assertEqual(list(normalize.email_keys(pd.Series([' AMY@Example.COM ', 'ａｍｙ＠example.com']))),
+                         ['amy@example.com', 'amy@example.com'])
+        self.assertEqual(list(normalize.phone_keys(pd.Series(['0912-345-678', '(09) 1234 5678', 912345678]))),
+                         ['912345678', '912345678', '912345678'])
+        self.assertEqual(list(normalize.name_keys(pd.Series(['  Green   Tea ', 'ＧＲＥＥＮ tea']))),
+                         ['green tea', 'green tea'])
+
+    def test_differently_formatted_keys_match_existing_rows(self):
+        """格式不同的電子郵件、電話與產品名稱對應到同一個客戶與產品"""
+        inserted, updated, _ = import_customers({'customers': customers_sheet(
+            ('Amy', ' AMY@Example.com', '0912-345-678', '高雄'))})
+        self.assertEqual((inserted, updated), (0, 1))
+        self.assertEqual(list(Customer.objects.values_list('address', flat=True)), ['高雄'])
+
+        import_products({'products': products_sheet(('Green Tea', 30, 10))})
+        self.assertEqual(import_products({'products': products_sheet(('ＧＲＥＥＮ  tea', 35, 10))})[:2], (0, 1))
+
+        orders = pd.concat([orders_sheet([1], email='Amy@EXAMPLE.com', phone='912345678'),
+                            orders_sheet([2], product=' green TEA ', unit_price=35)], ignore_index=True)
+        inserted, _, rejects = import_orders({'orders': orders})
+        self.assertEqual((inserted, len(rejects)), (2, 0))
+        self.assertEqual(Customer.objects.count(), 1)
+        self.assertEqual(sorted(Order.objects.values_list('product__name', flat=True)), ['Green Tea', '綠茶'])
+
+
+class BatchImportTests(TestCase):
+    """多檔案批次導入：產品與客戶以較晚的檔案為準，訂單依檔案順序，增量導入以檔名區分來源"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def workbook(self, name, products, customers, orders):
+        path = os.path.join(self.path, name)
+        with pd.ExcelWriter(path) as writer:
+            products.to_excel(writer, sheet_name='products', index=False)
+            customers.to_excel(writer, sheet_name='customers', index=False)
+            orders.to_excel(writer, sheet_name='orders', index=False)
+        return path
+
+    def test_later_files_win_and_orders_keep_file_order(self):
+        """合併寫入的產品與客戶以較晚的檔案為準，訂單依檔案順序寫入"""
+        first = self.workbook('1.xlsx', products_sheet(('綠茶', 10, 100), ('紅茶', 20, 50)),
+                              customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北')),
+                              pd.concat([orders_sheet([1]), orders_sheet([2], product='紅茶', unit_price=20)],
+                                        ignore_index=True))
+        second = self.workbook('2.xlsx', products_sheet(('綠茶', 12, 80)),
+                               customers_sheet(('Amy', 'AMY@example.com', '0912-345-678', '高雄')),
+                               orders_sheet([3], unit_price=12))
+
+        totals, results = import_batch([first, second])
+        self.assertEqual([result.error for result in results], [None, None])
+        self.assertEqual(totals['products'][:2], (2, 0))
+        self.assertEqual(totals['customers'][:2], (1, 0))
+        self.assertEqual([result.orders for result in results], [(1 + 1, 0), (1, 0)])
+        self.assertEqual(sorted(Product.objects.values_list('name', 'price', 'stock')),
+                         [('紅茶', 20, 50), ('綠茶', 12, 80)])
+        # 電子郵件保留第一次出現的寫法
+        self.assertEqual(list(Customer.objects.values_list('email', 'address')),
+                         [('amy@example.com', '高雄')])
+        self.assertEqual(list(Order.objects.order_by('id').values_list('quantity', 'product__name')),
+                         [(1, '綠茶'), (2, '紅茶'), (3, '綠茶')])
+
+    def test_incremental_files_with_same_customer_and_product(self):
+        """增量導入時各檔案的訂單以檔名區分，不會互相覆蓋；重新導入未變更的檔案直接略過"""
+        products = products_sheet(('綠茶', 10, 100))
+        customers = customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北'))
+        day1 = self.workbook('day1.xlsx', products, customers, orders_sheet([1]))
+        day2 = self.workbook('day2.xlsx', products, customers, orders_sheet([2]).assign(status='completed'))
+
+        _, results = import_batch([day1, day2], incremental=True)
+        self.assertEqual([result.orders for result in results], [(1, 0), (1, 0)])
+        self.assertEqual(sorted(Order.objects.values_list('quantity', 'status')),
+                         [(1, 'pending'), (2, 'completed')])
+
+        totals, results = import_batch([day1, day2], incremental=True)
+        self.assertEqual([result.skipped for result in results], [True, True])
+        self.assertEqual(totals['orders'][:2], (0, 0))
+        self.assertEqual(Order.objects.count(), 2)
+
+
+class DuplicateRowsTests(TestCase):
+
+    def snapshot(self):
+        return (sorted(Product.objects.values_list('name', 'price', 'stock')),
+                sorted(Customer.objects.values_list('name', 'email', 'phone', 'address')))
+
+    def test_last_row_wins_regardless_of_chunk_size(self):
+        """同一產品或客戶出現多次時以最後一筆為準，識別欄位沿用第一筆的寫法，與分批大小無關"""
+        products = {'products': products_sheet(('綠茶', 10, 100), ('紅茶', 20, 50), ('奶茶', 30, 10),
+                                               ('綠茶 ', 12, 80), ('紅茶', 25, 40))}
+        customers = {'customers': customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北'),
+                                                  ('Bob', 'bob@example.com', '0922333444', '台中'),
+                                                  ('Amy Lin', 'AMY@example.com', '0912-345-678', '高雄'))}
+        expected = ([('奶茶', 30, 10), ('紅茶', 25, 40), ('綠茶', 12, 80)],
+                    [('Amy Lin', 'amy@example.com', '0912345678', '高雄'),
+                     ('Bob', 'bob@example.com', '0922333444', '台中')])
+        for chunk_size, incremental, engine in product((None, 1, 2, 3), (False, True), ('orm', 'copy')):
+            with self.subTest(chunk_size=chunk_size, incremental=incremental, engine=engine):
+                Product.objects.all().delete()
+                Customer.objects.all().delete()
+                import_products(products, chunk_size=chunk_size, engine=engine, incremental=incremental)
+                import_customers(customers, chunk_size=chunk_size, engine=engine, incremental=incremental)
+                self.assertEqual(self.snapshot(), expected)
+
+
+
+class ResumableCommandTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+        products_sheet(('綠茶', 10, 100)).to_csv(os.path.join(self.path, 'products.csv'), index=False)
+        customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北')).to_csv(
+            os.path.join(self.path, 'customers.csv'), index=False)
+        orders_sheet(range(1, 11)).to_csv(os.path.join(self.path, 'orders.csv'), index=False)
+
+    def test_incremental_resume_after_crash(self):
+        """--resumable --incremental 在訂單第二批提交前中斷，--resume 後十筆訂單都在且數量正確"""
+        advance = jobs.Progress.advance
+
+        def crash(progress, rows, **fields):
+            if fields.get('checkpoint', {}).get('orders', 0) > 5:
+                raise RuntimeError('中斷')
+            return advance(progress, rows, **fields)
+
+        with mock.patch.object(jobs.Progress, 'advance', crash):
+            call_command('process_data', 'import', self.path, '--chunk-size', '5', '--resumable',
+                         '--incremental', stdout=StringIO())
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.checkpoint, {'products': 1, 'customers': 1, 'orders': 5})
+        self.assertEqual(sorted(Order.objects.values_list('quantity', flat=True)), [1, 2, 3, 4, 5])
+
+        call_command('process_data', 'import', self.path, '--resume', str(job.pk), '--incremental',
+                     stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(Order.objects.count(), 10)
+        self.assertEqual(sorted(Order.objects.values_list('quantity', flat=True)), list(range(1, 11)))
+        self.assertEqual(sorted(Order.objects.values_list('total_price', flat=True)),
+                         [quantity * 10 for quantity in range(1, 11)])
+
+    def test_export_keeps_import_message(self):
+        """同時導出時，輸出包含導入的結果與導出的結果"""
+        output = StringIO()
+        export = os.path.join(self.path, 'export.xlsx')
+        call_command('process_data', 'import', self.path, '--resumable', '--export', export, stdout=output)
+        self.assertEqual(ImportJob.objects.get().status, 'succeeded')
+        self.assertIn('orders: 新增 10 筆', output.getvalue())
+        self.assertIn('數據導出成功', output.getvalue())
+        self.assertEqual(len(pd.read_excel(export, sheet_name='orders')), 10)
+
+
+class XlsxExportTests(ImportTestCase):
+
+    def test_export_imports_back(self):
+        """導出的活頁簿重新導入後訂單不變"""
+        import_orders({'orders': orders_sheet([1, 2, 3])})
+        output = BytesIO()
+        write_xlsx(output, export_tables())
+        output.seek(0)
+        sheets = pd.read_excel(output, sheet_name=None)
+        self.assertEqual(list(sheets), ['products', 'customers', 'orders'])
+
+        Order.objects.all().delete()
+        inserted, _, rejects = import_orders(sheets)
+        self.assertEqual((inserted, len(rejects)), (3, 0))
+        self.assertEqual(self.quantities(), [1, 2, 3])
+        self.assertEqual(sorted(Order.objects.values_list('total_price', flat=True)), [10, 20, 30])
+
+    def test_rows_over_sheet_limit_continue_in_next_sheets(self):
+        """超過列數上限的訂單接續寫入 orders_2、orders_3，整張讀取與分批讀取都能完整導入"""
+        import_orders({'orders': orders_sheet([1, 2, 3, 4, 5])})
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'export.xlsx')
+        with mock.patch('data_manager.xlsx.MAX_ROWS', 3):
+            write_xlsx(path, export_tables())
+        self.assertEqual(pd.ExcelFile(path).sheet_names, ['products', 'customers', 'orders', 'orders_2', 'orders_3'])
+
+        for chunk_size in (None, 2):
+            with self.subTest(chunk_size=chunk_size):
+                Order.objects.all().delete()
+                source = open_source(path, chunk_size)
+                self.addCleanup(source.close)
+                inserted, _, rejects = import_orders(source, chunk_size=chunk_size)
+                self.assertEqual((inserted, len(rejects)), (5, 0))
+                self.assertEqual(self.quantities(), [1, 2, 3, 4, 5])
+
+    def test_stream_starts_before_rows_are_read(self):
+        """第一個區塊在讀完資料列之前就送出"""
+        total = 100000
+        read = []
+
+        def rows():
+            for number in range(total):
+                read.append(number)
+                yield [f'產品 {number}', number, number / 3]
+
+        chunks = stream_xlsx(lambda: [('products', ['name', 'stock', 'price'], rows())])
+        first = next(chunks)
+        self.assertTrue(first.startswith(b'PK'))
+        self.assertLess(len(read), total)
+
+        content = first + b''.join(chunks)
+        sheet = pd.read_excel(BytesIO(content), sheet_name='products')
+        self.assertEqual(len(sheet), total)
+        self.assertEqual(sheet['name'].iloc[-1], f'產品 {total - 1}')
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class TableExportTests(ImportTestCase):
+    """CSV、Parquet、Arrow 導出"""
+
+    def snapshot(self):
+        return (
+            list(Product.objects.order_by('name').values_list('name', 'price', 'stock')),
+            list(Customer.objects.order_by('email').values_list('name', 'email', 'phone', 'address')),
+            list(Order.objects.order_by('quantity').values_list(
+                'customer__email', 'product__name', 'quantity', 'total_price', 'status')),
+        )
+
+    def test_exports_import_back_to_same_rows(self):
+        """各格式導出的目錄清空資料庫後重新導入，產品、客戶與訂單不變"""
+        import_products({'products': products_sheet(('紅茶, 大杯', 25.5, 7))})
+        import_customers({'customers': customers_sheet(('Bob "B"', 'bob@example.com', '0922333444', '台中\n西區'))})
+        import_orders({'orders': orders_sheet([1, 2, 3])})
+        import_orders({'orders': orders_sheet([4], email='bob@example.com', phone='0922333444',
+                                              product='紅茶, 大杯', unit_price=25.5)})
+        expected = self.snapshot()
+
+        for output_format in ('csv', 'parquet', 'arrow'):
+            with self.subTest(output_format=output_format):
+                if output_format != 'csv' and not _has_pyarrow():
+                    self.skipTest('需要 pyarrow')
+                directory = tempfile.TemporaryDirectory()
+                self.addCleanup(directory.cleanup)
+                data_processor.export_data(directory.name, output_format=output_format, use_cache=False)
+                self.assertEqual(sorted(os.listdir(directory.name)),
+                                 sorted(f'{sheet}.{output_format}' for sheet in ('products', 'customers', 'orders')))
+
+                Order.objects.all().delete()
+                Customer.objects.all().delete()
+                Product.objects.all().delete()
+                success, message = process_data(directory.name)
+                self.assertTrue(success, message)
+                self.assertEqual(self.snapshot(), expected)
+
+
+class OrderSearchTests(ImportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        import_orders({'orders': orders_sheet([3])})
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def search(self, term):
+        response = self.client.get('/admin/data_manager/order/', {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_total_price(self):
+        self.assertEqual(len(self.search('30')), 1)
+        self.assertEqual(len(self.search('30.00')), 1)
+        self.assertEqual(len(self.search('31')), 0)
+
+    def test_terms_that_cannot_be_prices(self):
+        """非有限值與超出欄位位數的數字不當成總價比對，也不會讓頁面出錯"""
+        for term in ('NaN', 'sNaN', 'Infinity', '-inf', '1e20', '123456789012', '30.001', '1E+999999999'):
+            with self.subTest(term=term):
+                self.assertEqual(self.search(term), [])
+
+
+class NormalizedKeysMigrationTests(TransactionTestCase):
+    """0013 合併比對鍵相同的產品與客戶，0014 再加上比對鍵的唯一約束"""
+
+    migrate_from = [('data_manager', '0012_data_version')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_merges_duplicates_before_adding_constraints(self):
+        apps = self.migrate(self.migrate_from)
+        Product = apps.get_model('data_manager', 'Product')
+        Customer = apps.get_model('data_manager', 'Customer')
+        Order = apps.get_model('data_manager', 'Order')
+        tea = Product.objects.create(name='綠茶', price=10, stock=100)
+        duplicate_tea = Product.objects.create(name='  綠茶 ', price=12, stock=5)
+        amy = Customer.objects.create(name='Amy', email='amy@example.com', phone='0912345678', address='台北')
+        duplicate_amy = Customer.objects.create(name='Amy', email='AMY@Example.com', phone='0912-345-678',
+                                                address='台北')
+        Order.objects.create(customer=amy, product=tea, quantity=1, total_price=10)
+        Order.objects.create(customer=duplicate_amy, product=duplicate_tea, quantity=2, total_price=24)
+
+        apps = self.migrate([('data_manager', '0014_customer_unique_customer_email_phone_key_and_more')])
+        Product = apps.get_model('data_manager', 'Product')
+        Customer = apps.get_model('data_manager', 'Customer')
+        Order = apps.get_model('data_manager', 'Order')
+        DailySales = apps.get_model('data_manager', 'DailySales')
+        CustomerValue = apps.get_model('data_manager', 'CustomerValue')
+        self.assertEqual(list(Product.objects.values_list('id', 'name_key')), [(tea.pk, '綠茶')])
+        self.assertEqual(list(Customer.objects.values_list('id', 'email_key', 'phone_key')),
+                         [(amy.pk, 'amy@example.com', '912345678')])
+        self.assertEqual(set(Order.objects.values_list('product_id', 'customer_id')), {(tea.pk, amy.pk)})
+        self.assertEqual(list(DailySales.objects.values_list('product_id', 'order_count', 'quantity')),
+                         [(tea.pk, 2, 3)])
+        self.assertEqual(list(CustomerValue.objects.values_list('customer_id', 'order_count', 'revenue')),
+                         [(amy.pk, 2, 34)])
+
+
+class ResumeTests(ImportTestCase):
+    """可繼續的導入：從檢查點繼續時略過已提交的列"""
+
+    def test_resume_skips_committed_rows(self):
+        """非增量導入時，繼續的執行從檢查點之後開始，不會重複新增已提交的訂單"""
+        source = {'orders': orders_sheet(range(1, 11))}
+        checkpoints = []
+
+        def crash(sheet_name, rows_read, rows):
+            if rows_read > 5:
+                raise RuntimeError('中斷')
+            checkpoints.append(rows_read)
+
+        with self.assertRaises(RuntimeError):
+            import_orders(source, chunk_size=5, on_chunk=crash)
+        self.assertEqual(checkpoints, [5])
+        self.assertEqual(import_orders(source, chunk_size=5, skip_rows=checkpoints[-1])[:2], (5, 0))
+        self.assertEqual(self.quantities(), list(range(1, 11)))
+
+
+class KeysetPaginationTests(ImportTestCase):
+
+    def setUp(self):
+        super().setUp()
+        import_orders({'orders': orders_sheet([1, 2, 3, 4, 5])})
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        patcher = mock.patch.object(admin.site._registry[Order], 'list_per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def page(self, **params):
+        response = self.client.get('/admin/data_manager/order/', params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_after_pages_show_next_link_instead_of_page_numbers(self):
+        ids = sorted(Order.objects.values_list('id', flat=True), reverse=True)
+        first = self.page()
+        self.assertEqual([order.pk for order in first.context['cl'].result_list], ids[:2])
+        self.assertContains(first, 'this-page')
+        self.assertContains(first, f'?after={ids[1]}')
+
+        second = self.page(after=ids[1])
+        self.assertEqual([order.pk for order in second.context['cl'].result_list], ids[2:4])
+        self.assertNotContains(second, 'this-page')
+        self.assertNotContains(second, '?p=')
+        self.assertContains(second, '第一頁')
+        self.assertContains(second, f'?after={ids[3]}')
+
+        last = self.page(after=ids[3])
+        self.assertEqual([order.pk for order in last.context['cl'].result_list], ids[4:])
+        self.assertNotContains(last, 'this-page')
+        self.assertNotContains(last, '下一頁')
+
+
+class JobRetryTests(TestCase):
+
+    def test_failed_job_waits_before_retry(self):
+        """失敗後重新排隊的工作等待的時間逐次加倍，等待期間不會被取出"""
+        job = ImportJob.objects.create(source_path='/nonexistent/orders.xlsx')
+        for attempt, delay in [(1, jobs.RETRY_BACKOFF), (2, jobs.RETRY_BACKOFF * 2)]:
+            job = jobs.claim_next_job()
+            self.assertEqual(job.attempts, attempt)
+            started = timezone.now()
+            job = jobs.run_job(job)
+            self.assertEqual(job.status, 'queued')
+            self.assertAlmostEqual((job.run_after - started).total_seconds(), delay, delta=5)
+            self.assertIsNone(jobs.claim_next_job())
+            ImportJob.objects.filter(pk=job.pk).update(run_after=timezone.now() - timedelta(seconds=1))
+
+        job = jobs.run_job(jobs.claim_next_job())
+        self.assertEqual(job.status, 'failed')
+        jobs.retry_job(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.run_after), ('queued', None))
+        self.assertEqual(jobs.claim_next_job().pk, job.pk)
+
+
+class HeartbeatTests(TransactionTestCase):
+
+    def test_heartbeat_keeps_slow_job_from_being_requeued(self):
+        """批次很慢、沒有回報進度時，心跳仍持續更新，工作不會被重新排隊"""
+        stale = timezone.now() - timedelta(seconds=jobs.STALE_AFTER + 60)
+        job = ImportJob.objects.create(source_path='/tmp/orders.xlsx', status='running', heartbeat_at=stale)
+        with jobs.Heartbeat(job, interval=0.05):
+            time.sleep(0.5)
+        job.refresh_from_db()
+        self.assertGreater(job.heartbeat_at, stale + timedelta(seconds=60))
+        self.assertEqual(jobs.requeue_stale_jobs(), 0)
+
+
+class InboxTests(TransactionTestCase):
+    """watch_inbox 在處理之間關閉逾時的資料庫連線，不能在測試的交易中執行"""
+
+    def setUp(self):
+        ImportTestCase.setUp(self)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = directory.name
+
+    def drop(self, name, df):
+        df.to_csv(os.path.join(self.path, name), index=False)
+
+    def watch(self, *args):
+        call_command('watch_inbox', self.path, '--once', '--settle', '0', '--workers', '1', *args,
+                     stdout=StringIO())
+
+    def test_resent_files_with_same_customer_and_product(self):
+        """各檔案的訂單以原始檔名區分；重送同名的檔案就地更新，不會新增或覆蓋其他檔案的訂單"""
+        self.drop('orders-day1.csv', orders_sheet([1]))
+        self.drop('orders-day2.csv', orders_sheet([2]).assign(status='completed'))
+        self.watch('--incremental')
+        self.assertEqual(sorted(Order.objects.values_list('quantity', 'status')),
+                         [(1, 'pending'), (2, 'completed')])
+
+        self.drop('orders-day1.csv', orders_sheet([3]))
+        self.watch('--incremental')
+        self.assertEqual(sorted(Order.objects.values_list('quantity', 'status')),
+                         [(2, 'completed'), (3, 'pending')])
+        self.assertEqual(len([name for name in os.listdir(os.path.join(self.path, 'done'))
+                              if name.endswith('.csv')]), 3)
+
+    def test_claim_and_finish(self):
+        """取走的檔案移到此行程的處理目錄，只能取走一次；完成後連同結果描述移到 done/"""
+        self.drop('orders.csv', orders_sheet([1]))
+        inbox = Inbox(self.path, settle=0)
+        self.assertEqual(inbox.ready(), ['orders.csv'])
+        path = inbox.claim('orders.csv')
+        self.assertEqual(os.path.dirname(path), inbox.claimed)
+        self.assertIsNone(inbox.claim('orders.csv'))
+
+        target = inbox.finish(path, {'file': 'orders.csv', 'status': 'succeeded'})
+        self.assertEqual(os.path.dirname(target), inbox.done)
+        with open(f'{target}.json', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['path'], target)
+        self.assertEqual(os.listdir(inbox.claimed), [])
+
+    def test_recover_only_files_of_stopped_watchers(self):
+        """啟動時只將已結束的行程取走的檔案移到 failed/，執行中與其他主機的監看程式不受影響"""
+        inbox = Inbox(self.path, settle=0)
+        finished = subprocess.Popen([sys.executable, '-c', 'pass'])
+        finished.wait()
+        host = socket.gethostname()
+        owners = {'stopped': f'{host}-{finished.pid}', 'running': f'{host}-{os.getppid()}',
+                  'remote': 'other-host-1'}
+        for label, owner in owners.items():
+            os.makedirs(os.path.join(inbox.processing, owner))
+            open(os.path.join(inbox.processing, owner, f'{label}.csv'), 'w').close()
+
+        output = StringIO()
+        call_command('watch_inbox', self.path, '--once', '--workers', '1', stdout=output)
+        self.assertIn('上次中斷時處理中的 1 個檔案', output.getvalue())
+        self.assertEqual(sorted(os.listdir(inbox.failed)), ['stopped.csv', 'stopped.csv.json'])
+        self.assertEqual(sorted(os.listdir(inbox.processing)), sorted([owners['running'], owners['remote']]))
+
+
+class UploadApiTests(TestCase):
+    """可續傳上傳的導入API"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(MEDIA_ROOT=directory.name, DATA_API_TOKENS=['secret'])
+        override.enable()
+        self.addCleanup(override.disable)
+        self.content = orders_sheet([1, 2, 3]).to_csv(index=False).encode()
+
+    def request(self, method, url, data=b'', token='secret', headers=None):
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        return getattr(self.client, method)(url, data, content_type='application/offset+octet-stream',
+                                            headers=headers)
+
+    def create(self, filename='orders.csv', **options):
+        response = self.request('post', reverse('data_api:uploads'),
+                                json.dumps({'filename': filename, **options}).encode())
+        self.assertEqual(response.status_code, 201, response.content)
+        return response
+
+    def patch(self, upload_id, offset, data):
+        return self.request('patch', reverse('data_api:upload', args=[upload_id]), data,
+                            headers={'Upload-Offset': str(offset)})
+
+    def complete(self, upload_id):
+        return self.request('post', reverse('data_api:upload_complete', args=[upload_id]))
+
+    def test_missing_or_wrong_token(self):
+        url = reverse('data_api:uploads')
+        body = json.dumps({'filename': 'orders.csv'}).encode()
+        for token in (None, 'wrong'):
+            with self.subTest(token=token):
+                response = self.request('post', url, body, token=token)
+                self.assertEqual(response.status_code, 401)
+                self.assertIn('error', response.json())
+        self.assertFalse(os.path.exists(os.path.join(settings.MEDIA_ROOT, uploads.UPLOAD_DIR)))
+
+    def test_chunked_upload_and_complete(self):
+        """分段上傳、從錯誤的位置接續時回應 409，完整後建立排隊中的導入工作"""
+        response = self.create(length=len(self.content))
+        upload = response.json()
+        self.assertEqual((upload['offset'], upload['sheet'], upload['job']), (0, 'orders', None))
+        self.assertEqual(response['Location'], reverse('data_api:upload', args=[upload['id']]))
+
+        half = len(self.content) // 2
+        response = self.patch(upload['id'], 0, self.content[:half])
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.json()['offset'], response['Upload-Offset']), (half, str(half)))
+
+        # 起始位置超過已接收的大小
+        self.assertEqual(self.patch(upload['id'], half + 5, self.content[half + 5:]).status_code, 409)
+        # 尚未接收完整時不能完成
+        self.assertEqual(self.complete(upload['id']).status_code, 409)
+        response = self.request('get', reverse('data_api:upload', args=[upload['id']]))
+        self.assertEqual(response.json()['offset'], half)
+
+        # 重送已接收的部分再接續
+        response = self.patch(upload['id'], half - 3, self.content[half - 3:])
+        self.assertEqual(response.json()['offset'], len(self.content))
+
+        response = self.complete(upload['id'])
+        self.assertEqual(response.status_code, 202, response.content)
+        job = ImportJob.objects.get()
+        self.assertEqual((response.json()['id'], response.json()['status']), (job.pk, 'queued'))
+        self.assertEqual(response.json()['status_url'], reverse('data_api:import_status', args=[job.pk]))
+        self.assertEqual(job.sheet, 'orders')
+        with open(job.source_path, 'rb') as f:
+            self.assertEqual(f.read(), self.content)
+
+        # 重試完成回傳同一個工作，完成後不能再寫入
+        self.assertEqual(self.complete(upload['id']).json()['id'], job.pk)
+        self.assertEqual(ImportJob.objects.count(), 1)
+        self.assertEqual(self.patch(upload['id'], 0, self.content).status_code, 409)
+
+    def test_malformed_file_is_rejected(self):
+        """無法讀取或缺少工作表的檔案在完成時回應 400，不建立導入工作"""
+        products = BytesIO()
+        products_sheet(('綠茶', 10, 100)).to_excel(products, sheet_name='products', index=False)
+        for content in (b'not a workbook', products.getvalue()):
+            with self.subTest(content=content[:10]):
+                upload = self.create('data.xlsx').json()
+                self.assertEqual(self.patch(upload['id'], 0, content).status_code, 200)
+                response = self.complete(upload['id'])
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_invalid_requests(self):
+        response = self.request('post', reverse('data_api:uploads'), json.dumps({'filename': 'orders.txt'}).encode())
+        self.assertEqual(response.status_code, 400)
+        upload = self.create().json()
+        response = self.request('patch', reverse('data_api:upload', args=[upload['id']]), self.content)
+        self.assertEqual(response.status_code, 400)
+        response = self.request('get', reverse('data_api:upload', args=['00000000-0000-0000-0000-000000000000']))
+        self.assertEqual(response.status_code, 404)
+
+
+class UploadCleanupTests(TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        override = self.settings(MEDIA_ROOT=directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def upload(self):
+        upload = uploads.create_upload('orders.csv')
+        uploads.write_chunk(upload['id'], 0, BytesIO(orders_sheet([1]).to_csv(index=False).encode()))
+        return upload['id'], uploads.complete_upload(upload['id'])
+
+    def test_finished_uploads_are_removed_after_retention(self):
+        """工作結束超過保留期限的上傳才刪除，排隊中與剛結束的工作保留來源檔案"""
+        queued_id, _ = self.upload()
+        recent_id, recent = self.upload()
+        old_id, old = self.upload()
+        now = timezone.now()
+        ImportJob.objects.filter(pk=recent.pk).update(status='failed', finished_at=now)
+        ImportJob.objects.filter(pk=old.pk).update(
+            status='succeeded', finished_at=now - timedelta(seconds=uploads.FINISHED_UPLOAD_RETENTION + 60))
+
+        self.assertEqual(uploads.remove_stale_uploads(), 1)
+        uploads.get_upload(queued_id)
+        uploads.get_upload(recent_id)
+        with self.assertRaises(uploads.UploadError):
+            uploads.get_upload(old_id)
+
+
+class BenchMemoryTests(TestCase):
+
+    @skipUnless(os.path.exists('/proc/self/clear_refs'), '需要 Linux 的 /proc/self/clear_refs')
+    def test_peak_memory_is_measured_per_operation(self):
+        """先前操作的記憶體峰值不計入之後的操作"""
+        first = bench._measure(lambda: bytearray(300 * 1024 * 1024))
+        second = bench._measure(lambda: None)
+        self.assertGreater(first['peak_rss_mb'] - second['peak_rss_mb'], 200)
+
+
+class ParallelImportTests(TransactionTestCase):
+
+    def test_orders_are_written_after_products_and_customers(self):
+        """--workers 並行導入時，訂單等產品與客戶都提交後才寫入，不會因找不到客戶或產品被拒絕"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        products_sheet(('綠茶', 10, 100)).to_csv(os.path.join(directory.name, 'products.csv'), index=False)
+        customers_sheet(('Amy', 'amy@example.com', '0912345678', '台北')).to_csv(
+            os.path.join(directory.name, 'customers.csv'), index=False)
+        orders_sheet([1, 2, 3]).to_csv(os.path.join(directory.name, 'orders.csv'), index=False)
+
+        events = []
+
+        def logged(sheet, write):
+            def wrapper(*args, **kwargs):
+                events.append(sheet)
+                return write(*args, **kwargs)
+            return wrapper
+
+        def slow(prepare):
+            def wrapper(df):
+                # 讓產品與客戶比訂單晚讀取完成，訂單若不等待就會先寫入
+                time.sleep(0.3)
+                return prepare(df)
+            return wrapper
+
+        patches = [mock.patch.object(data_processor, f'write_{sheet}',
+                                     logged(sheet, getattr(data_processor, f'write_{sheet}')))
+                   for sheet in ('products', 'customers', 'orders')]
+        patches += [mock.patch.object(data_processor, f'prepare_{sheet}',
+                                      slow(getattr(data_processor, f'prepare_{sheet}')))
+                    for sheet in ('products', 'customers')]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        success, message = process_data(directory.name, workers=3)
+        self.assertTrue(success, message)
+        self.assertIn('訂單數據導入成功（新增 3 筆，更新 0 筆，拒絕 0 筆）', message)
+        self.assertEqual(events[-1], 'orders')
+
+
+class GeneratorTests(TestCase):
+    """合成數據產生器"""
+
+    def test_same_seed_gives_identical_output(self):
+        """同一個 seed 產生的每張工作表完全相同，不同 seed 則不同"""
+        options = dict(num_products=30, num_customers=40, num_orders=500, skew=1.2,
+                       duplicate_rate=0.05, invalid_rate=0.05)
+        first = generate_dataset(seed=7, **options)
+        second = generate_dataset(seed=7, **options)
+        self.assertEqual(list(first), ['products', 'customers', 'orders'])
+        for sheet in first:
+            with self.subTest(sheet=sheet):
+                pd.testing.assert_frame_equal(first[sheet], second[sheet])
+        self.assertFalse(first['orders'].equals(generate_dataset(seed=8, **options)['orders']))
+
+    def test_command_with_seed_writes_identical_files(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        contents = []
+        for run in ('a', 'b'):
+            output = os.path.join(directory.name, run)
+            call_command('generate_data', output=output, format='csv', orders=200, seed=7, stdout=StringIO())
+            files = {}
+            for name in sorted(os.listdir(output)):
+                with open(os.path.join(output, name), 'rb') as file:
+                    files[name] = file.read()
+            contents.append(files)
+        self.assertEqual(list(contents[0]), ['customers.csv', 'orders.csv', 'products.csv'])
+        self.assertEqual(contents[0], contents[1])
+
+
+class ProfilingTests(ImportTestCase):
+    """各階段的效能紀錄與輸出格式"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.path = os.path.join(self.directory, 'orders.xlsx')
+        orders_sheet(range(1, 8)).to_excel(self.path, sheet_name='orders', index=False)
+
+    def test_stage_counts(self):
+        """串流導入 7 列、每批 3 列：三批各清理與寫入一次，解析多一次讀到檔案結尾"""
+        recorder = profiling.Recorder()
+        with recorder.activate():
+            success, message = process_data(self.path, sheet_to_import='orders', chunk_size=3)
+        self.assertTrue(success, message)
+        stages = recorder.report()['stages']
+        self.assertEqual(list(stages), ['orders', 'orders/parse', 'orders/clean', 'orders/write',
+                                        'orders/write/resolve', 'orders/write/rollup'])
+        self.assertEqual({path: stage['calls'] for path, stage in stages.items()}, {
+            'orders': 1, 'orders/parse': 4, 'orders/clean': 3, 'orders/write': 3,
+            'orders/write/resolve': 3, 'orders/write/rollup': 3,
+        })
+        for path, stage in stages.items():
+            with self.subTest(stage=path):
+                self.assertEqual((stage['rows_in'], stage['rows_out']), (7, 7))
+        # 查詢次數包含子階段
+        self.assertEqual(stages['orders']['queries'], recorder.report()['queries'])
+        self.assertGreaterEqual(stages['orders/write']['queries'],
+                                stages['orders/write/resolve']['queries'] + stages['orders/write/rollup']['queries'])
+        self.assertEqual(stages['orders/parse']['queries'], 0)
+
+    def test_prometheus_output(self):
+        output = os.path.join(self.directory, 'metrics.prom')
+        call_command('process_data', 'import', self.path, '--sheet', 'orders', '--chunk-size', '3',
+                     '--profile-output', output, stdout=StringIO())
+        with open(output, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        samples = {}
+        for field in profiling.STAGE_FIELDS:
+            name = f'{profiling.PROMETHEUS_PREFIX}_{field}'
+            help_line = lines.index(f'# HELP {name} {profiling.PROMETHEUS_HELP[field]}')
+            self.assertEqual(lines[help_line + 1], f'# TYPE {name} gauge')
+        for line in lines:
+            if line.startswith('#'):
+                continue
+            metric, value = line.rsplit(' ', 1)
+            name, labels = metric.rstrip('}').split('{')
+            samples[name, labels] = float(value)
+        self.assertEqual(samples['data_manager_stage_calls', 'stage="orders/parse"'], 4)
+        self.assertEqual(samples['data_manager_stage_calls', 'stage="orders/write"'], 3)
+        self.assertEqual(samples['data_manager_stage_rows_out', 'stage="orders"'], 7)
+        self.assertEqual(len(samples), len(profiling.STAGE_FIELDS) * 6)
+
+    def test_jsonl_spans(self):
+        """每行一個 span，子階段的 parentSpanId 指向父階段，同一次執行共用 traceId"""
+        output = os.path.join(self.directory, 'spans.jsonl')
+        call_command('process_data', 'import', self.path, '--sheet', 'orders', '--chunk-size', '3',
+                     '--profile-output', output, stdout=StringIO())
+        with open(output, encoding='utf-8') as f:
+            spans = [json.loads(line) for line in f]
+        self.assertEqual(len(spans), 1 + 4 + 3 + 3 + 3 + 3)
+        self.assertEqual(len({span['traceId'] for span in spans}), 1)
+        by_id = {span['spanId']: span for span in spans}
+        self.assertEqual(len(by_id), len(spans))
+        for span in spans:
+            with self.subTest(span=span['name']):
+                parent = by_id.get(span['parentSpanId'])
+                if span['name'] == 'orders':
+                    self.assertIsNone(span['parentSpanId'])
+                else:
+                    self.assertEqual(parent['name'], span['name'].rsplit('/', 1)[0])
+                    self.assertLessEqual(parent['startTimeUnixNano'], span['startTimeUnixNano'])
+                self.assertLessEqual(span['startTimeUnixNano'], span['endTimeUnixNano'])
+        self.assertEqual(sum(span['attributes']['rows_out'] for span in spans if span['name'] == 'orders/write'), 7)
+
+
+class ScopedClearTests(ImportTestCase):
+    """依條件分批刪除訂單"""
+
+    snapshot = RollupTests.snapshot
+
+    def setUp(self):
+        super().setUp()
+        import_products({'products': products_sheet(('紅茶', 20, 50))})
+        import_customers({'customers': customers_sheet(('Bob', 'bob@example.com', '0922333444', '台中'))})
+        orders = pd.concat([orders_sheet([1, 2, 3]), orders_sheet([4, 5], product='紅茶', unit_price=20),
+                            orders_sheet([6, 7], email='bob@example.com', phone='0922333444')], ignore_index=True)
+        orders['status'] = ['cancelled', 'pending', 'cancelled', 'cancelled', 'completed', 'cancelled', 'pending']
+        import_orders({'orders': orders})
+        # 訂單日期在導入時設為現在，改為較早的日期後重建彙總表
+        Order.objects.filter(quantity__in=[1, 2, 4, 6]).update(order_date=timezone.make_aware(datetime(2024, 3, 1)))
+        rollups.rebuild()
+
+    def clear(self, *args):
+        output = StringIO()
+        call_command('process_data', 'clear', *args, stdout=output)
+        return output.getvalue()
+
+    def assert_rollups_match_rebuild(self):
+        maintained = self.snapshot()
+        rollups.rebuild()
+        self.assertEqual(self.snapshot(), maintained)
+
+    def test_without_confirm_only_counts(self):
+        output = self.clear('--before', '2025-01-01', '--status', 'cancelled')
+        self.assertIn('符合條件的訂單共 3 筆', output)
+        self.assertEqual(Order.objects.count(), 7)
+
+    def test_clear_before_date_and_status(self):
+        """只刪除日期較早且已取消的訂單，每批一筆，彙總表逐批扣除後與重建的結果相同"""
+        output = self.clear('--before', '2025-01-01', '--status', 'cancelled', '--batch-size', '1', '--confirm')
+        self.assertIn('已刪除 3 筆訂單', output)
+        self.assertEqual(self.quantities(), [2, 3, 5, 7])
+        self.assert_rollups_match_rebuild()
+
+    def test_clear_with_rollup_rebuild(self):
+        output = self.clear('--status', 'cancelled', '--rebuild-rollups', '--confirm')
+        self.assertIn('已刪除 4 筆訂單', output)
+        self.assertIn('彙總表已重建', output)
+        self.assertEqual(self.quantities(), [2, 5, 7])
+        self.assert_rollups_match_rebuild()
+
+    def test_clear_orders_of_import_job(self):
+        """只刪除指定導入工作新增的訂單，其他訂單與彙總表不受影響"""
+        before = self.snapshot()
+        job = ImportJob.objects.create(source_path='/tmp/orders.xlsx')
+        import_orders({'orders': orders_sheet([8, 9])}, import_job=job.pk)
+        self.assertEqual(Order.objects.filter(import_job=job).count(), 2)
+
+        output = self.clear('--job', str(job.pk), '--confirm')
+        self.assertIn('已刪除 2 筆訂單', output)
+        self.assertEqual(self.quantities(), [1, 2, 3, 4, 5, 6, 7])
+        self.assertEqual(self.snapshot(), before)
+        self.assert_rollups_match_rebuild()
+
+
+class DataVersionCacheTests(ImportTestCase):
+    """以資料版本為鍵的快取"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        overrides = self.settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'versions'}},
+            DATA_CACHE='default', DATA_CACHE_DIR=os.path.join(self.directory, 'cache'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def test_bump_invalidates_only_dependent_results(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return Order.objects.count()
+
+        self.assertEqual(cache.cached('order_count', [Order], compute), 0)
+        self.assertEqual(cache.cached('order_count', [Order], compute), 0)
+        self.assertEqual(len(calls), 1)
+        cache.bump(Product)
+        cache.cached('order_count', [Order], compute)
+        self.assertEqual(len(calls), 1)
+
+        import_orders({'orders': orders_sheet([1, 2])})
+        self.assertEqual(cache.cached('order_count', [Order], compute), 2)
+        self.assertEqual(len(calls), 2)
+
+    def test_saving_through_orm_bumps_version(self):
+        """經過ORM儲存的變更透過信號更換版本"""
+        before = cache.version_key(Product)
+        product = Product.objects.get()
+        product.stock = 1
+        product.save()
+        self.assertNotEqual(cache.version_key(Product), before)
+
+    def test_cached_export_is_rebuilt_after_data_changes(self):
+        """資料未變更時直接複製快取的檔案，訂單變更後重新產生並刪除舊版本的檔案"""
+        import_orders({'orders': orders_sheet([1, 2])})
+        first, second, third = (os.path.join(self.directory, name) for name in ('1.xlsx', '2.xlsx', '3.xlsx'))
+        self.assertFalse(data_processor.export_data(first))
+        self.assertTrue(data_processor.export_data(second))
+        exports = os.path.join(self.directory, 'cache', 'exports')
+        cached_files = os.listdir(exports)
+        self.assertEqual(len(cached_files), 1)
+
+        import_orders({'orders': orders_sheet([3])})
+        self.assertFalse(data_processor.export_data(third))
+        self.assertEqual(sorted(pd.read_excel(third, sheet_name='orders')['quantity']), [1, 2, 3])
+        self.assertEqual(len(os.listdir(exports)), 1)
+        self.assertNotEqual(os.listdir(exports), cached_files)
@@ -0,0 +1,219 @@
+"""導入API的上傳暫存
+
+每個上傳在 MEDIA_ROOT/uploads/<id>/ 下有一個目錄，內含描述檔 upload.json 與資料檔。
+資料檔可以分段寫入：每段指定起始位置，只能從已接收的大小以內接續，
+重送同一段只會覆寫相同的內容，連線中斷後查詢已接收的大小即可從該處繼續。
+完成後建立排隊中的導入工作，由 run_jobs 以串流模式讀取資料檔導入；
+工作結束（成功、失敗或取消）超過保留期限後，上傳目錄由 remove_stale_uploads 刪除。
+這裡的函數都是同步的檔案操作，API 在執行緒中呼叫。
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from data_manager.data_processor import IMPORTERS, open_source
+from data_manager.models import ImportJob
+from data_manager.readers import TABLE_FORMATS
+
+UPLOAD_DIR = 'uploads'
+# 可上傳的格式：活頁簿，或只含一張工作表的CSV/NDJSON/Parquet/Arrow檔案
+UPLOAD_FORMATS = {'.xlsx': 'xlsx', **TABLE_FORMATS}
+# 未設定 DATA_API_MAX_UPLOAD_SIZE 時單一上傳的大小上限
+MAX_UPLOAD_SIZE = 10 * 1024 ** 3
+# 每次從請求讀取並寫入檔案的位元組數
+COPY_BUFFER_SIZE = 1024 * 1024
+# 超過這個秒數沒有寫入的未完成上傳由 remove_stale_uploads 刪除
+STALE_UPLOAD_AFTER = 24 * 3600
+# 工作結束後保留上傳的秒數，期間可以在後台重試失敗的工作
+FINISHED_UPLOAD_RETENTION = 7 * 24 * 3600
+SHEETS = [sheet for sheet, _, _ in IMPORTERS]
+
+
+class UploadError(Exception):
+    """上傳的請求無效，status 為對應的HTTP狀態碼"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def max_upload_size():
+    return getattr(settings, 'DATA_API_MAX_UPLOAD_SIZE', MAX_UPLOAD_SIZE)
+
+def _root():
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR)
+
+def _load(upload_id):
+    """回傳 (上傳目錄, 描述)，upload_id 為 uuid 字串"""
+    directory = os.path.join(_root(), upload_id)
+    try:
+        with open(os.path.join(directory, 'upload.json'), encoding='utf-8') as f:
+            return directory, json.load(f)
+    except FileNotFoundError:
+        raise UploadError('找不到上傳', 404)
+
+def _save(directory, upload):
+    # 先寫入暫存檔再取代，讀取端不會看到寫到一半的描述
+    temp = os.path.join(directory, 'upload.json.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(upload, f, ensure_ascii=False)
+    os.replace(temp, os.path.join(directory, 'upload.json'))
+
+def _describe(directory, upload):
+    return {
+        'id': upload['id'],
+        'filename': upload['filename'],
+        'sheet': upload['sheet'],
+        'length': upload['length'],
+        'offset': os.path.getsize(os.path.join(directory, upload['data'])),
+        'job': upload['job'],
+    }
+
+def create_upload(filename, sheet=None, length=None):
+    """建立上傳，回傳上傳的描述（id、已接收的位元組數 offset 等）
+
+    Args:
+        filename: 原始檔名，依副檔名決定格式
+        sheet: 只導入此工作表；CSV等單一工作表的檔案未指定時依檔名判斷（如 orders.csv）
+        length: 檔案的總位元組數，指定時完成前會檢查是否已全部接收
+    """
+    extension = os.path.splitext(filename or '')[1].lower()
+    if extension not in UPLOAD_FORMATS:
+        raise UploadError(f"不支援的檔案格式，請上傳 {', '.join(UPLOAD_FORMATS)} 檔案")
+    if UPLOAD_FORMATS[extension] != 'xlsx' and not sheet:
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        if stem not in SHEETS:
+            raise UploadError(f"單一工作表的檔案須指定 sheet（{', '.join(SHEETS)}）")
+        sheet = stem
+    if sheet and sheet not in SHEETS:
+        raise UploadError(f'未知的工作表 {sheet}')
+    if length is not None and not 0 < length <= max_upload_size():
+        raise UploadError(f'檔案大小須介於 1 與 {max_upload_size()} 位元組之間', 413)
+
+    upload_id = str(uuid.uuid4())
+    directory = os.path.join(_root(), upload_id)
+    os.makedirs(directory)
+    upload = {
+        'id': upload_id,
+        'filename': os.path.basename(filename),
+        'sheet': sheet or '',
+        'length': length,
+        # 單一工作表的檔案以工作表名稱命名，TableFiles 依檔名決定工作表
+        'data': f'{sheet}{extension}' if UPLOAD_FORMATS[extension] != 'xlsx' else f'upload{extension}',
+        'job': None,
+    }
+    open(os.path.join(directory, upload['data']), 'wb').close()
+    _save(directory, upload)
+    return _describe(directory, upload)
+
+def get_upload(upload_id):
+    return _describe(*_load(upload_id))
+
+def write_chunk(upload_id, offset, stream, size=None):
+    """從 offset 起寫入 stream 的內容，回傳更新後的描述
+
+    Args:
+        offset: 起始位置，不可超過已接收的位元組數
+        stream: 可 read(n) 的來源，例如請求本身
+        size: 本段的位元組數（Content-Length），已知時先檢查是否超過大小上限
+    """
+    directory, upload = _load(upload_id)
+    if upload['job']:
+        raise UploadError('上傳已完成', 409)
+    path = os.path.join(directory, upload['data'])
+    received = os.path.getsize(path)
+    if offset > received:
+        raise UploadError(f'起始位置 {offset} 超過已接收的 {received} 位元組', 409)
+    limit = upload['length'] or max_upload_size()
+    if size is not None and offset + size > limit:
+        raise UploadError(f'超過檔案大小 {limit} 位元組', 413)
+    position = offset
+    with open(path, 'r+b') as file:
+        file.seek(offset)
+        while chunk := stream.read(COPY_BUFFER_SIZE):
+            position += len(chunk)
+            if position > limit:
+                raise UploadError(f'超過檔案大小 {limit} 位元組', 413)
+            file.write(chunk)
+    return _describe(directory, upload)
+
+def complete_upload(upload_id, chunk_size=None):
+    """確認上傳已完整並可讀取後建立排隊中的導入工作，回傳工作
+
+    重複呼叫回傳同一個工作，客戶端沒收到回應時可以安全重試。
+    """
+    directory, upload = _load(upload_id)
+    if upload['job']:
+        return ImportJob.objects.get(pk=upload['job'])
+    path = os.path.join(directory, upload['data'])
+    received = os.path.getsize(path)
+    if upload['length'] is not None and received != upload['length']:
+        raise UploadError(f"已接收 {received} / {upload['length']} 位元組，上傳尚未完成", 409)
+    if not received:
+        raise UploadError('上傳的檔案是空的')
+    # 建立標記檔是原子操作，同一個上傳同時完成時只有一個請求會建立工作
+    marker = os.path.join(directory, 'completing')
+    try:
+        os.close(os.open(marker, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        raise UploadError('上傳正在完成中', 409)
+    try:
+        try:
+            source = open_source(path, 1, upload['sheet'] or None)
+            sheetnames = source.sheetnames
+            source.close()
+        except Exception as e:
+            raise UploadError(f'無法讀取上傳的檔案: {e}')
+        missing = [sheet for sheet in ([upload['sheet']] if upload['sheet'] else SHEETS) if sheet not in sheetnames]
+        if missing:
+            raise UploadError(f"導入檔案缺少以下工作表：{', '.join(missing)}")
+        fields = {'chunk_size': chunk_size} if chunk_size else {}
+        job = ImportJob.objects.create(source_path=path, sheet=upload['sheet'], **fields)
+        upload['job'] = job.pk
+        _save(directory, upload)
+    finally:
+        os.remove(marker)
+    return job
+
+def delete_upload(upload_id):
+    """刪除未完成的上傳；已建立工作的上傳是工作的來源檔案，不能刪除"""
+    directory, upload = _load(upload_id)
+    if upload['job']:
+        raise UploadError(f"上傳已建立導入工作 #{upload['job']}", 409)
+    shutil.rmtree(directory, ignore_errors=True)
+
+def remove_stale_uploads(stale_after=STALE_UPLOAD_AFTER, retention=FINISHED_UPLOAD_RETENTION):
+    """刪除放棄或已導入的上傳，回傳刪除的數量
+
+    未完成的上傳超過 stale_after 秒沒有寫入時刪除；已建立工作的上傳在工作結束
+    超過 retention 秒、或工作已被刪除時刪除，之後不能再重試該工作。
+    """
+    if not os.path.isdir(_root()):
+        return 0
+    cutoff = time.time() - stale_after
+    expired = []
+    completed = {}
+    for upload_id in os.listdir(_root()):
+        try:
+            directory, upload = _load(upload_id)
+            if upload['job']:
+                completed[upload['job']] = directory
+            elif os.path.getmtime(os.path.join(directory, upload['data'])) < cutoff:
+                expired.append(directory)
+        except (UploadError, FileNotFoundError, ValueError):
+            continue
+    if completed:
+        finished_before = timezone.now() - timedelta(seconds=retention)
+        active = set(ImportJob.objects.filter(pk__in=completed).exclude(
+            status__in=['succeeded', 'failed', 'cancelled'], finished_at__lt=finished_before,
+        ).values_list('pk', flat=True))
+        expired += [directory for job, directory in completed.items() if job not in active]
+    for directory in expired:
+        shutil.rmtree(directory, ignore_errors=True)
+    return len(expired)
@@ -0,0 +1,13 @@
+from django.urls import path
+
+from data_manager import views
+
+app_name = 'data_api'
+
+urlpatterns = [
+    path('imports/', views.create_import, name='imports'),
+    path('imports/<int:job_id>/', views.import_status, name='import_status'),
+    path('uploads/', views.create_upload_view, name='uploads'),
+    path('uploads/<uuid:upload_id>/', views.upload_view, name='upload'),
+    path('uploads/<uuid:upload_id>/complete/', views.complete_upload_view, name='upload_complete'),
+]
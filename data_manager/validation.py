@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+from django.db import models
+
+from data_manager import schema
+from data_manager.models import Product, Customer, Order
+
+# 與 Django EmailValidator 大致相同的寬鬆格式檢查，可直接向量化比對
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s.]+'
+INTEGER_RANGE = (-2 ** 31, 2 ** 31 - 1)
+
+# 工作表欄位對應的模型欄位，檢查規則由模型欄位的定義決定
+SHEET_FIELDS = {
+    'products': {
+        'name': (Product, 'name'),
+        'price': (Product, 'price'),
+        'stock': (Product, 'stock'),
+    },
+    'customers': {
+        'name': (Customer, 'name'),
+        'email': (Customer, 'email'),
+        'phone': (Customer, 'phone'),
+        'address': (Customer, 'address'),
+    },
+    'orders': {
+        'customer_email': (Customer, 'email'),
+        'customer_phone': (Customer, 'phone'),
+        'product_name': (Product, 'name'),
+        'quantity': (Order, 'quantity'),
+        'total_price': (Order, 'total_price'),
+        'status': (Order, 'status'),
+    },
+}
+
+
+def _stripped(series):
+    return series.astype('string').str.strip()
+
+def _text(series):
+    """去除前後空白的字串；類別欄位只處理各類別，結果仍為類別欄位"""
+    if schema.is_category(series):
+        return schema.map_categories(series, _stripped)
+    return _stripped(series)
+
+def _per_value(text, check):
+    """以 check 檢查字串欄位的各列
+
+    類別欄位每個類別只檢查一次再依代碼展開，缺失值的結果為 NA。
+    """
+    if schema.is_category(text):
+        result = check(pd.Series(text.cat.categories, dtype='string')).astype('boolean').array
+        return pd.Series(result.take(text.cat.codes.to_numpy(), allow_fill=True), index=text.index)
+    return check(text)
+
+def _missing(series):
+    missing = series.isna()
+    if not pd.api.types.is_numeric_dtype(series):
+        missing |= _per_value(_text(series), lambda text: text.eq('')).fillna(True)
+    return missing
+
+def _field_checks(series, column, field):
+    """依模型欄位定義產生 [(不合格的遮罩, 原因)]，只檢查有值的儲存格"""
+    missing = _missing(series)
+    checks = []
+    if not field.blank and not field.has_default():
+        checks.append((missing, f'{column} 缺少值'))
+    present = ~missing
+
+    if isinstance(field, (models.IntegerField, models.DecimalField)):
+        numbers = pd.to_numeric(series, errors='coerce')
+        checks.append((present & numbers.isna(), f'{column} 不是數字'))
+        present = present & numbers.notna()
+        numbers = numbers.astype(float)
+        if isinstance(field, models.IntegerField):
+            checks.append((present & (numbers % 1 != 0), f'{column} 不是整數'))
+            checks.append((present & ((numbers < INTEGER_RANGE[0]) | (numbers > INTEGER_RANGE[1])),
+                           f'{column} 超出範圍'))
+        else:
+            limit = 10 ** (field.max_digits - field.decimal_places)
+            checks.append((present & (numbers.abs() >= limit),
+                           f'{column} 超過 {field.max_digits - field.decimal_places} 位整數'))
+            scaled = numbers * 10 ** field.decimal_places
+            checks.append((present & ((scaled - scaled.round()).abs() > 1e-6),
+                           f'{column} 超過 {field.decimal_places} 位小數'))
+    elif isinstance(field, (models.CharField, models.TextField)):
+        text = _text(series)
+        if field.max_length:
+            checks.append((present & _per_value(text, lambda values: values.str.len() > field.max_length),
+                           f'{column} 超過 {field.max_length} 個字元'))
+        if isinstance(field, models.EmailField):
+            valid = _per_value(text, lambda values: values.str.fullmatch(EMAIL_PATTERN)).fillna(False)
+            checks.append((present & ~valid, f'{column} 電子郵件格式錯誤'))
+        if field.choices:
+            allowed = [value for value, _ in field.choices]
+            checks.append((present & ~_per_value(text, lambda values: values.isin(allowed)),
+                           f'{column} 不是有效選項'))
+    return [(mask.fillna(False).astype(bool), reason) for mask, reason in checks]
+
+def empty_rejects():
+    return pd.DataFrame(columns=['row', 'reason'])
+
+def validate(df, sheet_name):
+    """以模型欄位定義向量化檢查整個DataFrame，回傳 (合格的列, 不合格的列)
+
+    不合格的列附上 row（Excel列號）與 reason（以「；」分隔的所有原因）欄位。
+    缺少必要欄位時拋出 ValueError。
+    """
+    fields = SHEET_FIELDS[sheet_name]
+    missing_columns = [column for column in fields if column not in df.columns]
+    if missing_columns:
+        raise ValueError(f"工作表 {sheet_name} 缺少以下欄位：{', '.join(missing_columns)}")
+
+    checks = []
+    for column, (model, name) in fields.items():
+        checks.extend(_field_checks(df[column], column, model._meta.get_field(name)))
+    invalid = np.zeros(len(df), dtype=bool)
+    for mask, _ in checks:
+        invalid |= mask.to_numpy()
+    if not invalid.any():
+        return df, empty_rejects()
+
+    reasons = pd.Series('', index=df.index[invalid], dtype=object)
+    for mask, reason in checks:
+        hit = mask.to_numpy()[invalid]
+        if hit.any():
+            reasons = reasons + np.where(hit, reason + '；', '')
+    rejected = df[invalid].copy()
+    rejected.insert(0, 'reason', reasons.str.rstrip('；'))
+    rejected.insert(0, 'row', rejected.index + 2)
+    return df[~invalid], rejected
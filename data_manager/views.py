@@ -1,3 +1,135 @@
-from django.shortcuts import render
+"""導入API：上游系統以HTTP上傳檔案，取得導入工作並輪詢狀態
 
-# Create your views here.
+  POST   api/imports/?filename=orders.csv&sheet=orders   請求內容即檔案，一次上傳並建立導入工作
+  GET    api/imports/<工作id>/                            導入工作的狀態
+  POST   api/uploads/                                     建立可續傳的上傳，JSON：filename、sheet、length
+  GET    api/uploads/<上傳id>/                            已接收的位元組數（offset，亦在 Upload-Offset 標頭）
+  PATCH  api/uploads/<上傳id>/                            Upload-Offset 標頭指定起始位置，請求內容寫入該處
+  DELETE api/uploads/<上傳id>/                            放棄未完成的上傳
+  POST   api/uploads/<上傳id>/complete/                   上傳完成，建立排隊中的導入工作
+
+檔案可以是活頁簿，或只含一張工作表的CSV、NDJSON、Parquet、Arrow檔案。
+請求需在 Authorization 標頭帶 DATA_API_TOKENS 中的權杖（Bearer <權杖>），
+查詢工作狀態也可以使用能檢視導入工作的後台登入。
+
+請求內容由ASGI伺服器暫存（超過 FILE_UPLOAD_MAX_MEMORY_SIZE 時寫入暫存檔），
+再分段複製到上傳目錄，不會整個讀進記憶體。檔案與資料庫操作都在執行緒中進行，
+同時進行的上傳不會互相阻塞，也不佔用處理後台請求的事件迴圈。
+"""
+import asyncio
+import json
+import secrets
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from data_manager.jobs import job_status
+from data_manager.models import ImportJob
+from data_manager.uploads import UploadError, complete_upload, create_upload, delete_upload, get_upload, write_chunk
+
+
+def _error(message, status):
+    return JsonResponse({'error': message}, status=status)
+
+def _token_valid(request):
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and any(
+        secrets.compare_digest(token.encode(), allowed.encode()) for allowed in getattr(settings, 'DATA_API_TOKENS', []))
+
+def api_view(*methods, allow_session=False):
+    """API 視圖：限制HTTP方法、驗證權杖，並將 UploadError 轉為JSON錯誤回應
+
+    以權杖驗證，不使用CSRF；allow_session 為 True 時（只用於讀取）也接受後台登入。
+    """
+    def decorator(view):
+        @csrf_exempt
+        @require_http_methods(methods)
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if not _token_valid(request):
+                user = await request.auser() if allow_session else None
+                if user is None or not await user.ahas_perm('data_manager.view_importjob'):
+                    return _error('需要有效的API權杖', 401)
+            try:
+                return await view(request, *args, **kwargs)
+            except UploadError as e:
+                return _error(str(e), e.status)
+        return wrapped
+    return decorator
+
+def _content_length(request):
+    try:
+        return int(request.META['CONTENT_LENGTH'])
+    except (KeyError, ValueError):
+        return None
+
+def _int(value, name):
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise UploadError(f'{name} 須為整數')
+
+def _upload_response(upload, status=200):
+    response = JsonResponse(upload, status=status)
+    response['Upload-Offset'] = upload['offset']
+    return response
+
+def _job_response(job, status=200):
+    return JsonResponse({**job_status(job), 'status_url': reverse('data_api:import_status', args=[job.pk])},
+                        status=status)
+
+@api_view('POST')
+async def create_import(request):
+    """一次上傳整個檔案並建立導入工作，適合不需要續傳的小檔案"""
+    upload = await asyncio.to_thread(create_upload, request.GET.get('filename'), request.GET.get('sheet'))
+    try:
+        await asyncio.to_thread(write_chunk, upload['id'], 0, request, _content_length(request))
+        job = await sync_to_async(complete_upload)(upload['id'], _int(request.GET.get('chunk_size'), 'chunk_size'))
+    except BaseException:
+        await asyncio.to_thread(delete_upload, upload['id'])
+        raise
+    return _job_response(job, 202)
+
+@api_view('GET', 'HEAD', allow_session=True)
+async def import_status(request, job_id):
+    job = await ImportJob.objects.filter(pk=job_id).afirst()
+    if job is None:
+        return _error(f'找不到導入工作 #{job_id}', 404)
+    return _job_response(job)
+
+@api_view('POST')
+async def create_upload_view(request):
+    try:
+        options = json.loads(request.body or b'{}')
+    except ValueError:
+        raise UploadError('請求內容須為JSON')
+    upload = await asyncio.to_thread(create_upload, options.get('filename'), options.get('sheet'),
+                                     _int(options.get('length'), 'length'))
+    response = _upload_response(upload, 201)
+    response['Location'] = reverse('data_api:upload', args=[upload['id']])
+    return response
+
+@api_view('GET', 'HEAD', 'PATCH', 'DELETE')
+async def upload_view(request, upload_id):
+    if request.method == 'PATCH':
+        offset = _int(request.headers.get('Upload-Offset'), 'Upload-Offset')
+        if offset is None:
+            raise UploadError('請以 Upload-Offset 標頭指定起始位置')
+        upload = await asyncio.to_thread(write_chunk, str(upload_id), offset, request, _content_length(request))
+        return _upload_response(upload)
+    if request.method == 'DELETE':
+        await asyncio.to_thread(delete_upload, str(upload_id))
+        return HttpResponse(status=204)
+    return _upload_response(await asyncio.to_thread(get_upload, str(upload_id)))
+
+@api_view('POST')
+async def complete_upload_view(request, upload_id):
+    job = await sync_to_async(complete_upload)(str(upload_id), _int(request.GET.get('chunk_size'), 'chunk_size'))
+    return _job_response(job, 202)
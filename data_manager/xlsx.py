@@ -0,0 +1,149 @@
+"""逐列輸出的Excel（xlsx）寫入
+
+openpyxl 的唯寫活頁簿會先把每張工作表寫到暫存檔，save() 時才組成zip，
+寫完之前輸出端收不到任何位元組。這裡直接以 zipfile 的串流模式寫入各部分：
+工作表XML邊讀取資料列邊產生並壓縮寫出，輸出為不可定位的串流（如HTTP回應）時，
+第一批資料列壓縮後就會送出，不必等整個活頁簿完成。
+
+文字以 inlineStr 寫入，不需要先收集共用字串表；時間寫成Excel序列值並套用日期格式。
+超過Excel列數上限的表接續寫入 orders_2、orders_3……，導入時依序讀回（見 readers.continuation_sheets）。
+"""
+import math
+import re
+import zipfile
+from datetime import date, datetime
+from itertools import chain, islice
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl.utils import get_column_letter
+
+# 累積這麼多列的XML後寫入壓縮串流一次
+WRITE_EVERY_ROWS = 500
+# Excel 一張工作表的列數上限（含標題列）
+MAX_ROWS = 1048576
+
+_EPOCH = datetime(1899, 12, 30)
+# XML 1.0 不允許的控制字元，寫入前移除
+_ILLEGAL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_CONTENT_TYPES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>'''
+
+_ROOT_RELS = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>'''
+
+# 樣式 1 為日期時間、2 為日期，與 openpyxl 寫入的格式相同
+_STYLES = '''<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="2"><numFmt numFmtId="164" formatCode="yyyy-mm-dd h:mm:ss"/><numFmt numFmtId="165" formatCode="yyyy-mm-dd"/></numFmts>
+<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="3"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/><xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>
+<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>
+</styleSheet>'''
+
+_SHEET_START = ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _text(value):
+    return escape(_ILLEGAL_CHARACTERS.sub('', value))
+
+def _cell(reference, value):
+    """一個儲存格的XML，空值回傳空字串"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and not math.isfinite(value):
+            return ''
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    if isinstance(value, datetime):
+        serial = (value.replace(tzinfo=None) - _EPOCH).total_seconds() / 86400
+        return f'<c r="{reference}" s="1"><v>{serial!r}</v></c>'
+    if isinstance(value, date):
+        return f'<c r="{reference}" s="2"><v>{(value - _EPOCH.date()).days}</v></c>'
+    return f'<c r="{reference}" t="inlineStr"><is><t xml:space="preserve">{_text(str(value))}</t></is></c>'
+
+def _write_sheet(part, headers, rows):
+    letters = [get_column_letter(number) for number in range(1, len(headers) + 1)]
+    pending = [_SHEET_START]
+    for number, row in enumerate(_with_header(headers, rows), 1):
+        cells = ''.join(_cell(f'{letter}{number}', value) for letter, value in zip(letters, row))
+        pending.append(f'<row r="{number}">{cells}</row>')
+        if len(pending) >= WRITE_EVERY_ROWS:
+            part.write(''.join(pending).encode('utf-8'))
+            pending = []
+    pending.append(_SHEET_END)
+    part.write(''.join(pending).encode('utf-8'))
+
+def _with_header(headers, rows):
+    yield headers
+    yield from rows
+
+def _workbook(sheet_names):
+    sheets = ''.join(f'<sheet name={quoteattr(name)} sheetId="{number}" r:id="rId{number}"/>'
+                     for number, name in enumerate(sheet_names, 1))
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets>{sheets}</sheets></workbook>')
+
+def _workbook_rels(count):
+    relationships = ''.join(
+        f'<Relationship Id="rId{number}" Target="worksheets/sheet{number}.xml" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>'
+        for number in range(1, count + 1))
+    styles = (f'<Relationship Id="rId{count + 1}" Target="styles.xml" '
+              'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/>')
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            f'{relationships}{styles}</Relationships>')
+
+def write_xlsx(output, tables):
+    """逐列產生工作表XML並壓縮寫入，不在記憶體或暫存檔中保留整張表
+
+    工作表名稱要到讀完所有表才知道，活頁簿的目錄（workbook.xml）最後寫入；
+    內容類型以副檔名預設為工作表，因此可以先寫出。
+
+    一張表超過 MAX_ROWS 列（含標題列）時，其餘的列接續寫入 名稱_2、名稱_3…… 工作表。
+
+    Args:
+        output: 檔案路徑或可寫入的檔案物件（如HttpResponse或串流佇列）
+        tables: export_tables() 產生的 (工作表名稱, 欄位名稱, 資料列) 序列
+    """
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        archive.writestr('_rels/.rels', _ROOT_RELS)
+        archive.writestr('xl/styles.xml', _STYLES)
+        sheet_names = []
+        for sheet_name, headers, rows in tables:
+            rows = iter(rows)
+            part_number = 1
+            while True:
+                sheet_names.append(sheet_name if part_number == 1 else f'{sheet_name}_{part_number}')
+                # 數百萬列的工作表XML會超過2 GiB，須以ZIP64寫入，否則關閉時失敗
+                with archive.open(f'xl/worksheets/sheet{len(sheet_names)}.xml', 'w', force_zip64=True) as part:
+                    _write_sheet(part, headers, islice(rows, MAX_ROWS - 1))
+                following = next(rows, None)
+                if following is None:
+                    break
+                rows = chain([following], rows)
+                part_number += 1
+        if not sheet_names:
+            # 活頁簿至少要有一張工作表
+            sheet_names.append('Sheet')
+            archive.writestr('xl/worksheets/sheet1.xml', _SHEET_START + _SHEET_END)
+        archive.writestr('xl/workbook.xml', _workbook(sheet_names))
+        archive.writestr('xl/_rels/workbook.xml.rels', _workbook_rels(len(sheet_names)))
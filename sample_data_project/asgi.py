@@ -3,6 +3,10 @@ ASGI config for sample_data_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+When served through this application, the admin Excel export streams its
+response with an asynchronous iterator (see ``data_manager.streaming``),
+so large exports are sent chunk by chunk without being buffered in memory.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -120,6 +121,34 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded import files and generated export files of background jobs
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Report results are cached in 'data' keyed on per-table data versions (see data_manager/cache.py);
+# the file-based backend is shared by the web server and management commands.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'data': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'data',
+        'TIMEOUT': 24 * 3600,
+    },
+}
+DATA_CACHE = 'data'
+# Cached export files are kept in DATA_CACHE_DIR / 'exports'
+DATA_CACHE_DIR = BASE_DIR / 'cache'
+
+# Ingestion API (data_manager/views.py): bearer tokens accepted by the upload endpoints,
+# comma separated in the DATA_API_TOKENS environment variable, and the size limit of one upload
+DATA_API_TOKENS = [token for token in os.environ.get('DATA_API_TOKENS', '').split(',') if token]
+DATA_API_MAX_UPLOAD_SIZE = 10 * 1024 ** 3
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 